@@ -0,0 +1,345 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+import multiprocessing
+from array import array
+from urllib.parse import urlsplit, parse_qs, unquote
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from cuesheet.render_jobs import plan_fingerprint
+from cuesheet.template_cache import template_digest
+from cuesheet.metrics import span, REGISTRY, Trace
+import batch_cli as batch
+
+# =========================================================
+# 本機 HTTP API (無 Streamlit)
+# 給 CRM / 業務報表等內部工具呼叫：計算、HTML 預覽、Excel (套已註冊樣板或串流)、PDF。
+# 只用 asyncio + 標準函式庫；事件迴圈只負責收發與檢查參數，計算 / 渲染丟給 process pool (worker 與 batch_cli 相同)。
+# 同時有多個內容相同的請求 (同價格表版本 + 同參數 + 同樣板) 只算一次，結果分給每個等待者；
+# 排隊中的工作超過上限直接回 503 (Retry-After)，不無限堆積。收下請求的當下就算進排隊數；
+# 逾時回 504 後 worker 可能還在算，這份工作照樣算著，直到 worker 真的做完 (或還沒開始就被取消) 才扣掉。
+# 價格表在主程序載入一次交給各 worker；POST /pricing/reload 換新版時整個 pool 一起換，
+# 每個請求從頭到尾用同一版 (進行中的在舊 pool 做完)。
+#
+#   python api_server.py --pricing-dir pricing/ --template-dongwu dongwu.xlsx --port 8600
+#
+#   POST /plan      工作欄位同 batch_cli (client / product / budget / start / end / format / media ...) → JSON
+#   POST /preview   同上 → HTML
+#   POST /excel     同上 + template (已註冊的樣板名稱，預設同 format) / excel_mode (template / stream) → xlsx
+#   POST /pdf       同上 + pdf_engine (native / soffice) → pdf
+#   PUT  /templates/<名稱>?format=Dongwu   body 為 xlsx，註冊 (或更新) 樣板
+#   GET  /templates、/health、/stats、/metrics；POST /pricing/reload
+# =========================================================
+API_WORKERS = int(os.environ.get("CUE_API_WORKERS", str(os.cpu_count() or 1)))
+API_MAX_PENDING = int(os.environ.get("CUE_API_MAX_PENDING", "64"))
+API_TIMEOUT = int(os.environ.get("CUE_API_TIMEOUT", "120"))
+API_MAX_BODY = int(os.environ.get("CUE_API_MAX_BODY_MB", "16")) * 1024 * 1024
+PDF_ENGINE = os.environ.get("CUE_PDF_ENGINE", "native")
+
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+               422: "Unprocessable Entity", 500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+class ApiError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+# ---------- worker (在 process pool 裡執行) ----------
+def _json_default(o):
+    if isinstance(o, array): return list(o)
+    return str(o)
+
+def _plan(p, tpl, opts):
+    rows, total_list, p_str = batch.calc_job(p, batch._W["pricing"])
+    body = {"pricing_version": batch._W["pricing"].version, "product": p_str, "days": p["days"], "total_list": total_list,
+            "total_spots": sum(r["spots"] for r in rows), "rows": rows}
+    return json.dumps(body, ensure_ascii=False, default=_json_default).encode("utf-8"), "application/json", {}
+
+def _preview(p, tpl, opts):
+    rows, total_list, p_str = batch.calc_job(p, batch._W["pricing"])
+    html = batch.web_preview(rows, p["days"], p["start"], p["end"], p["client"], p_str, p["format"], p["remarks"], total_list, p["budget"])
+    return html.encode("utf-8"), "text/html; charset=utf-8", {}
+
+def _xlsx(p, tpl, rows, total_list, p_str):
+    if tpl is None:
+        from cuesheet.excel_stream import generate_excel_stream
+        xlsx, err = generate_excel_stream(p["format"], p["start"], p["end"], p["client"], p_str, rows, p["remarks"], total_list)
+    else:
+        from cuesheet.excel_render import generate_excel_from_template
+        xlsx, err = generate_excel_from_template(p["format"], p["start"], p["end"], p["client"], p_str, rows, p["remarks"], tpl, total_list, batch._W["templates"])
+    if not xlsx: raise RuntimeError(f"無法生成 Excel: {err}")
+    return xlsx
+
+def _excel(p, tpl, opts):
+    rows, total_list, p_str = batch.calc_job(p, batch._W["pricing"])
+    return _xlsx(p, tpl, rows, total_list, p_str), XLSX_TYPE, {}
+
+def _pdf(p, tpl, opts):
+    rows, total_list, p_str = batch.calc_job(p, batch._W["pricing"])
+    pdf, method, errors = None, None, []
+    if opts["pdf_engine"] == "native":
+        from cuesheet.pdf_render import render_pdf
+        pdf, err = render_pdf(p["format"], p["start"], p["end"], p["client"], p_str, rows, p["remarks"], total_list, batch._fonts())
+        method = "native"
+        if not pdf: errors.append(err)
+    if not pdf:
+        pdf, method, err = batch._soffice().convert(_xlsx(p, tpl, rows, total_list, p_str))
+        if not pdf: errors.append(err)
+    if not pdf:
+        pdf, err = batch._web_pdf(rows, p["days"], p["start"], p["end"], p["client"], p_str, p["format"], p["remarks"], total_list, p["budget"])
+        method = "WeasyPrint"
+        if not pdf: errors.append(err)
+    if not pdf: raise RuntimeError(f"PDF 產出失敗 ({' / '.join(str(e) for e in errors)})")
+    return pdf, "application/pdf", {"X-Pdf-Method": method}
+
+_KINDS = {"plan": _plan, "preview": _preview, "excel": _excel, "pdf": _pdf}
+
+def _work(kind, p, tpl, opts):
+    # 回傳 (內容, content-type, 額外 header, worker 內的 span)；span 交給主程序記進 /metrics
+    trace = Trace().activate()
+    body, ctype, headers = _KINDS[kind](p, tpl, opts)
+    return body, ctype, headers, [(sp["span"], sp["ms"], sp["status"]) for sp in trace.spans]
+
+# ---------- 服務 (事件迴圈內，不需要鎖) ----------
+class ApiService:
+    def __init__(self, pricing, workers=API_WORKERS, pricing_dir=None, max_pending=API_MAX_PENDING, timeout=API_TIMEOUT, pdf_timeout=60):
+        self.pricing = pricing
+        self.pricing_dir = pricing_dir
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pdf_timeout = pdf_timeout
+        self.templates = {}   # 名稱 → {"format", "bytes", "digest"}
+        self.inflight = {}    # 指紋 → 進行中的 task (相同請求共用)
+        self.pending = 0
+        self.counts = {"requests": 0, "coalesced": 0, "rejected": 0, "failed": 0, "pool_restarts": 0}
+        self._reload_lock = asyncio.Lock()
+        self.pool = self._new_pool(pricing)
+
+    def _new_pool(self, pricing):
+        # worker 第一次 submit 才啟動，那時已有連線開著；用 fork 的話 worker 會繼承 listen socket 與客戶端 socket，
+        # 主程序 close 後對方收不到 FIN (讀到 EOF 的客戶端會卡住)。forkserver 從乾淨的 process 分出 worker
+        opts = {"pdf_timeout": self.pdf_timeout}
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"),
+                                   initializer=batch._init_worker, initargs=(pricing, opts))
+
+    def register_template(self, name, format_type, data):
+        from cuesheet.sheet_meta import SHEET_META
+        if format_type not in SHEET_META: raise ApiError(400, f"未知的格式: {format_type}")
+        if not data.startswith(b"PK"): raise ApiError(400, "樣板不是 xlsx 檔")
+        self.templates[name] = {"format": format_type, "bytes": data, "digest": template_digest(data)}
+        return {"name": name, "format": format_type, "digest": self.templates[name]["digest"], "bytes": len(data)}
+
+    def _template(self, req, p, required):
+        name = req.get("template") or p["format"]
+        tpl = self.templates.get(name)
+        if tpl is None:
+            if required: raise ApiError(400, f"樣板未註冊: {name}")
+            return None
+        if tpl["format"] != p["format"]: raise ApiError(400, f"樣板 {name} 是 {tpl['format']} 格式，與 {p['format']} 不符")
+        return tpl["bytes"]
+
+    async def render(self, kind, req):
+        try: p = batch.parse_job(req)
+        except (ValueError, KeyError, TypeError) as e: raise ApiError(400, f"參數錯誤: {type(e).__name__}: {e}") from None
+        tpl, opts = None, {}
+        if kind == "excel":
+            mode = req.get("excel_mode") or "template"
+            if mode not in ("template", "stream"): raise ApiError(400, f"未知的 Excel 模式: {mode}")
+            if mode == "template": tpl = self._template(req, p, required=True)
+        elif kind == "pdf":
+            opts["pdf_engine"] = req.get("pdf_engine") or PDF_ENGINE
+            if opts["pdf_engine"] not in ("native", "soffice"): raise ApiError(400, f"未知的 PDF 引擎: {opts['pdf_engine']}")
+            tpl = self._template(req, p, required=False)  # LibreOffice 路徑用；沒有註冊就用串流 Excel
+
+        # 同一個請求從頭到尾用同一版價格表與同一個 pool
+        pricing, pool = self.pricing, self.pool
+        key = plan_fingerprint(kind, pricing.version or id(pricing), p, tpl, opts)
+        task = self.inflight.get(key)
+        if task is not None:
+            self.counts["coalesced"] += 1
+        else:
+            if self.pending >= self.max_pending:
+                self.counts["rejected"] += 1
+                raise ApiError(503, f"排隊中的工作已滿 ({self.pending})，請稍後再試", {"Retry-After": "1"})
+            # 收下就算：同一輪事件迴圈湧進來的請求才不會全部通過上面的檢查
+            self.pending += 1
+            task = self.inflight[key] = asyncio.ensure_future(self._execute(pool, kind, p, tpl, opts))
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # shield：某個等待者斷線不會取消其他人共用的工作
+        return await asyncio.shield(task)
+
+    def _track(self, loop, fut):
+        # pending 跟著 executor 的 future 走，不跟著等待的人：逾時放棄等待時 worker 還在算，要等它結束才扣
+        def done(_):
+            try: loop.call_soon_threadsafe(self._release)
+            except RuntimeError: pass  # 事件迴圈已關閉
+        fut.add_done_callback(done)
+        return fut
+
+    def _release(self):
+        self.pending -= 1
+
+    async def _execute(self, pool, kind, p, tpl, opts):
+        # render() 收下時已經 pending += 1；送進 pool 後由 future 結束時扣，送不進去 (含 submit 本身丟 BrokenProcessPool) 就在這裡扣
+        loop, fut = asyncio.get_running_loop(), None
+        try:
+            with span(f"api.{kind}"):
+                try:
+                    fut = self._track(loop, pool.submit(_work, kind, p, tpl, opts))
+                    body, ctype, headers, spans = await asyncio.wait_for(asyncio.wrap_future(fut), self.timeout)
+                except ValueError as e:
+                    # 預算不足等計算上的問題
+                    raise ApiError(422, str(e)) from None
+                except asyncio.TimeoutError:
+                    raise ApiError(504, f"處理逾時 ({self.timeout}s)") from None
+                except BrokenProcessPool:
+                    self._restart_pool(pool)
+                    raise ApiError(500, "worker 異常結束，請重試") from None
+            for name, ms, status in spans: REGISTRY.observe(name, ms / 1000, status)
+            return body, ctype, headers
+        except Exception:
+            self.counts["failed"] += 1
+            raise
+        finally:
+            if fut is None: self._release()
+
+    def _restart_pool(self, pool):
+        if self.pool is not pool: return
+        self.counts["pool_restarts"] += 1
+        self.pool = self._new_pool(self.pricing)
+        pool.shutdown(wait=False)
+
+    async def reload_pricing(self):
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            pricing = await loop.run_in_executor(None, batch.load_pricing, self.pricing_dir)
+            old = self.pool
+            self.pricing, self.pool = pricing, self._new_pool(pricing)
+            old.shutdown(wait=False)  # 舊 pool 上進行中的工作照樣做完
+            return {"pricing_version": pricing.version}
+
+    def stats(self):
+        return {"pricing_version": self.pricing.version, "workers": self.workers, "pending": self.pending, "max_pending": self.max_pending,
+                "inflight": len(self.inflight), **self.counts, "templates": sorted(self.templates)}
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    # ---------- 路由 ----------
+    async def route(self, method, path, query, body):
+        parts = [unquote(x) for x in path.strip("/").split("/") if x]
+        if method == "POST" and len(parts) == 1 and parts[0] in _KINDS:
+            try: req = json.loads(body or b"{}")
+            except ValueError as e: raise ApiError(400, f"JSON 格式錯誤: {e}") from None
+            if not isinstance(req, dict): raise ApiError(400, "請求內容必須是 JSON 物件")
+            return await self.render(parts[0], req)
+        if method == "GET" and parts == ["health"]: return _json({"status": "ok", "pricing_version": self.pricing.version})
+        if method == "GET" and parts == ["stats"]: return _json(self.stats())
+        if method == "GET" and parts == ["metrics"]: return REGISTRY.prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8", {}
+        if parts[:1] == ["templates"]:
+            if method == "GET" and len(parts) == 1:
+                return _json({k: {"format": v["format"], "digest": v["digest"], "bytes": len(v["bytes"])} for k, v in self.templates.items()})
+            if method == "PUT" and len(parts) == 2:
+                fmt = (query.get("format") or [parts[1]])[0]
+                return _json(self.register_template(parts[1], fmt, body))
+        if method == "POST" and parts == ["pricing", "reload"]:
+            try: return _json(await self.reload_pricing())
+            except Exception as e: raise ApiError(500, f"價格表載入失敗: {e}") from None
+        raise ApiError(404 if method in ("GET", "POST", "PUT") else 405, f"{method} {path} 不存在")
+
+def _json(obj):
+    return json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8"), "application/json", {}
+
+# ---------- HTTP/1.1 (keep-alive) ----------
+async def _read_request(reader):
+    line = await reader.readline()
+    if not line: return None
+    try: method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError: raise ApiError(400, "請求列格式錯誤") from None
+    headers = {}
+    while True:
+        h = await reader.readline()
+        if h in (b"\r\n", b"\n", b""): break
+        k, _, v = h.decode("latin-1").partition(":")
+        headers[k.strip().lower()] = v.strip()
+    n = int(headers.get("content-length") or 0)
+    if n > API_MAX_BODY: raise ApiError(413, f"請求內容超過 {API_MAX_BODY // 1024 // 1024} MB")
+    body = await reader.readexactly(n) if n else b""
+    url = urlsplit(target)
+    return method.upper(), url.path, parse_qs(url.query), headers, body
+
+async def _respond(writer, status, body, ctype, headers, keep_alive):
+    head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", f"Content-Type: {ctype}", f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"] + [f"{k}: {v}" for k, v in headers.items()]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+async def handle_client(service, reader, writer):
+    try:
+        while True:
+            keep_alive = False
+            try:
+                req = await _read_request(reader)
+                if req is None: break
+                method, path, query, headers, body = req
+                keep_alive = headers.get("connection", "").lower() != "close"
+                service.counts["requests"] += 1
+                status, (data, ctype, extra) = 200, await service.route(method, path, query, body)
+            except ApiError as e:
+                status, (data, ctype, extra) = e.status, _json({"error": str(e)})
+                extra = e.headers
+            except (ConnectionError, asyncio.IncompleteReadError):
+                break
+            except Exception as e:
+                status, (data, ctype, extra) = 500, _json({"error": f"{type(e).__name__}: {e}"})
+            await _respond(writer, status, data, ctype, extra, keep_alive)
+            if not keep_alive: break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(service, host="127.0.0.1", port=8600, ready=None):
+    server = await asyncio.start_server(lambda r, w: handle_client(service, r, w), host, port)
+    if ready: ready(server)
+    try:
+        async with server: await server.serve_forever()
+    finally:
+        service.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Cue 表 HTTP API (計算 / 預覽 / Excel / PDF)")
+    ap.add_argument("--host", default=os.environ.get("CUE_API_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.environ.get("CUE_API_PORT", "8600")))
+    ap.add_argument("--pricing-dir", help="本機價格表目錄；未指定則讀雲端 (失敗時用本機快照)")
+    ap.add_argument("--template-dongwu", default=os.environ.get("CUE_TEMPLATE_DONGWU"), help="啟動時註冊為 Dongwu 的樣板")
+    ap.add_argument("--template-shenghuo", default=os.environ.get("CUE_TEMPLATE_SHENGHUO"), help="啟動時註冊為 Shenghuo 的樣板")
+    ap.add_argument("--workers", type=int, default=API_WORKERS, help="計算 / 渲染 process 數")
+    ap.add_argument("--max-pending", type=int, default=API_MAX_PENDING, help="排隊上限 (超過回 503)")
+    ap.add_argument("--timeout", type=int, default=API_TIMEOUT, help="單一請求處理上限 (秒)")
+    ap.add_argument("--pdf-timeout", type=int, default=int(os.environ.get("CUE_SOFFICE_TIMEOUT", "60")))
+    args = ap.parse_args(argv)
+
+    pricing = batch.load_pricing(args.pricing_dir)
+
+    async def run():
+        service = ApiService(pricing, args.workers, args.pricing_dir, args.max_pending, args.timeout, args.pdf_timeout)
+        for fmt, path in (("Dongwu", args.template_dongwu), ("Shenghuo", args.template_shenghuo)):
+            if path:
+                with open(path, "rb") as f: service.register_template(fmt, fmt, f.read())
+        def ready(server):
+            addr = server.sockets[0].getsockname()
+            print(f"價格表 {pricing.version}，{service.workers} workers，樣板 {sorted(service.templates) or '無'} → http://{addr[0]}:{addr[1]}", file=sys.stderr, flush=True)
+        await serve(service, args.host, args.port, ready)
+
+    try: asyncio.run(run())
+    except KeyboardInterrupt: pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
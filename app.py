@@ -1,722 +1,333 @@
 import streamlit as st
-import pandas as pd
-import math
-import io
 import os
+import json
+import atexit
+import hashlib
 import shutil
 import tempfile
-import subprocess
-import re
-import requests
-import base64
-from datetime import timedelta, datetime, date
-from copy import copy
-import openpyxl
-from openpyxl.utils import column_index_from_string
-from openpyxl.cell.cell import MergedCell
-from openpyxl.styles import Alignment, Font, Border, Side
-from openpyxl.formula.translate import Translator
+import uuid
+from datetime import timedelta, datetime
+from cuesheet.soffice_pool import SofficePool
+from cuesheet.render_jobs import RenderJob, RenderJobQueue, plan_fingerprint
+from cuesheet.artifact_cache import ArtifactCache
+from cuesheet.config_loader import ConfigStore, GSHEET_CSV_URL, GSHEET_SHARE_URL
+from cuesheet.pricing import PricingIndex, REGIONS_ORDER, DURATIONS
+from cuesheet.scenarios import format_debug_log
+from cuesheet.optimizer import optimize_budget, OBJECTIVES, MEDIA_ORDER
+from cuesheet.font_assets import FontAssets
+from cuesheet.planner import safe_filename, get_remarks_text, calculate_plan_data
+from cuesheet.html_preview import preview_body, preview_page, html_to_pdf_weasyprint
+from cuesheet.memo import Memo, calc_fingerprint
+from cuesheet.paging import MAX_DAYS
+from cuesheet.sheet_meta import SHEET_META
+from cuesheet.metrics import span, collect, Trace, Profile, configure_json_log, start_metrics_server, REGISTRY
 
 # =========================================================
-# 0. 基礎工具
+# 1. 頁面設定
 # =========================================================
-def parse_count_to_int(x):
-    if x is None: return 0
-    if isinstance(x, (int, float)): return int(x)
-    s = str(x)
-    m = re.findall(r"[\d,]+", s)
-    if not m: return 0
-    return int(m[0].replace(",", ""))
+st.set_page_config(layout="wide", page_title="Cue Sheet Pro v76.3")
 
-def safe_filename(name: str) -> str:
-    return re.sub(r'[\\/*?:"<>|]', "_", name).strip()
+# 效能計時：這次 rerun 的 span 都收進 RERUN_TRACE；整個 process 的統計另由 /metrics 提供 (CUE_METRICS_PORT)
+METRICS_PORT = int(os.environ.get("CUE_METRICS_PORT", "0"))
+METRICS_LOG = os.environ.get("CUE_METRICS_LOG") or None
+TIMING_PANEL = os.environ.get("CUE_TIMING_PANEL", "0") == "1" or st.query_params.get("timing") == "1"
 
-def html_escape(s):
-    if s is None: return ""
-    return str(s).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;").replace("'", "&#39;")
+@st.cache_resource
+def init_metrics():
+    configure_json_log(METRICS_LOG)
+    return start_metrics_server(METRICS_PORT) if METRICS_PORT else None
 
-# =========================================================
-# 1. 頁面設定
-# =========================================================
-st.set_page_config(layout="wide", page_title="Cue Sheet Pro v76.3")
+init_metrics()
+RERUN_TRACE = Trace().activate()
+
+# 選用：在計時面板選了 profiler 時，量整次 rerun (上一次沒收掉的先停掉)
+PROFILE = None
+if st.session_state.get("_prof"): st.session_state._prof.stop()
+st.session_state._prof = None
+if TIMING_PANEL and st.session_state.get("prof_mode", "off") != "off":
+    PROFILE = st.session_state._prof = Profile(st.session_state.prof_mode).__enter__()
 
 # =========================================================
 # 2. PDF 策略
 # =========================================================
-def find_soffice_path():
-    soffice = shutil.which("soffice") or shutil.which("libreoffice")
-    if soffice: return soffice
-    if os.name == "nt":
-        candidates = [
-            r"C:\Program Files\LibreOffice\program\soffice.exe",
-            r"C:\Program Files (x86)\LibreOffice\program\soffice.exe",
-        ]
-        for p in candidates:
-            if os.path.exists(p): return p
-    return None
+SOFFICE_POOL_SIZE = int(os.environ.get("CUE_SOFFICE_POOL_SIZE", "2"))
+SOFFICE_JOB_TIMEOUT = int(os.environ.get("CUE_SOFFICE_TIMEOUT", "60"))
+# native: 直接從 rows 排版 (不經 Excel / LibreOffice，失敗才退回 soffice)；soffice: 一律由 Excel 轉檔
+PDF_ENGINE = os.environ.get("CUE_PDF_ENGINE", "native")
+
+@st.cache_resource
+def get_soffice_pool():
+    # 常駐 LibreOffice worker，所有 session 共用；只在 process 結束時關閉
+    pool = SofficePool(size=SOFFICE_POOL_SIZE, job_timeout=SOFFICE_JOB_TIMEOUT)
+    atexit.register(pool.close)
+    return pool
 
 def xlsx_bytes_to_pdf_bytes(xlsx_bytes: bytes):
-    soffice = find_soffice_path()
-    if not soffice: 
-        return None, "Fail", "無可用的 LibreOffice 引擎"
-
-    try:
-        with tempfile.TemporaryDirectory() as tmp:
-            xlsx_path = os.path.join(tmp, "cue.xlsx")
-            with open(xlsx_path, "wb") as f: f.write(xlsx_bytes)
-            
-            subprocess.run([soffice, "--headless", "--nologo", "--convert-to", "pdf", "--outdir", tmp, xlsx_path], capture_output=True, timeout=60)
-            
-            pdf_path = os.path.join(tmp, "cue.pdf")
-            if not os.path.exists(pdf_path):
-                for fn in os.listdir(tmp):
-                    if fn.endswith(".pdf"): pdf_path = os.path.join(tmp, fn); break
-            
-            if os.path.exists(pdf_path):
-                with open(pdf_path, "rb") as f: return f.read(), "LibreOffice", ""
-            return None, "Fail", "LibreOffice 轉檔無輸出"
-    except Exception as e: return None, "Fail", str(e)
-
-def html_to_pdf_weasyprint(html_str):
-    try:
-        from weasyprint import HTML, CSS
-        from weasyprint.text.fonts import FontConfiguration
-        font_config = FontConfiguration()
-        css = CSS(string="@page { size: A4 landscape; margin: 1cm; } body { font-family: sans-serif; }")
-        pdf_bytes = HTML(string=html_str).write_pdf(stylesheets=[css], font_config=font_config)
-        return pdf_bytes, ""
-    except Exception as e: return None, str(e)
+    return get_soffice_pool().convert(xlsx_bytes)
 
 # =========================================================
 # 3. 核心資料設定 (雲端 Google Sheet 版)
 # =========================================================
-GSHEET_SHARE_URL = "https://docs.google.com/spreadsheets/d/1bzmG-N8XFsj8m3LUPqA8K70AcIqaK4Qhq1VPWcK0w_s/edit?usp=sharing"
+SHEET_URL_TEMPLATE = os.environ.get("CUE_SHEET_URL_TEMPLATE", GSHEET_CSV_URL)
+CONFIG_SNAPSHOT_DIR = os.environ.get("CUE_SNAPSHOT_DIR", ".cue_snapshots")
+
+@st.cache_resource
+def get_config_store(share_url):
+    # 有本機快照就秒開，背景再更新；沒有快照才同步連線抓取
+    store = ConfigStore(share_url, CONFIG_SNAPSHOT_DIR, url_template=SHEET_URL_TEMPLATE, ttl=300, validate=PricingIndex.from_frames)
+    store.load()
+    return store
+
+@st.cache_resource
+def build_config(version, _frames):
+    with span("config.build"): return PricingIndex.from_frames(_frames, version)
 
-@st.cache_data(ttl=300)
 def load_config_from_cloud(share_url):
-    try:
-        match = re.search(r"/d/([a-zA-Z0-9-_]+)", share_url)
-        if not match: return None, None, None, None, "連結格式錯誤"
-        file_id = match.group(1)
-        
-        def read_sheet(sheet_name):
-            url = f"https://docs.google.com/spreadsheets/d/{file_id}/gviz/tq?tqx=out:csv&sheet={sheet_name}"
-            return pd.read_csv(url)
-
-        # 1. Stores
-        df_store = read_sheet("Stores")
-        df_store.columns = [c.strip() for c in df_store.columns]
-        store_counts = dict(zip(df_store['Key'], df_store['Display_Name']))
-        store_counts_num = dict(zip(df_store['Key'], df_store['Count']))
-
-        # 2. Factors
-        df_fact = read_sheet("Factors")
-        df_fact.columns = [c.strip() for c in df_fact.columns]
-        sec_factors = {}
-        for _, row in df_fact.iterrows():
-            if row['Media'] not in sec_factors: sec_factors[row['Media']] = {}
-            sec_factors[row['Media']][int(row['Seconds'])] = float(row['Factor'])
-
-        # 3. Pricing
-        df_price = read_sheet("Pricing")
-        df_price.columns = [c.strip() for c in df_price.columns]
-        pricing_db = {}
-        for _, row in df_price.iterrows():
-            m = row['Media']
-            r = row['Region']
-            if m == "家樂福":
-                if m not in pricing_db: pricing_db[m] = {}
-                pricing_db[m][r] = {
-                    "List": int(row['List_Price']),
-                    "Net": int(row['Net_Price']),
-                    "Std_Spots": int(row['Std_Spots']),
-                    "Day_Part": row['Day_Part']
-                }
-            else:
-                if m not in pricing_db:
-                    pricing_db[m] = {"Std_Spots": int(row['Std_Spots']), "Day_Part": row['Day_Part']}
-                pricing_db[m][r] = [int(row['List_Price']), int(row['Net_Price'])]
-            
-        return store_counts, store_counts_num, pricing_db, sec_factors, None
-
-    except Exception as e:
-        return None, None, None, None, f"讀取失敗: {str(e)}"
+    with span("config.load") as sp:
+        store = get_config_store(share_url)
+        store.maybe_refresh()
+        frames, version, err = store.current()
+        if frames is None:
+            sp["status"] = "fail"
+            return None, err or "讀取失敗"
+        try:
+            return build_config(version, frames), None
+        except Exception as e:
+            sp["status"] = "fail"
+            return None, f"讀取失敗: {str(e)}"
 
 with st.spinner("正在連線 Google Sheet 載入最新價格表..."):
-    STORE_COUNTS, STORE_COUNTS_NUM, PRICING_DB, SEC_FACTORS, err_msg = load_config_from_cloud(GSHEET_SHARE_URL)
+    PRICING, err_msg = load_config_from_cloud(GSHEET_SHARE_URL)
 
 if err_msg:
     st.error(f"❌ 設定檔載入失敗: {err_msg}")
     st.stop()
 
-REGIONS_ORDER = ["北區", "桃竹苗", "中區", "雲嘉南", "高屏", "東區"]
-DURATIONS = [5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60]
-
-REGION_DISPLAY_MAP = {
-    "北區": "北區-北北基", "桃竹苗": "桃區-桃竹苗", "中區": "中區-中彰投",
-    "雲嘉南": "雲嘉南區-雲嘉南", "高屏": "高屏區-高屏", "東區": "東區-宜花東",
-    "全省量販": "全省量販", "全省超市": "全省超市"
-}
-def region_display(region): return REGION_DISPLAY_MAP.get(region, region)
-
-def get_sec_factor(media_type, seconds): return SEC_FACTORS.get(media_type, {}).get(seconds, 1.0)
-
-def calculate_schedule(total_spots, days):
-    if days <= 0: return []
-    if total_spots % 2 != 0: total_spots += 1
-    half_spots = total_spots // 2
-    base, rem = divmod(half_spots, days)
-    sch = [base + (1 if i < rem else 0) for i in range(days)]
-    return [x * 2 for x in sch]
-
-def get_remarks_text(sign_deadline, billing_month, payment_date):
-    d_str = sign_deadline.strftime("%Y/%m/%d (%a) %H:%M") if sign_deadline else "____/__/__ (__) 12:00"
-    p_str = payment_date.strftime("%Y/%m/%d") if payment_date else "____/__/__"
-    return [
-        f"1.請於 {d_str}前 回簽及進單，方可順利上檔。",
-        "2.以上節目名稱如有異動，以上檔時節目名稱為主，如遇時段滿檔，上檔時間挪後或更換至同級時段。",
-        "3.通路店鋪數與開機率至少七成(以上)。每日因加盟數調整，或遇店舖年度季度改裝、設備維護升級及保修等狀況，會有一定幅度增減。",
-        "4.託播方需於上檔前 5 個工作天，提供廣告帶(mp3)、影片/影像 1920x1080 (mp4)。",
-        f"5.雙方同意費用請款月份 : {billing_month}，如有修正必要，將另行E-Mail告知，並視為正式合約之一部分。",
-        f"6.付款兌現日期：{p_str}"
-    ]
-
 # =========================================================
-# 4. 核心計算函式 (Logic v4.5)
+# 4. 核心計算函式 (cuesheet/planner.py)
+# 5. OpenPyXL 渲染引擎 (cuesheet/excel_render.py，第一次產 Excel 才載入)
 # =========================================================
-def calculate_plan_data(config, total_budget, days_count):
-    rows = []
-    total_list_accum = 0
-    debug_logs = []
-
-    for m, cfg in config.items():
-        m_budget_total = total_budget * (cfg["share"] / 100.0)
-        
-        for sec, sec_pct in cfg["sec_shares"].items():
-            s_budget = m_budget_total * (sec_pct / 100.0)
-            if s_budget <= 0: continue
-            
-            factor = get_sec_factor(m, sec)
-            
-            if m in ["全家廣播", "新鮮視"]:
-                db = PRICING_DB[m]
-                calc_regs = ["全省"] if cfg["is_national"] else cfg["regions"]
-                display_regs = REGIONS_ORDER if cfg["is_national"] else cfg["regions"]
-                
-                unit_net_sum = 0
-                for r in calc_regs:
-                    unit_net_sum += (db[r][1] / db["Std_Spots"]) * factor
-                if unit_net_sum == 0: continue
-                
-                spots_init = math.ceil(s_budget / unit_net_sum)
-                is_under_target = spots_init < db["Std_Spots"]
-                calc_penalty = 1.1 if is_under_target else 1.0 
-                
-                if cfg["is_national"]:
-                    row_display_penalty = 1.0 
-                    total_display_penalty = 1.1 if is_under_target else 1.0
-                    status_msg = "全省(分區豁免/總價懲罰)" if is_under_target else "達標"
-                else:
-                    row_display_penalty = 1.1 if is_under_target else 1.0
-                    total_display_penalty = 1.0 
-                    status_msg = "未達標 x1.1" if is_under_target else "達標"
-
-                spots_final = math.ceil(s_budget / (unit_net_sum * calc_penalty))
-                if spots_final % 2 != 0: spots_final += 1
-                if spots_final == 0: spots_final = 2
-                
-                debug_logs.append({
-                    "Media": f"{m} ({sec}s)",
-                    "Budget": f"${s_budget:,.0f}",
-                    "Net_Unit": f"${unit_net_sum:.2f}",
-                    "Std_Spots": f"{db['Std_Spots']}",
-                    "Init_Spots": f"{spots_init}",
-                    "Penalty_Status": status_msg,
-                    "Penalty_Factor": f"x{calc_penalty}",
-                    "Final_Cost": f"${unit_net_sum * calc_penalty:.2f}",
-                    "Final_Spots": spots_final
-                })
-
-                sch = calculate_schedule(spots_final, days_count)
-
-                nat_pkg_display = 0
-                if cfg["is_national"]:
-                    nat_list = db["全省"][0]
-                    nat_unit_price = int((nat_list / db["Std_Spots"]) * factor * total_display_penalty)
-                    nat_pkg_display = nat_unit_price * spots_final
-                    total_list_accum += nat_pkg_display
-
-                for i, r in enumerate(display_regs):
-                    list_price_region = db[r][0]
-                    unit_rate_display = int((list_price_region / db["Std_Spots"]) * factor * row_display_penalty)
-                    total_rate_display = unit_rate_display * spots_final 
-                    row_pkg_display = total_rate_display
-                    if not cfg["is_national"]:
-                        total_list_accum += row_pkg_display
-
-                    rows.append({
-                        "media": m, "region": r,
-                        "program_num": STORE_COUNTS_NUM.get(f"新鮮視_{r}" if m=="新鮮視" else r, 0),
-                        "daypart": db["Day_Part"], "seconds": sec,
-                        "spots": spots_final, "schedule": sch,
-                        "rate_display": total_rate_display, 
-                        "pkg_display": row_pkg_display,
-                        "is_pkg_member": cfg["is_national"],
-                        "nat_pkg_display": nat_pkg_display
-                    })
-
-            elif m == "家樂福":
-                db = PRICING_DB["家樂福"]
-                base_std = db["量販_全省"]["Std_Spots"]
-                unit_net = (db["量販_全省"]["Net"] / base_std) * factor
-                spots_init = math.ceil(s_budget / unit_net)
-                penalty = 1.1 if spots_init < base_std else 1.0
-                status_msg = "未達標 x1.1" if penalty > 1 else "達標"
-                
-                spots_final = math.ceil(s_budget / (unit_net * penalty))
-                if spots_final % 2 != 0: spots_final += 1
-                sch_h = calculate_schedule(spots_final, days_count)
-                
-                debug_logs.append({
-                    "Media": f"家樂福 ({sec}s)",
-                    "Budget": f"${s_budget:,.0f}",
-                    "Net_Unit": f"${unit_net:.2f}",
-                    "Std_Spots": f"{base_std}",
-                    "Init_Spots": f"{spots_init}",
-                    "Penalty_Status": status_msg,
-                    "Penalty_Factor": f"x{penalty}",
-                    "Final_Cost": f"${unit_net * penalty:.2f}",
-                    "Final_Spots": spots_final
-                })
-                
-                base_list = db["量販_全省"]["List"]
-                unit_rate_h = int((base_list / base_std) * factor * penalty)
-                total_rate_h = unit_rate_h * spots_final
-                total_list_accum += total_rate_h
-                
-                rows.append({"media": m, "region": "全省量販", "program_num": STORE_COUNTS_NUM["家樂福_量販"], "daypart": db["量販_全省"]["Day_Part"], "seconds": sec, "spots": spots_final, "schedule": sch_h, "rate_display": total_rate_h, "pkg_display": total_rate_h, "is_pkg_member": False})
-                
-                spots_s = int(spots_final * (db["超市_全省"]["Std_Spots"] / base_std))
-                sch_s = calculate_schedule(spots_s, days_count)
-                rows.append({"media": m, "region": "全省超市", "program_num": STORE_COUNTS_NUM["家樂福_超市"], "daypart": db["超市_全省"]["Day_Part"], "seconds": sec, "spots": spots_s, "schedule": sch_s, "rate_display": "計量販", "pkg_display": "計量販", "is_pkg_member": False})
-
-    return rows, total_list_accum, debug_logs
+TEMPLATE_CACHE_ITEMS = int(os.environ.get("CUE_TEMPLATE_CACHE_ITEMS", "16"))
+
+@st.cache_resource
+def get_template_cache():
+    from cuesheet.template_cache import TemplateCache  # openpyxl 到第一次產 Excel 才載入
+    return TemplateCache(max_items=TEMPLATE_CACHE_ITEMS)
 
 # =========================================================
-# 5. OpenPyXL 渲染引擎 (含錯誤回報)
+# 6. HTML Preview
 # =========================================================
-SHEET_META = {
-    "Dongwu": {
-        "sheet_name": "Sheet1", 
-        "date_start_cell": "I7", "schedule_start_col": "I", "max_days": 31, "total_col": "AN",
-        "anchors": {"全家廣播": "通路廣播廣告", "新鮮視": "新鮮視廣告", "家樂福": "家樂福"},
-        "cols": {"station": "B", "location": "C", "program": "D", "daypart": "E", "seconds": "F", "rate": "G", "pkg": "H"},
-        "header_cells": {"client": "C3", "product": "C4", "period": "C5", "medium": "C6", "month": "I6"},
-        "header_override": {"G7": "rate\n(Net)", "H7": "Package-cost\n(Net)"},
-        "station_merge": True, "total_label": "Total",
-        "footer_labels": {"make": "製作", "vat": "5% VAT", "grand": "Grand Total"},
-        "force_center_cols": ["E", "F", "G", "H"], 
-    },
-    "Shenghuo": {
-        "sheet_name": "Sheet1",
-        "date_start_cell": "G7", "schedule_start_col": "G", "max_days": 23, "total_col": "AD",
-        "anchors": {"全家廣播": "廣播通路廣告", "新鮮視": "新鮮視廣告", "家樂福": "家樂福"},
-        "cols": {"station": "B", "location": "C", "program": "D", "daypart": "E", "seconds": "F", "pkg": "AF"},
-        "header_cells": {"client": "C5", "product": "C6", "month": "G6"},
-        "station_merge": False, "total_label": "Total",
-        "footer_labels": {"make": "製作", "vat": "5% VAT", "grand": "Grand Total"},
-        "force_center_cols": [],
-    }
-}
-
-def safe_write_rc(ws, row, col, value, center=False):
-    if isinstance(col, str): col = column_index_from_string(col)
-    cell = ws.cell(row, col)
-    if isinstance(cell, MergedCell):
-        for mr in ws.merged_cells.ranges:
-            if mr.min_row <= row <= mr.max_row and mr.min_col <= col <= mr.max_col:
-                cell = ws.cell(mr.min_row, mr.min_col)
-                break
-    cell.value = value
-    if center:
-        if cell.has_style:
-            new_align = copy(cell.alignment)
-            new_align.horizontal = 'center'
-            new_align.vertical = 'center'
-            new_align.wrap_text = True
-            cell.alignment = new_align
-        else:
-            cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-
-def safe_write_addr(ws, addr, value):
-    cell = ws[addr]
-    if isinstance(cell, MergedCell):
-        for mr in ws.merged_cells.ranges:
-            if cell.coordinate in mr:
-                cell = ws.cell(mr.min_row, mr.min_col)
-                break
-    cell.value = value
-
-def copy_style(source_cell, target_cell):
-    if source_cell.has_style:
-        target_cell.font = copy(source_cell.font)
-        target_cell.border = copy(source_cell.border)
-        target_cell.fill = copy(source_cell.fill)
-        target_cell.number_format = source_cell.number_format
-        target_cell.alignment = copy(source_cell.alignment)
-        target_cell.protection = copy(source_cell.protection)
-
-def find_row_by_content(ws, col_letter, keyword):
-    # 放寬搜尋：只要包含關鍵字即可
-    col_idx = column_index_from_string(col_letter)
-    for r in range(1, ws.max_row + 1):
-        v = ws.cell(r, col_idx).value
-        if isinstance(v, str) and keyword in v: return r
-    return None
-
-def copy_row_with_style_fix(ws, src_row, dst_row, max_col):
-    ws.row_dimensions[dst_row].height = ws.row_dimensions[src_row].height
-    for c in range(1, max_col + 1):
-        sc = ws.cell(src_row, c)
-        dc = ws.cell(dst_row, c)
-        copy_style(sc, dc)
-
-def unmerge_col_overlap(ws, col_letter, start_row, end_row):
-    st_col = column_index_from_string(col_letter)
-    to_unmerge = []
-    for mr in list(ws.merged_cells.ranges):
-        if mr.min_col == st_col and mr.max_col == st_col:
-            if not (mr.max_row < start_row or mr.min_row > end_row):
-                to_unmerge.append(str(mr))
-    for s in set(to_unmerge):
-        try: ws.unmerge_cells(s)
-        except: pass
-
-def set_schedule(ws, row, start_col_letter, max_days, schedule_list):
-    start_col = column_index_from_string(start_col_letter)
-    for i in range(max_days):
-        v = schedule_list[i] if (schedule_list and i < len(schedule_list)) else None
-        safe_write_rc(ws, row, start_col + i, v)
-
-def find_first_row_contains(ws, col_letter, keyword):
-    col_idx = column_index_from_string(col_letter)
-    for r in range(1, ws.max_row + 1):
-        v = ws.cell(r, col_idx).value
-        if isinstance(v, str) and keyword in v: return r
-    return None
-
-def force_center_columns_range(ws, col_letters, start_row, end_row):
-    if start_row is None or end_row is None: return
-    for r in range(start_row, end_row + 1):
-        for col in col_letters:
-            safe_col = column_index_from_string(col)
-            cell = ws.cell(r, safe_col)
-            if isinstance(cell, MergedCell):
-                master = _get_master_cell(ws, cell)
-                if master: cell = master
-                else: continue
-            if cell.has_style:
-                new_align = copy(cell.alignment)
-                new_align.horizontal = 'center'
-                new_align.vertical = 'center'
-                cell.alignment = new_align
-
-def _get_master_cell(ws, cell):
-    if not isinstance(cell, MergedCell): return cell
-    for mr in ws.merged_cells.ranges:
-        if mr.min_row <= cell.row <= mr.max_row and mr.min_col <= cell.column <= mr.max_col:
-            return ws.cell(row=mr.min_row, column=mr.min_col)
-    return None
-
-def generate_excel_from_template(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, template_bytes, total_list_accum):
-    meta = SHEET_META[format_type]
-    wb = openpyxl.load_workbook(io.BytesIO(template_bytes))
-    target_sheet = wb.sheetnames[0] 
-    ws = wb[target_sheet]
-
-    # Header
-    hc = meta["header_cells"]
-    if "client" in hc: safe_write_addr(ws, hc["client"], client_name)
-    if "product" in hc: safe_write_addr(ws, hc["product"], product_display_str)
-    if "period" in hc: safe_write_addr(ws, hc["period"], f"{start_dt.strftime('%Y. %m. %d')} - {end_dt.strftime('%Y.%m. %d')}")
-    if "medium" in hc: safe_write_addr(ws, hc["medium"], " ".join(sorted(set([r["media"] for r in rows]))))
-    if "month" in hc: safe_write_addr(ws, hc["month"], f" {start_dt.month}月")
-    safe_write_addr(ws, meta["date_start_cell"], datetime(start_dt.year, start_dt.month, start_dt.day))
-    
-    for addr, text in meta.get("header_override", {}).items(): 
-        safe_write_addr(ws, addr, text)
-
-    # Content
-    cols = meta["cols"]
-    total_cell = find_row_by_content(ws, cols["station"], meta["total_label"])
-    
-    # [FIXED] 錯誤回報機制
-    if not total_cell: 
-        return None, f"樣板中找不到 '{meta['total_label']}' 關鍵字列 (請檢查B欄)"
-    total_row_orig = total_cell
-    
-    sec_start = {}
-    for m_key, kw in meta["anchors"].items():
-        r0 = find_first_row_contains(ws, cols["station"], kw)
-        if r0: sec_start[m_key] = r0
-    
-    sec_order = sorted(sec_start.items(), key=lambda x: x[1], reverse=True)
-    reg_map = {r: i for i, r in enumerate(REGIONS_ORDER + ["全省量販", "全省超市"])}
-    def sort_key(x): return (x["seconds"], reg_map.get(x["region"], 999))
-    
-    grouped_data = {
-        "全家廣播": sorted([r for r in rows if r["media"] == "全家廣播"], key=sort_key),
-        "新鮮視": sorted([r for r in rows if r["media"] == "新鮮視"], key=sort_key),
-        "家樂福": sorted([r for r in rows if r["media"] == "家樂福"], key=sort_key),
-    }
-    
-    current_end_marker = total_row_orig - 1
-    
-    def station_title(m):
-        prefix = "全家便利商店\n" if m != "家樂福" else ""
-        name = "通路廣播廣告" if m == "全家廣播" else "新鮮視廣告" if m == "新鮮視" else "家樂福"
-        if format_type == "Shenghuo" and m == "全家廣播": name = "廣播通路廣告"
-        return prefix + name
-
-    for i, (m_key, start_row_orig) in enumerate(sec_order):
-        style_source_row = start_row_orig + 1
-        rows_to_delete = max(0, current_end_marker - style_source_row)
-        data = grouped_data.get(m_key, [])
-        needed = len(data)
-        
-        if rows_to_delete > 0: ws.delete_rows(style_source_row + 1, amount=rows_to_delete)
-        if needed > 1:
-            ws.insert_rows(style_source_row + 1, amount=needed - 1)
-            for r_idx in range(style_source_row + 1, style_source_row + 1 + needed - 1):
-                copy_row_with_style_fix(ws, style_source_row, r_idx, ws.max_column)
-        
-        if needed == 0:
-             for c in range(1, ws.max_column+1): safe_write_rc(ws, style_source_row, c, None)
-             current_end_marker = start_row_orig - 1
-             continue
-
-        curr_row = style_source_row
-        
-        if meta["station_merge"]:
-            unmerge_col_overlap(ws, cols["station"], curr_row, curr_row + needed - 1)
-            merge_rng = f"{cols['station']}{curr_row}:{cols['station']}{curr_row + needed - 1}"
-            ws.merge_cells(merge_rng)
-            safe_write_rc(ws, curr_row, cols["station"], station_title(m_key), center=True)
-
-        if needed > 0 and data[0].get("is_pkg_member", False):
-            pkg_col = cols.get("pkg")
-            if pkg_col:
-                unmerge_col_overlap(ws, pkg_col, curr_row, curr_row + needed - 1)
-                merge_pkg = f"{pkg_col}{curr_row}:{pkg_col}{curr_row + needed - 1}"
-                ws.merge_cells(merge_pkg)
-                safe_write_rc(ws, curr_row, pkg_col, data[0]["nat_pkg_display"], center=True)
-
-        for idx, r_data in enumerate(data):
-            if not meta["station_merge"]:
-                safe_write_rc(ws, curr_row, cols["station"], station_title(m_key))
-            
-            safe_write_rc(ws, curr_row, cols["location"], region_display(r_data["region"]))
-            prog_val = r_data.get("program_num", 0)
-            safe_write_rc(ws, curr_row, cols["program"], int(prog_val))
-
-            if format_type == "Dongwu":
-                safe_write_rc(ws, curr_row, cols["daypart"], r_data["daypart"])
-                if m_key == "家樂福": safe_write_rc(ws, curr_row, cols["seconds"], f"{r_data['seconds']}秒")
-                else: safe_write_rc(ws, curr_row, cols["seconds"], int(r_data["seconds"]))
-                
-                safe_write_rc(ws, curr_row, cols["rate"], r_data["rate_display"])
-                if not r_data.get("is_pkg_member", False):
-                    safe_write_rc(ws, curr_row, cols["pkg"], r_data["pkg_display"])
-            else:
-                safe_write_rc(ws, curr_row, cols["daypart"], r_data["daypart"])
-                safe_write_rc(ws, curr_row, cols["seconds"], f"{r_data['seconds']}秒廣告")
-                if "pkg" in cols and not r_data.get("is_pkg_member", False):
-                    safe_write_rc(ws, curr_row, cols["pkg"], r_data["pkg_display"])
-
-            set_schedule(ws, curr_row, meta["schedule_start_col"], meta["max_days"], r_data["schedule"])
-            spot_sum = sum(r_data["schedule"][:meta["max_days"]])
-            safe_write_rc(ws, curr_row, meta["total_col"], spot_sum)
-            curr_row += 1
-            
-        current_end_marker = start_row_orig - 1
-
-    total_row = find_row_by_content(ws, meta["cols"]["station"], meta["total_label"])
-    if total_row:
-        eff_days = min((end_dt - start_dt).days + 1, meta["max_days"])
-        daily_sums = [sum([x["schedule"][d] for x in rows if d < len(x["schedule"])]) for d in range(eff_days)]
-        set_schedule(ws, total_row, meta["schedule_start_col"], meta["max_days"], daily_sums)
-        safe_write_rc(ws, total_row, meta["total_col"], sum(daily_sums))
-        
-        pkg_col = cols.get("pkg") or cols.get("proj_price")
-        safe_write_rc(ws, total_row, pkg_col, total_list_accum)
-
-        lbl = meta["footer_labels"]
-        make_fee = 10000 
-        pos_make = find_row_by_content(ws, "B", lbl["make"])
-        if pos_make: safe_write_rc(ws, pos_make, pkg_col, make_fee)
-        
-        vat = int(round((total_list_accum + make_fee) * 0.05))
-        pos_vat = find_row_by_content(ws, "B", lbl["vat"])
-        if pos_vat: safe_write_rc(ws, pos_vat, pkg_col, vat)
-        
-        pos_grand = find_row_by_content(ws, "B", lbl["grand"])
-        if pos_grand: safe_write_rc(ws, pos_grand, pkg_col, total_list_accum + make_fee + vat)
-
-    rem_pos = find_row_by_content(ws, "B", "Remarks：")
-    if rem_pos:
-        for i, rm in enumerate(remarks_list):
-            ws.cell(rem_pos + 1 + i, 2).value = rm
-
-    if format_type == "Dongwu":
-        force_center_columns_range(ws, meta["force_center_cols"], 9, total_row)
-
-    out = io.BytesIO()
-    wb.save(out)
-    return out.getvalue(), None
+FONT_PATH = os.environ.get("CUE_FONT_PATH", "NotoSansTC-Regular.ttf")
+# 預覽字型走 Streamlit 的 static serving (.streamlit/config.toml 的 server.enableStaticServing)：
+# 完整字型寫到 static/fonts/ 一次，瀏覽器下載一次後快取；網址相對於 app 頁面，掛在子路徑下時可用 CUE_STATIC_URL 改
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = os.environ.get("CUE_STATIC_URL", "app/static")
+
+@st.cache_resource
+def get_font_assets():
+    return FontAssets(path=FONT_PATH)
+
+def preview_font_face(body):
+    # 沒開 static serving 或 static/ 寫不進去時，退回嵌入這份預覽用到的字 (子集依字集快取)
+    fonts = get_font_assets()
+    if st.get_option("server.enableStaticServing"):
+        css = fonts.static_font_face(STATIC_DIR, STATIC_URL)
+        if css is not None: return css
+    return fonts.font_face_css(body)
+
+def generate_html_preview(rows, days_cnt, start_dt, end_dt, c_name, p_display, format_type, remarks, total_list, grand_total, budget, prod, fp=None):
+    # 表格本體依計畫指紋快取 (不含字型)，重跑時同一份計畫不必重組字串
+    args = (rows, days_cnt, start_dt, end_dt, c_name, p_display, format_type, remarks, total_list, grand_total, budget, prod)
+    with span("html") as sp:
+        fp = fp or plan_fingerprint("html", *args)
+        cache = get_artifact_cache()
+        body = cache.get(fp, "html")
+        sp["cached"] = body is not None
+        if body is None:
+            body = preview_body(*args).encode("utf-8")
+            cache.put(fp, "html", body)
+        body = body.decode("utf-8")
+
+        with span("html.font"): font_face = preview_font_face(body)
+        return preview_page(font_face, body)
 
 # =========================================================
-# 6. HTML Preview
+# 7. 背景產出 (Excel / PDF)
 # =========================================================
-def load_font_base64():
-    font_path = "NotoSansTC-Regular.ttf"
-    if os.path.exists(font_path):
-        with open(font_path, "rb") as f: return base64.b64encode(f.read()).decode("utf-8")
-    url = "https://github.com/googlefonts/noto-cjk/raw/main/Sans/TTF/TraditionalChinese/NotoSansTC-Regular.ttf"
-    try:
-        r = requests.get(url, timeout=15)
-        if r.status_code == 200:
-            with open(font_path, "wb") as f: f.write(r.content)
-            return base64.b64encode(r.content).decode("utf-8")
-    except: pass
-    return None
-
-def generate_html_preview(rows, days_cnt, start_dt, end_dt, c_name, p_display, format_type, remarks, total_list, grand_total, budget, prod):
-    header_cls = "bg-dw-head" if format_type == "Dongwu" else "bg-sh-head"
-    media_order = {"全家廣播": 1, "新鮮視": 2, "家樂福": 3}
-    eff_days = min(days_cnt, 31)
-    
-    font_b64 = load_font_base64()
-    font_face = f"@font-face {{ font-family: 'NotoSansTC'; src: url(data:font/ttf;base64,{font_b64}) format('truetype'); }}" if font_b64 else ""
-
-    date_th1, date_th2 = "", ""
-    curr = start_dt
-    weekdays = ["一", "二", "三", "四", "五", "六", "日"]
-    for i in range(eff_days):
-        wd = curr.weekday()
-        bg = "bg-weekend" if (format_type == "Dongwu" and wd >= 5) else header_cls
-        if format_type == "Shenghuo": bg = header_cls 
-        date_th1 += f"<th class='{bg} col_day'>{curr.day}</th>"
-        date_th2 += f"<th class='{bg} col_day'>{weekdays[wd]}</th>"
-        curr += timedelta(days=1)
-
-    if format_type == "Dongwu":
-        cols_def = ["Station", "Location", "Program", "Day-part", "Size", "rate<br>(Net)", "Package-cost<br>(Net)"]
-    else:
-        cols_def = ["頻道", "播出地區", "播出店數", "播出時間", "秒數<br>規格", "專案價<br>(Net)"]
-    th_fixed = "".join([f"<th rowspan='2' class='{header_cls}'>{c}</th>" for c in cols_def])
-    
-    rows_sorted = sorted(rows, key=lambda x: (media_order.get(x["media"], 99), x["seconds"], REGIONS_ORDER.index(x["region"]) if x["region"] in REGIONS_ORDER else 99))
-    tbody = ""
-    
-    grouped_rows = {}
-    for r in rows_sorted:
-        key = (r['media'], r['seconds'])
-        grouped_rows.setdefault(key, []).append(r)
-
-    for (m, sec), group in grouped_rows.items():
-        is_nat = group[0].get('is_pkg_member', False)
-        group_size = len(group)
-        
-        for k, r_data in enumerate(group):
-            tbody += "<tr>"
-            
-            if k == 0:
-                display_name = "全家便利商店<br>通路廣播廣告" if m == "全家廣播" else "全家便利商店<br>新鮮視廣告" if m == "新鮮視" else "家樂福"
-                if format_type == "Shenghuo" and m == "全家廣播": display_name = "全家便利商店<br>廣播通路廣告"
-                if format_type == "Shenghuo": tbody += f"<td class='left'>{display_name}</td>"
-                else: tbody += f"<td class='left' rowspan='{group_size}'>{display_name}</td>"
-            elif format_type == "Shenghuo":
-                 display_name = "全家便利商店<br>廣播通路廣告" if m == "全家廣播" else "全家便利商店<br>新鮮視廣告" if m == "新鮮視" else "家樂福"
-                 tbody += f"<td class='left'>{display_name}</td>"
-
-            loc_txt = region_display(r_data['region'])
-            if "北北基" in loc_txt and "廣播" in r_data['media']: loc_txt = "北區-北北基+東"
-            tbody += f"<td>{loc_txt}</td><td class='right'>{r_data.get('program_num','')}</td><td>{r_data['daypart']}</td>"
-            sec_txt = f"{r_data['seconds']}秒" if format_type=="Dongwu" and m=="家樂福" else f"{r_data['seconds']}" if format_type=="Dongwu" else f"{r_data['seconds']}秒廣告"
-            tbody += f"<td>{sec_txt}</td>"
-            
-            rate = f"{r_data['rate_display']:,}" if isinstance(r_data['rate_display'], int) else r_data['rate_display']
-            pkg = f"{r_data['pkg_display']:,}" if isinstance(r_data['pkg_display'], int) else r_data['pkg_display']
-            
-            if format_type == "Dongwu": 
-                tbody += f"<td class='right'>{rate}</td>"
-                if is_nat:
-                    if k == 0:
-                        nat_pkg = f"{r_data['nat_pkg_display']:,}"
-                        tbody += f"<td class='right' rowspan='{group_size}'>{nat_pkg}</td>"
-                else:
-                    tbody += f"<td class='right'>{pkg}</td>"
-            else: 
-                if is_nat:
-                    if k == 0:
-                        nat_pkg = f"{r_data['nat_pkg_display']:,}"
-                        tbody += f"<td class='right' rowspan='{group_size}'>{nat_pkg}</td>"
-                else:
-                    tbody += f"<td class='right'>{pkg}</td>"
-            
-            for d in r_data['schedule'][:eff_days]: tbody += f"<td>{d}</td>"
-            tbody += f"<td class='bg-total'>{r_data['spots']}</td></tr>"
-
-    totals = [sum([r["schedule"][d] for r in rows if d < len(r["schedule"])]) for d in range(eff_days)]
-    colspan = 5
-    empty_td = "<td></td>" if format_type == "Dongwu" else ""
-    tfoot = f"<tr class='bg-total'><td colspan='{colspan}' class='right'>Total (List Price)</td>{empty_td}<td class='right'>{total_list:,}</td>"
-    for t in totals: tfoot += f"<td>{t}</td>"
-    tfoot += f"<td>{sum(totals)}</td></tr>"
-
-    vat = int(round((budget + prod) * 0.05))
-    footer_rows = f"<tr><td colspan='6' class='right'>製作</td><td class='right'>{prod:,}</td><td colspan='{eff_days+1}'></td></tr>"
-    footer_rows += f"<tr><td colspan='6' class='right'>專案優惠價 (Budget)</td><td class='right' style='color:red; font-weight:bold;'>{budget:,}</td><td colspan='{eff_days+1}'></td></tr>"
-    footer_rows += f"<tr><td colspan='6' class='right'>5% VAT</td><td class='right'>{vat:,}</td><td colspan='{eff_days+1}'></td></tr>"
-    footer_rows += f"<tr class='bg-grand'><td colspan='6' class='right'>Grand Total</td><td class='right'>{grand_total:,}</td><td colspan='{eff_days+1}'></td></tr>"
-
-    html_content = f"""
-    <html><head><style>
-    {font_face}
-    body {{ font-family: 'NotoSansTC', sans-serif !important; font-size: 10px; }}
-    table {{ width: 100%; border-collapse: collapse; }}
-    th, td {{ border: 0.5pt solid #000; padding: 2px; text-align: center; white-space: nowrap; }}
-    .bg-dw-head {{ background-color: #4472C4; color: white; -webkit-print-color-adjust: exact; }}
-    .bg-sh-head {{ background-color: #BDD7EE; color: black; -webkit-print-color-adjust: exact; }}
-    .bg-weekend {{ background-color: #FFD966; -webkit-print-color-adjust: exact; }}
-    .bg-total   {{ background-color: #E2EFDA; -webkit-print-color-adjust: exact; }}
-    .bg-grand   {{ background-color: #FFC107; -webkit-print-color-adjust: exact; }}
-    .left {{ text-align: left; }}
-    .right {{ text-align: right; }}
-    .remarks {{ margin-top: 10px; font-size: 9px; text-align: left; white-space: pre-wrap; }}
-    </style></head><body>
-    <div style="margin-bottom:10px;">
-        <div style="font-size:16px; font-weight:bold; text-align:center;">Media Schedule</div>
-        <b>客戶名稱：</b>{html_escape(c_name)} &nbsp; <b>Product：</b>{html_escape(p_display)}<br>
-        <b>Period：</b>{start_dt.strftime('%Y. %m. %d')} - {end_dt.strftime('%Y. %m. %d')} &nbsp; <b>Medium：</b>全家廣播/新鮮視/家樂福
-    </div>
-    <table>
-        <thead><tr>{th_fixed}{date_th1}<th class='{header_cls}' rowspan='2'>檔次</th></tr><tr>{date_th2}</tr></thead>
-        <tbody>{tbody}{tfoot}{footer_rows}</tbody>
-    </table>
-    <div class="remarks"><b>Remarks：</b><br>{"<br>".join([html_escape(x) for x in remarks])}</div>
-    </body></html>
-    """
-    return html_content
+RENDER_WORKERS = int(os.environ.get("CUE_RENDER_WORKERS", "2"))
+
+@st.cache_resource
+def get_render_queue():
+    q = RenderJobQueue(max_workers=RENDER_WORKERS)
+    atexit.register(q.shutdown)
+    return q
+
+# 產出物記憶體上限：全站 CUE_CACHE_MB、每個 session CUE_SESSION_CACHE_MB，超過的溢寫到磁碟
+CACHE_MAX_MB = int(os.environ.get("CUE_CACHE_MB", "64"))
+SESSION_CACHE_MB = int(os.environ.get("CUE_SESSION_CACHE_MB", "16"))
+CACHE_DIR = os.environ.get("CUE_CACHE_DIR") or None
+CACHE_DISK_MB = int(os.environ.get("CUE_CACHE_DISK_MB", "512"))
+
+@st.cache_resource
+def get_artifact_cache():
+    disk_dir = CACHE_DIR
+    if not disk_dir:
+        # 沒指定目錄就溢寫到暫存目錄，process 結束時刪掉
+        disk_dir = tempfile.mkdtemp(prefix="cue-artifacts-")
+        atexit.register(shutil.rmtree, disk_dir, True)
+    return ArtifactCache(max_bytes=CACHE_MAX_MB * 1024 * 1024, disk_dir=disk_dir, disk_max_bytes=CACHE_DISK_MB * 1024 * 1024,
+                         owner_max_bytes=SESSION_CACHE_MB * 1024 * 1024)
+
+def render_artifacts(*args):
+    # 背景 thread 的 span 另外收集，結果裡附上給計時面板
+    with collect() as spans:
+        with span("render"): res = _render_artifacts(*args)
+    res["spans"] = spans
+    return res
+
+def _render_artifacts(job, format_type, start_dt, end_dt, client_name, p_str, rows, remarks, template_bytes, total_list_accum, html_preview, excel_incremental=None, owner=None):
+    # 結果只記產出物在快取裡的種類 (kind)，檔案本身留在 ArtifactCache，按下載時才取
+    res = {"xlsx": None, "pdf": None, "pdf_label": None, "error": None, "warning": None, "stream": template_bytes is None}
+    cache, fp = get_artifact_cache(), job.fingerprint
+    xlsx = cache.get(fp, "xlsx")
+    if xlsx is None:
+        if template_bytes is None:
+            # 快速模式：不讀樣板，串流寫出
+            from cuesheet.excel_stream import generate_excel_stream
+            xlsx, err_msg = generate_excel_stream(format_type, start_dt, end_dt, client_name, p_str, rows, remarks, total_list_accum)
+        else:
+            from cuesheet.excel_render import generate_excel_from_template
+            # 有這個 session 上一版的 workbook 就只重寫變動的區塊
+            render = excel_incremental.render if excel_incremental is not None else generate_excel_from_template
+            xlsx, err_msg = render(format_type, start_dt, end_dt, client_name, p_str, rows, remarks, template_bytes, total_list_accum, get_template_cache())
+        if not xlsx:
+            res["error"] = f"❌ 無法生成 Excel，可能原因：{err_msg}"
+            return res
+        cache.put(fp, "xlsx", xlsx, owner)
+    res["xlsx"] = "xlsx"
+    job.check_cancelled()
+
+    if PDF_ENGINE == "native":
+        pdf_bytes = cache.get(fp, "native.pdf")
+        if pdf_bytes is None:
+            from cuesheet.pdf_render import render_pdf
+            pdf_bytes, err = render_pdf(format_type, start_dt, end_dt, client_name, p_str, rows, remarks, total_list_accum, get_font_assets())
+            cache.put(fp, "native.pdf", pdf_bytes, owner)
+        if pdf_bytes:
+            res["pdf"], res["pdf_label"] = "native.pdf", "📥 下載 PDF"
+            return res
+        job.check_cancelled()
+
+    pdf_bytes = cache.get(fp, "pdf")
+    if pdf_bytes is None:
+        pdf_bytes, method, err = xlsx_bytes_to_pdf_bytes(xlsx)
+        cache.put(fp, "pdf", pdf_bytes, owner)
+    if pdf_bytes:
+        res["pdf"], res["pdf_label"] = "pdf", "📥 下載擬真 PDF (LibreOffice)" if template_bytes else "📥 下載 PDF (LibreOffice)"
+        return res
+    job.check_cancelled()
+    res["warning"] = f"本地轉檔失敗 ({err})，使用網頁渲染版"
+    pdf_bytes = cache.get(fp, "web.pdf")
+    if pdf_bytes is None:
+        pdf_bytes, err = html_to_pdf_weasyprint(html_preview, get_font_assets())
+        cache.put(fp, "web.pdf", pdf_bytes, owner)
+    if pdf_bytes: res["pdf"], res["pdf_label"] = "web.pdf", "📥 下載 PDF (Web版)"
+    return res
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def lazy_payload(fp, kind, args, owner):
+    # 給 st.download_button 的 data：按下去才從快取取檔 (磁碟上的不搬回記憶體)；
+    # 早被淘汰掉的就依原本的輸入重產一次
+    def _load():
+        cache = get_artifact_cache()
+        data = cache.get(fp, kind, promote=False)
+        if data is None:
+            _render_artifacts(RenderJob(fp), *args, owner)
+            data = cache.get(fp, kind, promote=False)
+        if data is None: raise RuntimeError("產出物已失效，請重新整理頁面")
+        return data
+    return _load
+
+def bundle_payload(fps, templates, args, owner):
+    # 全部格式打包 (ZIP)：排程沿用這次算好的 rows，各格式平行渲染；
+    # 快取裡已經有的 (目前格式的背景產出、上次打包過的格式) 直接放進去，新產的也存回快取
+    def _load():
+        from cuesheet.bundle import render_bundle, bundle_zip
+        cache = get_artifact_cache()
+        pdf_kinds = ("native.pdf", "pdf") if PDF_ENGINE == "native" else ("pdf",)
+        ready = {}
+        for fmt, fp in fps.items():
+            r = ready[fmt] = {}
+            xlsx = cache.get(fp, "xlsx", promote=False)
+            if xlsx: r["xlsx"] = xlsx
+            for kind in pdf_kinds:
+                pdf_bytes = cache.get(fp, kind, promote=False)
+                if pdf_bytes:
+                    r["pdf"], r["pdf_method"] = pdf_bytes, "native" if kind == "native.pdf" else "soffice"
+                    break
+        items = render_bundle(*args, templates=templates, fonts=get_font_assets() if PDF_ENGINE == "native" else None,
+                              template_cache=get_template_cache(), pdf_fallback=xlsx_bytes_to_pdf_bytes, formats=list(fps), ready=ready)
+        for it in items:
+            fp, r = fps[it["format"]], ready[it["format"]]
+            if it["xlsx"] and "xlsx" not in r: cache.put(fp, "xlsx", it["xlsx"], owner)
+            if it["pdf"] and "pdf" not in r: cache.put(fp, "native.pdf" if it["pdf_method"] == "native" else "pdf", it["pdf"], owner)
+        return bundle_zip(items, f"Cue_{safe_filename(args[2])}", {"client": args[2], "product": args[3], "start": args[0], "end": args[1]})
+    return _load
+
+def download_panel(job, client_name, args, owner, bundle=None):
+    polling = not job.done
+
+    @st.fragment(run_every=1.0 if polling else None)
+    def _panel():
+        if not job.done:
+            st.info(f"⏳ 背景產生 Excel / PDF 中 ({'排隊中' if job.status == 'queued' else '轉檔中'})，可繼續調整設定...")
+            return
+        # job 在輪詢中完成：整頁重跑一次以關掉輪詢 (這次重跑不重送失敗的 job，等使用者下次操作再重試)
+        if polling:
+            st.session_state.render_polled = True
+            st.rerun()
+        if job.status == "failed":
+            st.error(f"Excel 產出錯誤: {job.error}")
+            return
+        if job.status != "done": return
+        res = job.result
+        if res["error"]:
+            st.error(res["error"])
+            return
+        fname = f"Cue_{safe_filename(client_name)}"
+        st.download_button("📥 下載 Excel (快速)" if res.get("stream") else "📥 下載擬真 Excel", lazy_payload(job.fingerprint, res["xlsx"], args, owner), f"{fname}.xlsx", mime=XLSX_MIME)
+        if res["warning"]: st.warning(res["warning"])
+        if res["pdf"]: st.download_button(res["pdf_label"], lazy_payload(job.fingerprint, res["pdf"], args, owner), f"{fname}.pdf", mime="application/pdf")
+        if bundle is not None: st.download_button("📦 下載全部格式 (ZIP)", bundle, f"{fname}.zip", mime="application/zip", help="同一份排程依每種格式各產一份 Excel + PDF；沒上傳樣板的格式用快速 Excel")
+    _panel()
 
 # =========================================================
-# 7. UI Main
+# 8. UI Main
 # =========================================================
+PLAN_MEMO_ITEMS = int(os.environ.get("CUE_PLAN_MEMO_ITEMS", "8"))
+PLAN_MEMO_MB = int(os.environ.get("CUE_PLAN_MEMO_MB", "16"))
+EXCEL_INCREMENTAL = os.environ.get("CUE_EXCEL_INCREMENTAL", "1") == "1"
+
+if "render_owner" not in st.session_state: st.session_state.render_owner = uuid.uuid4().hex
+# 排程計算 / 預覽記憶：每個 session 各自一份、有上限，輸入沒變的 rerun 直接沿用
+if "plan_memo" not in st.session_state: st.session_state.plan_memo = Memo(max_items=PLAN_MEMO_ITEMS, max_bytes=PLAN_MEMO_MB * 1024 * 1024)
+plan_memo = st.session_state.plan_memo
+# 擬真 Excel 增量更新：保留本 session 上一版 workbook，只改到部分區塊時不整本重畫
+if "excel_incremental" not in st.session_state:
+    if EXCEL_INCREMENTAL:
+        from cuesheet.excel_incremental import IncrementalExcel
+        st.session_state.excel_incremental = IncrementalExcel()
+    else: st.session_state.excel_incremental = None
+
 st.title("📺 媒體 Cue 表生成器 (v76.2)")
+_cfg_store = get_config_store(GSHEET_SHARE_URL)
+if _cfg_store.last_error: st.caption(f"⚠️ 雲端價格表暫時無法更新，使用本機快照 {_cfg_store.version} ({_cfg_store.last_error})")
 
 st.markdown("### 1. 選擇格式")
 c1, c2 = st.columns(2)
 format_type = c1.radio("", ["Dongwu", "Shenghuo"], horizontal=True)
+stream_excel = c1.toggle("快速 Excel (不套樣板)", key="excel_stream", help="不讀上傳的樣板，依內建格式直接輸出；內容與樣板版相同，版面樣式為標準格式，大型計畫快很多")
 
 # 雙模版上傳
 tpl_file = None
@@ -725,8 +336,21 @@ if format_type == "Dongwu":
 else:
     tpl_file = c2.file_uploader("上傳【聲活】樣板 (.xlsx)", type=["xlsx"], key="upl_sh")
 
-if tpl_file: template_bytes = tpl_file.read()
-else: template_bytes = None
+# 各格式上傳過的樣板記在 session：切換格式後另一個上傳元件會被清掉，切回來或多格式打包時照樣可用。
+# getvalue() 拿的是 Streamlit 保管的同一份 bytes (不另外複製)；樣板指紋只在換檔時算一次，不必每次 rerun 都重新 hash
+if "templates" not in st.session_state: st.session_state.templates = {}
+session_templates = st.session_state.templates
+if tpl_file and session_templates.get(format_type, {}).get("file_id") != tpl_file.file_id:
+    data = tpl_file.getvalue()
+    session_templates[format_type] = {"file_id": tpl_file.file_id, "name": tpl_file.name, "bytes": data, "digest": hashlib.sha256(data).hexdigest()}
+elif not tpl_file and format_type in session_templates:
+    tc1, tc2 = c2.columns([4, 1])
+    tc1.caption(f"沿用先前上傳的樣板：{session_templates[format_type]['name']}")
+    if tc2.button("移除", key="tpl_clear"):
+        del session_templates[format_type]
+        st.rerun()
+template_bytes = session_templates.get(format_type, {}).get("bytes")
+template_digest = session_templates.get(format_type, {}).get("digest")
 
 st.markdown("### 2. 基本資料設定")
 c1, c2, c3 = st.columns(3)
@@ -738,7 +362,7 @@ c4, c5 = st.columns(2)
 with c4: start_date = st.date_input("開始日", datetime(2026, 1, 1))
 with c5: end_date = st.date_input("結束日", datetime(2026, 1, 31))
 days_count = (end_date - start_date).days + 1
-st.info(f"📅 走期共 **{days_count}** 天")
+st.info(f"📅 走期共 **{days_count}** 天" + (f"，超過 {MAX_DAYS[format_type]} 天會依月份分頁 (Excel 每頁一張工作表)" if days_count > MAX_DAYS[format_type] else ""))
 
 with st.expander("📝 備註欄位設定 (Remarks)", expanded=False):
     rc1, rc2, rc3 = st.columns(3)
@@ -784,11 +408,65 @@ def on_slider_change(changed_key):
             st.session_state[k1] = int(rem * ratio)
             st.session_state[k2] = rem - st.session_state[k1]
 
+MEDIA_KEYS = {"全家廣播": ("cb_rad", "rad", "rs"), "新鮮視": ("cb_fv", "fv", "fs"), "家樂福": ("cb_cf", "cf", "cs")}
+
+def widget_default(key, **kw):
+    # 已由程式 (最佳化「套用」) 寫入 session_state 的 widget 不再帶預設值，避免 Streamlit 警告
+    return {} if key in st.session_state else kw
+
+def apply_plan_config(plan_cfg):
+    for m, (cb, p, sp) in MEDIA_KEYS.items():
+        cfg = plan_cfg.get(m)
+        st.session_state[cb] = cfg is not None
+        st.session_state[f"{p}_share"] = cfg["share"] if cfg else 0
+        if not cfg: continue
+        secs = sorted(cfg["sec_shares"])
+        st.session_state[f"{p}_sec"] = secs
+        for s in secs[:-1]: st.session_state[f"{sp}_{s}"] = cfg["sec_shares"][s]
+        if "is_national" in cfg:
+            st.session_state[f"{p}_nat"] = cfg["is_national"]
+            if not cfg["is_national"]: st.session_state[f"{p}_reg"] = cfg["regions"]
+
+with st.expander("🎯 預算最佳化 (自動配置媒體 / 秒數 / 區域)", expanded=False):
+    oc1, oc2, oc3 = st.columns(3)
+    opt_media = oc1.multiselect("可用媒體", MEDIA_ORDER, default=MEDIA_ORDER, key="opt_media")
+    opt_required = oc1.multiselect("必選媒體", opt_media, key="opt_required")
+    opt_obj = oc2.radio("最佳化目標", list(OBJECTIVES), format_func=lambda x: {"spots": "總檔次最多", "reach": "店數加權觸及最多"}[x], key="opt_obj")
+    opt_step = oc2.select_slider("佔比級距 %", [5, 10, 20, 25], value=10, key="opt_step")
+    opt_penalty = oc3.checkbox("允許未達標 (x1.1 懲罰)", True, key="opt_penalty")
+
+    opt_rng, opt_reg, opt_sec = {}, {}, {}
+    for col, m in zip(st.columns(3), MEDIA_ORDER):
+        if m not in opt_media: continue
+        p = MEDIA_KEYS[m][1]
+        with col:
+            st.caption(m)
+            opt_rng[m] = st.slider("佔比範圍 %", 0, 100, (0, 100), key=f"opt_rng_{p}")
+            if m != "家樂福": opt_reg[m] = st.multiselect("可用區域", REGIONS_ORDER, default=REGIONS_ORDER, key=f"opt_reg_{p}")
+            opt_sec[m] = st.multiselect("可用秒數", DURATIONS, default=[10, 20], key=f"opt_sec_{p}")
+
+    if st.button("🔍 計算最佳配置", key="opt_run"):
+        st.session_state.opt_result = optimize_budget(
+            PRICING, total_budget_input, opt_media, required=opt_required, regions=opt_reg, seconds=opt_sec,
+            min_share={m: r[0] for m, r in opt_rng.items()}, max_share={m: r[1] for m, r in opt_rng.items()},
+            objective=opt_obj, share_step=opt_step, allow_penalty=opt_penalty,
+        ) or "none"
+    opt_res = st.session_state.get("opt_result")
+    if opt_res == "none":
+        st.warning("找不到符合限制的配置，請放寬條件")
+    elif opt_res:
+        st.success(f"建議配置：總檔次 **{opt_res['total_spots']:,}**，店數加權觸及 **{opt_res['reach']:,}**，List 總價 {opt_res['total_list']:,} (評估 {opt_res['evaluated']:,} 組，{opt_res['elapsed'] * 1000:.0f} ms)")
+        for m, c in opt_res["config"].items():
+            regs = "全省" if c.get("is_national", True) else "、".join(c["regions"])
+            secs = " / ".join(f"{s}秒 {v}%" for s, v in c["sec_shares"].items())
+            st.markdown(f"- **{m}** {c['share']}%｜{regs}｜{secs}")
+        st.button("✅ 套用到下方設定", key="opt_apply", on_click=apply_plan_config, args=(opt_res["config"],))
+
 st.write("請勾選要投放的媒體：")
 col_cb1, col_cb2, col_cb3 = st.columns(3)
-with col_cb1: is_rad = st.checkbox("全家廣播", value=True, key="cb_rad", on_change=on_media_change)
-with col_cb2: is_fv = st.checkbox("新鮮視", value=False, key="cb_fv", on_change=on_media_change)
-with col_cb3: is_cf = st.checkbox("家樂福", value=False, key="cb_cf", on_change=on_media_change)
+with col_cb1: is_rad = st.checkbox("全家廣播", key="cb_rad", on_change=on_media_change, **widget_default("cb_rad", value=True))
+with col_cb2: is_fv = st.checkbox("新鮮視", key="cb_fv", on_change=on_media_change, **widget_default("cb_fv", value=False))
+with col_cb3: is_cf = st.checkbox("家樂福", key="cb_cf", on_change=on_media_change, **widget_default("cb_cf", value=False))
 
 m1, m2, m3 = st.columns(3)
 config = {}
@@ -796,14 +474,14 @@ config = {}
 if is_rad:
     with m1:
         st.markdown("#### 📻 全家廣播")
-        is_nat = st.checkbox("全省聯播", True, key="rad_nat")
-        regs = ["全省"] if is_nat else st.multiselect("區域", REGIONS_ORDER, default=REGIONS_ORDER, key="rad_reg")
+        is_nat = st.checkbox("全省聯播", key="rad_nat", **widget_default("rad_nat", value=True))
+        regs = ["全省"] if is_nat else st.multiselect("區域", REGIONS_ORDER, key="rad_reg", **widget_default("rad_reg", default=REGIONS_ORDER))
         effective_is_nat = is_nat
         if not is_nat and len(regs) == 6:
             effective_is_nat = True
             regs = ["全省"]
             st.info("✅ 已選滿6區，自動轉為全省聯播計價")
-        secs = st.multiselect("秒數", DURATIONS, [20], key="rad_sec")
+        secs = st.multiselect("秒數", DURATIONS, key="rad_sec", **widget_default("rad_sec", default=[20]))
         st.slider("預算 %", 0, 100, key="rad_share", on_change=on_slider_change, args=("rad_share",))
         sec_shares = {}
         if len(secs) > 1:
@@ -812,7 +490,7 @@ if is_rad:
             sorted_secs = sorted(secs)
             for i, s in enumerate(sorted_secs):
                 if i < len(sorted_secs) - 1:
-                    v = st.slider(f"{s}秒 %", 0, rem, int(rem/2), key=f"rs_{s}")
+                    v = st.slider(f"{s}秒 %", 0, rem, key=f"rs_{s}", **widget_default(f"rs_{s}", value=int(rem/2)))
                     sec_shares[s] = v; rem -= v
                 else:
                     sec_shares[s] = rem
@@ -823,14 +501,14 @@ if is_rad:
 if is_fv:
     with m2:
         st.markdown("#### 📺 新鮮視")
-        is_nat = st.checkbox("全省聯播", False, key="fv_nat")
-        regs = ["全省"] if is_nat else st.multiselect("區域", REGIONS_ORDER, default=["北區"], key="fv_reg")
+        is_nat = st.checkbox("全省聯播", key="fv_nat", **widget_default("fv_nat", value=False))
+        regs = ["全省"] if is_nat else st.multiselect("區域", REGIONS_ORDER, key="fv_reg", **widget_default("fv_reg", default=["北區"]))
         effective_is_nat = is_nat
         if not is_nat and len(regs) == 6:
             effective_is_nat = True
             regs = ["全省"]
             st.info("✅ 已選滿6區，自動轉為全省聯播計價")
-        secs = st.multiselect("秒數", DURATIONS, [10], key="fv_sec")
+        secs = st.multiselect("秒數", DURATIONS, key="fv_sec", **widget_default("fv_sec", default=[10]))
         st.slider("預算 %", 0, 100, key="fv_share", on_change=on_slider_change, args=("fv_share",))
         sec_shares = {}
         if len(secs) > 1:
@@ -839,7 +517,7 @@ if is_fv:
             sorted_secs = sorted(secs)
             for i, s in enumerate(sorted_secs):
                 if i < len(sorted_secs) - 1:
-                    v = st.slider(f"{s}秒 %", 0, rem, int(rem/2), key=f"fs_{s}")
+                    v = st.slider(f"{s}秒 %", 0, rem, key=f"fs_{s}", **widget_default(f"fs_{s}", value=int(rem/2)))
                     sec_shares[s] = v; rem -= v
                 else:
                     sec_shares[s] = rem
@@ -850,7 +528,7 @@ if is_fv:
 if is_cf:
     with m3:
         st.markdown("#### 🛒 家樂福")
-        secs = st.multiselect("秒數", DURATIONS, [20], key="cf_sec")
+        secs = st.multiselect("秒數", DURATIONS, key="cf_sec", **widget_default("cf_sec", default=[20]))
         st.slider("預算 %", 0, 100, key="cf_share", on_change=on_slider_change, args=("cf_share",))
         sec_shares = {}
         if len(secs) > 1:
@@ -859,7 +537,7 @@ if is_cf:
             sorted_secs = sorted(secs)
             for i, s in enumerate(sorted_secs):
                 if i < len(sorted_secs) - 1:
-                    v = st.slider(f"{s}秒 %", 0, rem, int(rem/2), key=f"cs_{s}")
+                    v = st.slider(f"{s}秒 %", 0, rem, key=f"cs_{s}", **widget_default(f"cs_{s}", value=int(rem/2)))
                     sec_shares[s] = v; rem -= v
                 else:
                     sec_shares[s] = rem
@@ -868,7 +546,8 @@ if is_cf:
         config["家樂福"] = {"regions": ["全省"], "sec_shares": sec_shares, "share": st.session_state.cf_share}
 
 if config:
-    rows, total_list_accum, logs = calculate_plan_data(config, total_budget_input, days_count)
+    calc_fp = calc_fingerprint(config, total_budget_input, days_count, PRICING)
+    rows, total_list_accum, logs = plan_memo.get_or_compute(calc_fp, lambda: calculate_plan_data(config, total_budget_input, days_count, PRICING))
     
     prod_cost = 10000
     vat = int(round((total_budget_input + prod_cost) * 0.05))
@@ -876,36 +555,73 @@ if config:
     p_str = f"{'、'.join([f'{s}秒' for s in sorted(list(set(r['seconds'] for r in rows)))])} {product_name}"
     rem = get_remarks_text(sign_deadline, billing_month, payment_date)
 
-    html_preview = generate_html_preview(rows, days_count, start_date, end_date, client_name, p_str, format_type, rem, total_list_accum, grand_total, total_budget_input, prod_cost)
+    # 整份計畫只算一次指紋，預覽 / 下載各自再加上自己的輸入
+    # rows / total_list 完全由 calc_fp 決定，指紋用 calc_fp 代替整份 rows，不必每次重新序列化
+    plan_fp = plan_fingerprint(format_type, start_date, end_date, client_name, p_str, calc_fp, rem)
+    html_fp = plan_fingerprint("html", plan_fp, days_count, grand_total, total_budget_input, prod_cost)
+    html_preview = plan_memo.get_or_compute(html_fp, lambda: generate_html_preview(rows, days_count, start_date, end_date, client_name, p_str, format_type, rem, total_list_accum, grand_total, total_budget_input, prod_cost, fp=html_fp), size=lambda s: len(s.encode("utf-8")))  # max_bytes 以 bytes 計，中文一字 3 bytes
     st.components.v1.html(html_preview, height=700, scrolling=True)
 
     with st.expander("💡 系統運算邏輯說明 (Debug Panel)", expanded=False):
-        for log in logs:
+        for log in map(format_debug_log, logs):
             st.markdown(f"### {log.get('Media')}")
             st.markdown(f"- **預算**: {log.get('Budget')}")
             st.markdown(f"- **公式**: {log.get('Net_Unit')} (Net單價) × {log.get('Penalty_Factor')} (懲罰) = {log.get('Final_Cost')} (最終單價)")
             st.markdown(f"- **檔次計算**: {log.get('Init_Spots')} (試算) vs {log.get('Std_Spots')} (標準) -> **{log.get('Penalty_Status')}**")
             st.markdown(f"- **最終執行**: **{log.get('Final_Spots')}** 檔")
             st.divider()
-
-    # Excel / PDF Download
+        cs = get_artifact_cache().stats()
+        st.caption(f"產出物快取：命中 {cs['hits']} / 未命中 {cs['misses']} (磁碟命中 {cs['disk_hits']})，記憶體 {cs['mem_bytes'] / 1024 / 1024:.1f} / {CACHE_MAX_MB} MB ({cs['mem_items']} 項)，磁碟 {cs['disk_bytes'] / 1024 / 1024:.1f} MB ({cs['disk_items']} 項)，{cs['owners']} 個 session")
+        us = get_artifact_cache().usage(st.session_state.render_owner)
+        st.caption(f"本 session 產出物：記憶體 {us['mem_bytes'] / 1024 / 1024:.1f} / {SESSION_CACHE_MB} MB ({us['mem_items']} 項)，已溢寫磁碟 {us['disk_bytes'] / 1024 / 1024:.1f} MB ({us['disk_items']} 項)")
+        ts = get_template_cache().stats()
+        st.caption(f"樣板快取：命中 {ts['hits']} / 未命中 {ts['misses']}，{ts['items']} 份樣板 ({ts['bytes'] / 1024:.0f} KB)")
+        ms = plan_memo.stats()
+        st.caption(f"計算記憶 (本 session)：命中 {ms['hits']} / 未命中 {ms['misses']}，{ms['items']} / {ms['max_items']} 筆，預覽 {ms['bytes'] / 1024 / 1024:.1f} / {PLAN_MEMO_MB} MB")
+        if st.session_state.excel_incremental is not None:
+            xs = st.session_state.excel_incremental.stats()
+            st.caption(f"Excel 增量更新 (本 session)：整本 {xs['full']} 次 / 增量 {xs['partial']} 次 (重寫 {xs['sections_written']} 個區塊，略過 {xs['sections_skipped']} 個)")
+        fs = get_font_assets().stats()
+        st.caption(f"預覽字型：{'靜態檔 (瀏覽器快取)' if fs['static'] else '子集' if fs['subsetting'] else '完整字型'} (子集命中 {fs['hits']} / 未命中 {fs['misses']})，完整字型 {fs['font_bytes'] / 1024 / 1024:.1f} MB")
+
+    # Excel / PDF Download (背景產出，不阻塞互動)
     if rows:
-        if template_bytes:
-            try:
-                xlsx, err_msg = generate_excel_from_template(format_type, start_date, end_date, client_name, p_str, rows, rem, template_bytes, total_list_accum)
-                if xlsx:
-                    st.download_button("📥 下載擬真 Excel", xlsx, f"Cue_{safe_filename(client_name)}.xlsx")
-                    
-                    pdf_bytes, method, err = xlsx_bytes_to_pdf_bytes(xlsx)
-                    if pdf_bytes:
-                        st.download_button(f"📥 下載擬真 PDF ({method})", pdf_bytes, f"Cue_{safe_filename(client_name)}.pdf")
-                    else:
-                        st.warning(f"本地轉檔失敗 ({err})，使用網頁渲染版")
-                        pdf_bytes, err = html_to_pdf_weasyprint(html_preview)
-                        if pdf_bytes: st.download_button("📥 下載 PDF (Web版)", pdf_bytes, f"Cue_{safe_filename(client_name)}.pdf")
-                else:
-                    st.error(f"❌ 無法生成 Excel，可能原因：{err_msg}")
-            except Exception as e:
-                st.error(f"Excel 產出錯誤: {e}")
+        if template_bytes or stream_excel:
+            tpl = None if stream_excel else template_bytes
+            fp = plan_fingerprint(plan_fp, "stream" if stream_excel else template_digest)
+            owner = st.session_state.render_owner
+            args = (format_type, start_date, end_date, client_name, p_str, rows, rem, tpl, total_list_accum, html_preview, st.session_state.excel_incremental)
+            queue, polled = get_render_queue(), st.session_state.pop("render_polled", False)
+            job = queue.get(owner)
+            if not (polled and job is not None and job.fingerprint == fp and job.status == "failed"):
+                job = queue.submit(owner, fp, render_artifacts, *args, owner)
+            # 多格式打包：每個格式的指紋與單一格式下載相同算法，目前格式直接沿用背景產出
+            bundle_tpls = {} if stream_excel else {fmt: t["bytes"] for fmt, t in session_templates.items()}
+            fps = {fmt: plan_fingerprint(plan_fingerprint(fmt, start_date, end_date, client_name, p_str, calc_fp, rem), session_templates[fmt]["digest"] if fmt in bundle_tpls else "stream")
+                   for fmt in SHEET_META}
+            bundle = bundle_payload(fps, bundle_tpls, (start_date, end_date, client_name, p_str, rows, rem, total_list_accum), owner)
+            download_panel(job, client_name, args, owner, bundle)
         else:
-            st.warning("⚠️ 請上傳 Excel 樣板以啟用下載按鈕 (上方區塊)")
+            st.warning("⚠️ 請上傳 Excel 樣板以啟用下載按鈕，或開啟「快速 Excel (不套樣板)」(上方區塊)")
+
+# =========================================================
+# 9. 效能計時面板 (CUE_TIMING_PANEL=1 或網址加 ?timing=1)
+# =========================================================
+def span_table(spans):
+    return [{"階段": s["span"], "上層": s["parent"] or "", "ms": s["ms"], "狀態": s["status"]} for s in sorted(spans, key=lambda s: s["ts"])]
+
+if TIMING_PANEL:
+    with st.expander("⏱️ 效能計時 (Timing Panel)", expanded=False):
+        st.markdown(f"**本次 rerun**：{RERUN_TRACE.elapsed * 1000:.0f} ms")
+        if RERUN_TRACE.spans: st.dataframe(span_table(RERUN_TRACE.spans))
+        last_job = job if config and rows and (template_bytes or stream_excel) else None
+        if last_job is not None and last_job.done and last_job.status == "done":
+            st.markdown("**最近一次背景產出 (Excel / PDF)**")
+            st.dataframe(span_table(last_job.result.get("spans", [])))
+        st.markdown("**整個 process 累計**")
+        st.dataframe([{"階段": k.split("|")[0], "狀態": k.split("|")[1], "次數": v["count"], "平均 ms": round(v["sum"] / v["count"] * 1000, 2)} for k, v in sorted(REGISTRY.snapshot().items())])
+        st.radio("Profiler (下次 rerun 起生效)", ["off", "cprofile", "pyinstrument"], horizontal=True, key="prof_mode")
+        if PROFILE is not None:
+            st.session_state._prof = None
+            st.code(PROFILE.stop() or "(沒有資料)", language=None)
+        st.download_button("📥 下載本次計時 (JSON)", json.dumps(RERUN_TRACE.spans, ensure_ascii=False, default=str), "cue_timing.json")
@@ -0,0 +1,325 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import traceback
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import util as mp_util
+from cuesheet.config_loader import ConfigStore, GSHEET_CSV_URL, GSHEET_SHARE_URL, SHEETS, read_frames
+from cuesheet.pricing import PricingIndex, PKG_MEDIA, CF_MEDIA, REGIONS_ORDER
+from cuesheet.planner import safe_filename, get_remarks_text, calculate_plan_data
+from cuesheet.metrics import Trace
+
+# =========================================================
+# 批次產出 (無 Streamlit)
+# 讀取 JSON / CSV 工作檔，每筆 = 一份 Cue 表 (計算 → Excel → PDF)，
+# 以 process pool 平行處理，輸出到目錄並寫一份 manifest.json。
+# 價格表只在主程序載入一次，透過 initializer 交給各 worker；
+# 每個 worker 各自一份樣板快取與一個 LibreOffice worker (第一次轉 PDF 時才啟動)。
+# 單筆失敗只記在 manifest，不影響其他筆；worker 整個掛掉時，受影響的工作逐筆在新的 worker 重試一次。
+#
+#   python batch_cli.py jobs.json --out out/ --template-dongwu dongwu.xlsx --workers 4
+#
+# 工作欄位：id, client, product, budget, start, end, format (Dongwu / Shenghuo),
+#           media (同 UI 的媒體設定 dict；CSV 中為 JSON 字串),
+#           template (選填，覆蓋 --template-*), sign_deadline / billing_month / payment_date (選填),
+#           excel_mode (選填，覆蓋 --excel-mode：template = 套樣板擬真，stream = 不讀樣板的快速輸出)
+# PDF 預設直接從排程排版 (--pdf-engine native，不需 LibreOffice)；沒有中文字型時退回 LibreOffice / WeasyPrint
+# --bundle：每筆工作不分 format，依 SHEET_META 每種格式各產一份 Excel + PDF (同一份排程、格式間平行渲染)，打成一個 ZIP
+# =========================================================
+PROD_COST = 10000
+
+# ---------- 工作檔 ----------
+def load_jobs(path):
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f: jobs = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f: jobs = json.load(f)
+        if isinstance(jobs, dict): jobs = jobs.get("jobs", [])
+    for i, job in enumerate(jobs):
+        if not str(job.get("id") or "").strip(): job["id"] = f"job{i + 1:04d}"
+    return jobs
+
+def _parse_date(v):
+    if v in (None, ""): return None
+    if isinstance(v, (date, datetime)): return v
+    return datetime.strptime(str(v).strip()[:10], "%Y-%m-%d").date()
+
+def normalize_media(media):
+    # 與 UI 相同的規則：秒數 key 轉 int、區域去重複 (UI 的多選本來就不會重複)、分區選滿 6 區視同全省聯播
+    if isinstance(media, str): media = json.loads(media)
+    if not isinstance(media, dict) or not media: raise ValueError("media 設定為空")
+    config = {}
+    for m, cfg in media.items():
+        if m not in PKG_MEDIA and m != CF_MEDIA: raise ValueError(f"未知的媒體: {m}")
+        sec_shares = {int(s): float(v) for s, v in (cfg.get("sec_shares") or {}).items()}
+        if not sec_shares: raise ValueError(f"{m} 未設定秒數")
+        if abs(sum(sec_shares.values()) - 100) > 1e-6: raise ValueError(f"{m} 秒數佔比總和須為 100")
+        share = float(cfg.get("share", 0))
+        if m == CF_MEDIA:
+            config[m] = {"regions": ["全省"], "sec_shares": sec_shares, "share": share}
+            continue
+        regs = list(dict.fromkeys(cfg.get("regions") or []))
+        is_nat = bool(cfg.get("is_national")) or "全省" in regs or len(regs) == len(REGIONS_ORDER)
+        bad = [r for r in regs if r not in REGIONS_ORDER and r != "全省"]
+        if bad: raise ValueError(f"{m} 未知的區域: {', '.join(bad)}")
+        if not is_nat and not regs: raise ValueError(f"{m} 未選擇區域")
+        config[m] = {"is_national": is_nat, "regions": ["全省"] if is_nat else regs, "sec_shares": sec_shares, "share": share}
+    if abs(sum(c["share"] for c in config.values()) - 100) > 1e-6: raise ValueError("媒體預算佔比總和須為 100")
+    return config
+
+def parse_job(job):
+    # 檢查並正規化一筆工作 (批次 / API 共用)；不合法時丟 ValueError
+    from cuesheet.sheet_meta import SHEET_META
+    format_type = job.get("format") or "Dongwu"
+    if format_type not in SHEET_META: raise ValueError(f"未知的格式: {format_type}")
+    budget = int(float(job["budget"]))
+    if budget <= 0: raise ValueError("預算必須大於 0")
+    start_dt, end_dt = _parse_date(job["start"]), _parse_date(job["end"])
+    days_count = (end_dt - start_dt).days + 1
+    if days_count <= 0: raise ValueError("結束日早於開始日")
+    remarks = get_remarks_text(_parse_date(job.get("sign_deadline")), job.get("billing_month", ""), _parse_date(job.get("payment_date")))
+    return {"format": format_type, "budget": budget, "start": start_dt, "end": end_dt, "days": days_count, "config": normalize_media(job["media"]),
+            "client": str(job.get("client", "")), "product": str(job.get("product", "")), "remarks": remarks}
+
+def calc_job(p, pricing):
+    rows, total_list, _ = calculate_plan_data(p["config"], p["budget"], p["days"], pricing)
+    if not rows: raise ValueError("預算不足，沒有可排的檔次")
+    p_str = f"{'、'.join([f'{s}秒' for s in sorted(set(r['seconds'] for r in rows))])} {p['product']}"
+    return rows, total_list, p_str
+
+# ---------- 價格表 ----------
+def load_pricing(pricing_dir=None, share_url=GSHEET_SHARE_URL):
+    if pricing_dir:
+        raw = {}
+        for name in SHEETS:
+            with open(os.path.join(pricing_dir, f"{name}.csv"), "rb") as f: raw[name] = f.read()
+        return PricingIndex.from_frames(read_frames(raw), os.path.basename(os.path.normpath(pricing_dir)))
+    # 批次以最新雲端價格為主；連不上才用本機快照
+    store = ConfigStore(share_url, os.environ.get("CUE_SNAPSHOT_DIR", ".cue_snapshots"),
+                        url_template=os.environ.get("CUE_SHEET_URL_TEMPLATE", GSHEET_CSV_URL), validate=PricingIndex.from_frames)
+    store.refresh() or store.load()
+    frames, version, err = store.current()
+    if frames is None: raise RuntimeError(f"價格表載入失敗: {err or '讀取失敗'}")
+    return PricingIndex.from_frames(frames, version)
+
+# ---------- worker ----------
+_W = {}
+
+def _init_worker(pricing, opts):
+    from cuesheet.template_cache import TemplateCache
+    _W.clear()
+    _W.update(pricing=pricing, opts=opts, templates=TemplateCache(max_items=8), soffice=None, fonts=None)
+
+def _soffice():
+    if _W["soffice"] is None:
+        from cuesheet.soffice_pool import SofficePool
+        pool = SofficePool(size=1, job_timeout=_W["opts"]["pdf_timeout"])
+        # pool worker 結束時 atexit 不會執行，改掛 multiprocessing 的 finalizer
+        mp_util.Finalize(pool, pool.close, exitpriority=10)
+        _W["soffice"] = pool
+    return _W["soffice"]
+
+def _fonts():
+    from cuesheet.font_assets import FontAssets
+    if _W["fonts"] is None: _W["fonts"] = FontAssets(path=os.environ.get("CUE_FONT_PATH", "NotoSansTC-Regular.ttf"))
+    return _W["fonts"]
+
+def web_preview(rows, days_count, start_dt, end_dt, client, p_str, format_type, remarks, total_list, budget, embed_font=True):
+    from cuesheet.html_preview import preview_body, preview_page
+    vat = int(round((budget + PROD_COST) * 0.05))
+    body = preview_body(rows, days_count, start_dt, end_dt, client, p_str, format_type, remarks, total_list, budget + PROD_COST + vat, budget, PROD_COST)
+    return preview_page(_fonts().font_face_css(body) if embed_font else "", body)
+
+def _web_pdf(*args):
+    # 不嵌字型：WeasyPrint 用自己註冊的完整字型
+    from cuesheet.html_preview import html_to_pdf_weasyprint
+    return html_to_pdf_weasyprint(web_preview(*args, embed_font=False), _fonts())
+
+def _run_single(job, p, rows, total_list, p_str, excel_mode, base, res, timings):
+    opts = _W["opts"]
+    format_type, budget, start_dt, end_dt, days_count = p["format"], p["budget"], p["start"], p["end"], p["days"]
+    client, remarks = p["client"], p["remarks"]
+
+    if excel_mode == "stream":
+        from cuesheet.excel_stream import generate_excel_stream
+        t = time.perf_counter()
+        xlsx, err = generate_excel_stream(format_type, start_dt, end_dt, client, p_str, rows, remarks, total_list)
+    else:
+        from cuesheet.excel_render import generate_excel_from_template
+        tpl_path = job.get("template") or opts["templates"].get(format_type)
+        if not tpl_path: raise ValueError(f"未指定 {format_type} 樣板")
+        with open(tpl_path, "rb") as f: template_bytes = f.read()
+        t = time.perf_counter()
+        xlsx, err = generate_excel_from_template(format_type, start_dt, end_dt, client, p_str, rows, remarks, template_bytes, total_list, _W["templates"])
+    timings["excel"] = time.perf_counter() - t
+    if not xlsx: raise ValueError(f"無法生成 Excel: {err}")
+    with open(base + ".xlsx", "wb") as f: f.write(xlsx)
+    res["xlsx"] = os.path.basename(base + ".xlsx")
+
+    if opts["pdf"]:
+        t = time.perf_counter()
+        pdf, errors = None, []  # 每個引擎的失敗原因都留著 (與 api_server._pdf 相同)
+        if opts.get("pdf_engine", "native") == "native":
+            from cuesheet.pdf_render import render_pdf
+            pdf, err = render_pdf(format_type, start_dt, end_dt, client, p_str, rows, remarks, total_list, _fonts())
+            method = "native"
+            if not pdf: errors.append(err)
+        if not pdf:
+            pdf, method, err = _soffice().convert(xlsx)
+            if not pdf: errors.append(err)
+        if not pdf:
+            pdf, err = _web_pdf(rows, days_count, start_dt, end_dt, client, p_str, format_type, remarks, total_list, budget)
+            method = "WeasyPrint"
+            if not pdf: errors.append(err)
+        timings["pdf"] = time.perf_counter() - t
+        reasons = " / ".join(str(e) for e in errors)
+        if pdf:
+            with open(base + ".pdf", "wb") as f: f.write(pdf)
+            res["pdf"], res["pdf_method"] = os.path.basename(base + ".pdf"), method
+            if method == "WeasyPrint": res["warning"] = f"本地轉檔失敗 ({reasons})，使用網頁渲染版"
+        else:
+            res["warning"] = f"PDF 產出失敗 ({reasons})"
+
+def _run_bundle(job, p, rows, total_list, p_str, excel_mode, base, res, timings):
+    # 同一份排程產所有格式：樣板依 --template-* (工作自帶的 template 只套在它自己的 format)，沒有樣板的格式走串流
+    from cuesheet.bundle import render_bundle, bundle_zip
+    from cuesheet.sheet_meta import SHEET_META
+    opts = _W["opts"]
+    templates = {}
+    if excel_mode == "template":
+        paths = {**opts["templates"], **({p["format"]: job["template"]} if job.get("template") else {})}
+        for fmt, path in paths.items():
+            if fmt not in SHEET_META: continue
+            with open(path, "rb") as f: templates[fmt] = f.read()
+    t = time.perf_counter()
+    items = render_bundle(p["start"], p["end"], p["client"], p_str, rows, p["remarks"], total_list, templates=templates,
+                          fonts=_fonts() if opts.get("pdf_engine", "native") == "native" else None, template_cache=_W["templates"],
+                          pdf=opts["pdf"], pdf_fallback=lambda xlsx: _soffice().convert(xlsx))
+    timings["bundle"] = time.perf_counter() - t
+    failed = [it for it in items if it["error"]]
+    if failed: raise ValueError("；".join(f"{it['format']} {it['error']}" for it in failed))
+    with open(base + ".zip", "wb") as f: f.write(bundle_zip(items, os.path.basename(base), {"id": res["id"], "client": p["client"], "pricing_version": _W["pricing"].version}))
+    res["zip"] = os.path.basename(base + ".zip")
+    res["formats"] = {it["format"]: {"excel_mode": it["excel_mode"], "pdf_method": it["pdf_method"]} for it in items}
+    warnings = [f"{it['format']} {it['warning']}" for it in items if it["warning"]]
+    if warnings: res["warning"] = "；".join(warnings)
+
+def run_job(job):
+    opts = _W["opts"]
+    t0 = time.perf_counter()
+    trace = Trace().activate()  # 細部階段 (excel.load / excel.write / pdf.soffice ...) 一併寫進 manifest
+    timings = {}
+    res = {"id": str(job["id"]), "client": job.get("client", ""), "status": "failed", "error": None,
+           "xlsx": None, "pdf": None, "pdf_method": None, "warning": None, "timings": timings, "pid": os.getpid()}
+    try:
+        p = parse_job(job)
+        client = p["client"]
+
+        t = time.perf_counter()
+        rows, total_list, p_str = calc_job(p, _W["pricing"])
+        timings["calc"] = time.perf_counter() - t
+        res["total_spots"] = sum(r["spots"] for r in rows)
+        res["total_list"] = total_list
+
+        excel_mode = job.get("excel_mode") or opts.get("excel_mode", "template")
+        if excel_mode not in ("template", "stream"): raise ValueError(f"未知的 Excel 模式: {excel_mode}")
+        base = os.path.join(opts["out"], f"{safe_filename(res['id'])}_{safe_filename(client) or 'cue'}")
+
+        if opts.get("bundle"): _run_bundle(job, p, rows, total_list, p_str, excel_mode, base, res, timings)
+        else: _run_single(job, p, rows, total_list, p_str, excel_mode, base, res, timings)
+        res["status"] = "ok"
+    except Exception as e:
+        res["error"] = f"{type(e).__name__}: {e}"
+        if opts.get("traceback"): res["traceback"] = traceback.format_exc()
+    timings["total"] = time.perf_counter() - t0
+    stages = res["stages"] = {}
+    for sp in trace.spans: stages[sp["span"]] = round(stages.get(sp["span"], 0) + sp["ms"], 3)
+    return res
+
+# ---------- 主程序 ----------
+def run_batch(jobs, pricing, out_dir, templates=None, workers=None, pdf=True, pdf_timeout=60, progress=None, keep_traceback=False, excel_mode="template", pdf_engine="native", bundle=False):
+    os.makedirs(out_dir, exist_ok=True)
+    opts = {"out": out_dir, "templates": templates or {}, "pdf": pdf, "pdf_timeout": pdf_timeout, "traceback": keep_traceback, "excel_mode": excel_mode, "pdf_engine": pdf_engine, "bundle": bundle}
+    t0 = time.perf_counter()
+    results = [None] * len(jobs)
+    done = 0
+
+    def finish(i, res):
+        nonlocal done
+        results[i] = res
+        done += 1
+        if progress: progress(done, len(jobs), res)
+
+    if workers == 0:
+        # 不開 process (除錯用)
+        _init_worker(pricing, opts)
+        for i, job in enumerate(jobs): finish(i, run_job(job))
+    else:
+        def failed(i, error): return {"id": str(jobs[i].get("id")), "client": jobs[i].get("client", ""), "status": "failed", "error": error, "timings": {}}
+        retry = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pricing, opts)) as ex:
+            futures = {ex.submit(run_job, job): i for i, job in enumerate(jobs)}
+            for fut in as_completed(futures):
+                i = futures[fut]
+                try: finish(i, fut.result())
+                except BrokenProcessPool: retry.append(i)
+                except Exception as e: finish(i, failed(i, f"{type(e).__name__}: {e}"))
+        # pool 壞掉時同一批的工作都會失敗，分不出是誰弄掛的：逐筆在單獨的 worker 重跑一次
+        ex = None
+        for i in sorted(retry):
+            if ex is None: ex = ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(pricing, opts))
+            try: finish(i, ex.submit(run_job, jobs[i]).result())
+            except BrokenProcessPool:
+                finish(i, failed(i, "worker 異常結束"))
+                ex.shutdown(wait=False)
+                ex = None
+            except Exception as e: finish(i, failed(i, f"{type(e).__name__}: {e}"))
+        if ex is not None: ex.shutdown()
+
+    ok = sum(1 for r in results if r["status"] == "ok")
+    manifest = {
+        "created": datetime.now().isoformat(timespec="seconds"), "pricing_version": pricing.version,
+        "workers": workers, "pdf": pdf, "pdf_engine": pdf_engine, "excel_mode": excel_mode, "bundle": bundle, "total": len(jobs), "ok": ok, "failed": len(jobs) - ok,
+        "elapsed": time.perf_counter() - t0, "jobs": results,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+    return manifest
+
+def _print_progress(n, total, res):
+    msg = "ok" if res["status"] == "ok" else f"FAILED {res['error']}"
+    if res.get("warning"): msg += f" ({res['warning']})"
+    print(f"[{n}/{total}] {res['id']} {msg} {res['timings'].get('total', 0):.2f}s", file=sys.stderr, flush=True)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="批次產生 Cue 表 (Excel / PDF)")
+    ap.add_argument("jobs", help="工作檔 (.json / .csv)")
+    ap.add_argument("--out", default="cue_out", help="輸出目錄")
+    ap.add_argument("--pricing-dir", help="本機價格表目錄 (Stores.csv / Factors.csv / Pricing.csv)；未指定則讀雲端 (失敗時用本機快照)")
+    ap.add_argument("--template-dongwu", default=os.environ.get("CUE_TEMPLATE_DONGWU"), help="東吳樣板 (.xlsx)")
+    ap.add_argument("--template-shenghuo", default=os.environ.get("CUE_TEMPLATE_SHENGHUO"), help="聲活樣板 (.xlsx)")
+    ap.add_argument("--excel-mode", choices=("template", "stream"), default="template", help="template = 套樣板 (擬真)；stream = 不讀樣板的快速輸出")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="平行 process 數 (0 = 不開 process)")
+    ap.add_argument("--no-pdf", action="store_true", help="只產 Excel")
+    ap.add_argument("--bundle", action="store_true", help="每筆工作產出所有格式 (Excel + PDF) 打包成一個 ZIP")
+    ap.add_argument("--pdf-engine", choices=("native", "soffice"), default=os.environ.get("CUE_PDF_ENGINE", "native"), help="native = 直接從排程排版；soffice = 由 Excel 經 LibreOffice 轉檔")
+    ap.add_argument("--pdf-timeout", type=int, default=int(os.environ.get("CUE_SOFFICE_TIMEOUT", "60")))
+    ap.add_argument("--traceback", action="store_true", help="manifest 中保留失敗的 traceback")
+    args = ap.parse_args(argv)
+
+    jobs = load_jobs(args.jobs)
+    pricing = load_pricing(args.pricing_dir)
+    templates = {"Dongwu": args.template_dongwu, "Shenghuo": args.template_shenghuo}
+    print(f"{len(jobs)} 筆工作，價格表 {pricing.version}，{args.workers} workers", file=sys.stderr)
+    manifest = run_batch(jobs, pricing, args.out, {k: v for k, v in templates.items() if v}, args.workers,
+                         not args.no_pdf, args.pdf_timeout, _print_progress, args.traceback, args.excel_mode, args.pdf_engine, args.bundle)
+    print(f"完成 {manifest['ok']}/{manifest['total']}，失敗 {manifest['failed']}，{manifest['elapsed']:.1f}s → {os.path.join(args.out, 'manifest.json')}", file=sys.stderr)
+    return 0 if manifest["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
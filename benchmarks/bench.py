@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+from datetime import datetime
+from benchmarks.fixtures import PLAN_SIZES, plan_case, pricing_index, template_bytes, nudge_config
+
+# =========================================================
+# 效能基準測試
+# 熱路徑逐段量測：計算 / Excel 渲染 (樣板版、增量、串流版) / HTML 預覽 / PDF (原生排版、LibreOffice、WeasyPrint)，
+# 每段跑在不同規模的計畫上 (PLAN_SIZES)，報告延遲百分位數、吞吐量與記憶體峰值 (tracemalloc)。
+# 記憶體另外跑一次量，不影響計時。結果存成 JSON，可當作基準線與之後的結果比較，
+# 中位數變慢超過門檻的項目會標出來 (並以 exit code 1 結束，方便接 CI)。
+#
+#   python -m benchmarks.bench --save benchmarks/baseline.json
+#   python -m benchmarks.bench --compare benchmarks/baseline.json --threshold 0.2
+#
+# 沒有 LibreOffice / WeasyPrint / 中文字型 (--font) 的環境，對應的 PDF 項目會標成 skipped。
+# =========================================================
+STAGES = ("calc", "excel", "excel_incremental", "excel_stream", "html", "pdf_native", "pdf_soffice", "pdf_web", "bundle")
+FORMATS = ("Dongwu", "Shenghuo")
+PROD_COST = 10000
+
+def percentile(sorted_vals, q):
+    if not sorted_vals: return None
+    k = (len(sorted_vals) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup): fn()
+    times = []
+    t_all = time.perf_counter()
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    wall = time.perf_counter() - t_all
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    times.sort()
+    return {
+        "n": repeat, "min": times[0], "mean": sum(times) / repeat, "max": times[-1],
+        "p50": percentile(times, 0.5), "p90": percentile(times, 0.9), "p99": percentile(times, 0.99),
+        "ops_per_s": repeat / wall if wall > 0 else None, "peak_kb": peak / 1024,
+    }
+
+# ---------- 各段 ----------
+class Bench:
+    def __init__(self, font_path=None):
+        from cuesheet.template_cache import TemplateCache
+        self.pricing = pricing_index()
+        self.templates = {f: template_bytes(f) for f in FORMATS}
+        self.template_cache = TemplateCache()
+        self.font_path = font_path
+        self._fonts = None
+        self._soffice = None
+
+    def plan(self, size):
+        from cuesheet.planner import calculate_plan_data
+        case = plan_case(size)
+        rows, total_list, _ = calculate_plan_data(case["config"], case["budget"], case["days"], self.pricing)
+        p_str = f"{'、'.join([f'{s}秒' for s in sorted(set(r['seconds'] for r in rows))])} 布丁"
+        return case, rows, total_list, p_str
+
+    def calc(self, size, fmt):
+        from cuesheet.planner import calculate_plan_data
+        case = plan_case(size)
+        return lambda: calculate_plan_data(case["config"], case["budget"], case["days"], self.pricing)
+
+    def excel(self, size, fmt):
+        from cuesheet.excel_render import generate_excel_from_template
+        case, rows, total_list, p_str = self.plan(size)
+        return lambda: generate_excel_from_template(fmt, case["start"], case["end"], "客戶", p_str, rows, ["r1", "r2"], self.templates[fmt], total_list, self.template_cache)[0]
+
+    def excel_incremental(self, size, fmt):
+        # 同一個 session 來回拉秒數比例：兩份計畫只差一個媒體區塊，每次都走增量更新
+        from cuesheet.planner import calculate_plan_data
+        from cuesheet.excel_incremental import IncrementalExcel
+        case, rows, total_list, p_str = self.plan(size)
+        nudged = nudge_config(case["config"])
+        if nudged is None: return None, "計畫只有一種秒數"
+        rows2, total_list2, _ = calculate_plan_data(nudged, case["budget"], case["days"], self.pricing)
+        plans = [(rows, total_list), (rows2, total_list2)]
+        inc = IncrementalExcel()
+        n = [0]
+        def run():
+            n[0] += 1
+            r, t = plans[n[0] % 2]
+            return inc.render(fmt, case["start"], case["end"], "客戶", p_str, r, ["r1", "r2"], self.templates[fmt], t, self.template_cache)[0]
+        run()
+        return run, None
+
+    def excel_stream(self, size, fmt):
+        from cuesheet.excel_stream import generate_excel_stream
+        case, rows, total_list, p_str = self.plan(size)
+        return lambda: generate_excel_stream(fmt, case["start"], case["end"], "客戶", p_str, rows, ["r1", "r2"], total_list)[0]
+
+    def html(self, size, fmt):
+        from cuesheet.font_assets import FontAssets
+        from cuesheet.html_preview import preview_body, preview_page
+        case, rows, total_list, p_str = self.plan(size)
+        if self._fonts is None and self.font_path: self._fonts = FontAssets(path=self.font_path)
+        budget = case["budget"]
+        vat = int(round((budget + PROD_COST) * 0.05))
+        def run():
+            body = preview_body(rows, case["days"], case["start"], case["end"], "客戶", p_str, fmt, ["r1", "r2"], total_list, budget + PROD_COST + vat, budget, PROD_COST)
+            return preview_page(self._fonts.font_face_css(body) if self._fonts else "", body)
+        return run
+
+    def pdf_native(self, size, fmt):
+        from cuesheet.font_assets import FontAssets
+        from cuesheet.pdf_render import render_pdf
+        if not self.font_path: return None, "沒有字型 (--font)"
+        if self._fonts is None: self._fonts = FontAssets(path=self.font_path)
+        case, rows, total_list, p_str = self.plan(size)
+        def run():
+            pdf, err = render_pdf(fmt, case["start"], case["end"], "客戶", p_str, rows, ["r1", "r2"], total_list, self._fonts)
+            if not pdf: raise RuntimeError(err)
+        return run, None
+
+    def pdf_soffice(self, size, fmt):
+        from cuesheet.soffice_pool import SofficePool, find_soffice_path
+        if not find_soffice_path(): return None, "找不到 LibreOffice"
+        if self._soffice is None: self._soffice = SofficePool(size=1)
+        xlsx = self.excel(size, fmt)()
+        def run():
+            pdf, _, err = self._soffice.convert(xlsx)
+            if not pdf: raise RuntimeError(err)
+        return run, None
+
+    def pdf_web(self, size, fmt):
+        try: import weasyprint  # noqa: F401
+        except Exception as e: return None, f"weasyprint 無法使用 ({e})"
+        from cuesheet.html_preview import html_to_pdf_weasyprint
+        html = self.html(size, fmt)()
+        def run():
+            pdf, err = html_to_pdf_weasyprint(html, self._fonts)
+            if not pdf: raise RuntimeError(err)
+        return run, None
+
+    def bundle(self, size, fmt):
+        # 所有格式 Excel (套樣板) + PDF (有字型時) 一起打包；對照 excel / pdf_native 各格式相加看平行省下多少
+        from cuesheet.font_assets import FontAssets
+        from cuesheet.bundle import render_bundle, bundle_zip
+        if self._fonts is None and self.font_path: self._fonts = FontAssets(path=self.font_path)
+        case, rows, total_list, p_str = self.plan(size)
+        def run():
+            items = render_bundle(case["start"], case["end"], "客戶", p_str, rows, ["r1", "r2"], total_list, templates=self.templates,
+                                  fonts=self._fonts, template_cache=self.template_cache, pdf=self._fonts is not None)
+            bad = [it["error"] or it["warning"] for it in items if it["error"] or it["warning"]]
+            if bad: raise RuntimeError(bad[0])
+            return bundle_zip(items)
+        return run
+
+    def close(self):
+        if self._soffice is not None: self._soffice.close()
+
+def run(stages, sizes, formats, repeat, font_path=None, pdf_repeat=3, progress=None):
+    bench = Bench(font_path)
+    results = {}
+    try:
+        for stage in stages:
+            # 計算與打包 (本身就含所有格式) 與格式無關，只跑一次
+            per_format = stage not in ("calc", "bundle")
+            for fmt in (formats if per_format else formats[:1]):
+                for size in sizes:
+                    key = f"{stage}/{fmt}/{size}" if per_format else f"{stage}/{size}"
+                    fn = getattr(bench, stage)(size, fmt)
+                    skipped = None
+                    if isinstance(fn, tuple): fn, skipped = fn
+                    if fn is None:
+                        results[key] = {"skipped": skipped}
+                    else:
+                        try: results[key] = measure(fn, pdf_repeat if stage.startswith("pdf") or stage == "bundle" else repeat)
+                        except Exception as e: results[key] = {"error": f"{type(e).__name__}: {e}"}
+                    if progress: progress(key, results[key])
+    finally:
+        bench.close()
+    return results
+
+# ---------- 報告 / 比較 ----------
+def environment():
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+        "platform": platform.platform(), "machine": platform.machine(), "cpus": os.cpu_count(),
+    }
+
+def compare(results, baseline, threshold):
+    # 以中位數比較；回傳 [(key, 基準 p50, 本次 p50, 比值, 是否變慢)]
+    rows = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base or "p50" not in base or "p50" not in cur: continue
+        ratio = cur["p50"] / base["p50"] if base["p50"] else float("inf")
+        rows.append((key, base["p50"], cur["p50"], ratio, ratio > 1 + threshold))
+    return rows
+
+def _fmt_ms(v): return f"{v * 1000:9.2f}" if v is not None else "        -"
+
+def print_result(key, r):
+    if "skipped" in r: print(f"{key:<32} skipped: {r['skipped']}", flush=True)
+    elif "error" in r: print(f"{key:<32} ERROR: {r['error']}", flush=True)
+    else:
+        print(f"{key:<32} p50{_fmt_ms(r['p50'])} ms  p90{_fmt_ms(r['p90'])} ms  p99{_fmt_ms(r['p99'])} ms  "
+              f"{r['ops_per_s']:9.1f} ops/s  peak {r['peak_kb']:9.0f} KB", flush=True)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Cue 表熱路徑基準測試")
+    ap.add_argument("--stages", default=",".join(STAGES), help=f"要跑的項目 ({', '.join(STAGES)})")
+    ap.add_argument("--sizes", default=",".join(PLAN_SIZES), help=f"計畫規模 ({', '.join(PLAN_SIZES)})")
+    ap.add_argument("--formats", default=",".join(FORMATS))
+    ap.add_argument("--repeat", type=int, default=30, help="每項重複次數 (PDF 另計)")
+    ap.add_argument("--pdf-repeat", type=int, default=3)
+    ap.add_argument("--quick", action="store_true", help="每項只跑 5 次 (PDF 1 次)")
+    ap.add_argument("--font", default=os.environ.get("CUE_FONT_PATH", "NotoSansTC-Regular.ttf"), help="預覽嵌入的字型 (不存在則不嵌字型)")
+    ap.add_argument("--save", help="結果存成 JSON (可當基準線)")
+    ap.add_argument("--compare", help="與此基準線 JSON 比較")
+    ap.add_argument("--threshold", type=float, default=0.2, help="中位數變慢超過此比例即標示 (預設 0.2 = 20%%)")
+    args = ap.parse_args(argv)
+
+    stages = [s for s in args.stages.split(",") if s]
+    bad = [s for s in stages if s not in STAGES]
+    if bad: ap.error(f"未知的項目: {', '.join(bad)}")
+    sizes = [s for s in args.sizes.split(",") if s]
+    bad = [s for s in sizes if s not in PLAN_SIZES]
+    if bad: ap.error(f"未知的規模: {', '.join(bad)}")
+    repeat, pdf_repeat = (5, 1) if args.quick else (args.repeat, args.pdf_repeat)
+    font = args.font if args.font and os.path.exists(args.font) else None
+
+    results = run(stages, sizes, [f for f in args.formats.split(",") if f], repeat, font, pdf_repeat, print_result)
+    report = {"env": {**environment(), "repeat": repeat, "pdf_repeat": pdf_repeat, "font": bool(font)}, "results": results}
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"結果已存到 {args.save}")
+
+    if not args.compare: return 0
+    with open(args.compare, encoding="utf-8") as f: baseline = json.load(f)
+    rows = compare(results, baseline.get("results", {}), args.threshold)
+    print(f"\n與基準線比較 ({args.compare}，{baseline.get('env', {}).get('created', '?')})：")
+    for key, base, cur, ratio, slow in rows:
+        print(f"{key:<32} {_fmt_ms(base)} → {_fmt_ms(cur)} ms  x{ratio:5.2f}{'  ⚠️ 變慢' if slow else ''}")
+    slow = [r for r in rows if r[4]]
+    print(f"{len(slow)} 項變慢超過 {args.threshold:.0%}" if slow else "沒有明顯變慢的項目")
+    return 1 if slow else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+import sys
+import io
+import argparse
+from benchmarks.fixtures import PLAN_SIZES, plan_case, pricing_index, template_bytes, nudge_config
+
+# =========================================================
+# 串流 Excel 與樣板版逐格比對
+# 兩條路徑的列號不一定相同 (樣板的空白區塊、anchor 列可能不同)，所以先各自抽出「內容」再比：
+# 表頭各欄、日期起始、每一資料列 (站名 / 地區 / 店數 / 時段 / 秒數 / 單價 / 總價 / 每日檔次 / 小計)、
+# Total 列每日合計與總價、頁尾金額、Remarks、工作表 (分頁) 名稱。樣式 / 欄寬不比。
+# 另外檢查金額欄 (sheet_meta.MONEY_COLS) 只出現在最後一張工作表；樣板版的每張工作表都要有樣板的 logo、
+# 列印標題、涵蓋到最後一列的列印範圍，以及跟著區塊列數延伸到 Total 前一列的格式化條件 / 資料驗證。
+# --incremental 改比增量渲染：先渲染原計畫、再拉一下秒數比例 (nudge_config) 增量更新，與整本重畫的結果比對。
+# --scenarios 改比排程計算：隨機產生的計畫一次丟進批次版 (evaluate_scenarios)，每一筆與單筆版 calculate_plan_data
+# 的 rows / List 總價 / Debug 紀錄逐項比對 (型別也要相同，例如每日檔次都是 array("I"))。
+# --pdf 改檢查原生 PDF 的結構：xref 每筆位移都指到對應的 "N 0 obj"、/Info 是間接物件、同一計畫輸出位元組相同、
+# 頁數與 Kids 一致、橫向切段的頁都在 (把 DAY_MIN_W 放大強迫一個月切成多段)、沒有中文字型時回傳錯誤而不是丟例外。
+# 字型用 CUE_FONT_PATH (與 batch_cli 相同)。
+#
+#   python -m benchmarks.fidelity                 # 所有規模 × 兩種格式
+#   python -m benchmarks.fidelity --sizes l,long -v
+#   python -m benchmarks.fidelity --incremental
+#   python -m benchmarks.fidelity --scenarios --count 500 --seed 1
+#   CUE_FONT_PATH=/path/NotoSansTC-Regular.ttf python -m benchmarks.fidelity --pdf
+# =========================================================
+FORMATS = ("Dongwu", "Shenghuo")
+
+def _col(letter):
+    from openpyxl.utils import column_index_from_string
+    return column_index_from_string(letter)
+
+def _value(ws, row, col):
+    # 合併範圍內的格子取左上角的值
+    for mr in ws.merged_cells.ranges:
+        if mr.min_row <= row <= mr.max_row and mr.min_col <= col <= mr.max_col: return ws.cell(mr.min_row, mr.min_col).value
+    return ws.cell(row, col).value
+
+def extract(xlsx, format_type):
+    import openpyxl
+    from cuesheet.sheet_meta import SHEET_META
+    meta = SHEET_META[format_type]
+    cols = {k: _col(v) for k, v in meta["cols"].items()}
+    day0, total_c = _col(meta["schedule_start_col"]), _col(meta["total_col"])
+    money_c = cols.get("pkg", cols.get("rate"))
+    labels = {v: k for k, v in meta["footer_labels"].items()}
+    wb = openpyxl.load_workbook(io.BytesIO(xlsx))
+    pages = []
+    for ws in wb:
+        page = {"title": ws.title, "header": {k: ws[a].value for k, a in meta["header_cells"].items()},
+                "date": ws[meta["date_start_cell"]].value, "rows": [], "total": None, "footer": {}, "remarks": []}
+        remarks = False
+        for r in range(ws[meta["date_start_cell"]].row + 2, ws.max_row + 1):
+            b = ws.cell(r, 2).value
+            if remarks:
+                if b: page["remarks"].append(b)
+                continue
+            if b == "Remarks：":
+                remarks = True
+            elif b == meta["total_label"]:
+                page["total"] = ([ws.cell(r, day0 + i).value for i in range(meta["max_days"])], ws.cell(r, total_c).value, ws.cell(r, money_c).value)
+            elif b in labels:
+                page["footer"][labels[b]] = ws.cell(r, money_c).value
+            elif ws.cell(r, cols["location"]).value not in (None, ""):
+                page["rows"].append(tuple(_value(ws, r, c) for c in cols.values()) + tuple(ws.cell(r, day0 + i).value for i in range(meta["max_days"])) + (ws.cell(r, total_c).value,))
+        pages.append(page)
+    return pages
+
+def money_misplaced(pages, format_type):
+    # 金額欄 (單價 / 總價) 只能在最後一張工作表，而且最後一張要有
+    from cuesheet.sheet_meta import SHEET_META, MONEY_COLS
+    keys = list(SHEET_META[format_type]["cols"])
+    idx = [keys.index(k) for k in MONEY_COLS if k in keys]
+    out = []
+    for i, p in enumerate(pages):
+        filled = [row for row in p["rows"] if any(row[j] not in (None, "") for j in idx)]
+        last = i == len(pages) - 1
+        if not last and filled: out.append((f"{p['title']}/money", "空白", len(filled)))
+        if last and len(filled) != len(p["rows"]): out.append((f"{p['title']}/money", len(p["rows"]), len(filled)))
+    return out
+
+def sheet_extras(ws, total_label):
+    from openpyxl.utils import range_boundaries
+    total = next((c.row for c in ws["B"] if c.value == total_label), None)
+    last = max(c.row for row in ws.iter_rows() for c in row if c.value not in (None, ""))
+    def end(ref): return range_boundaries(ref.split("!")[-1].replace("$", ""))[3]
+    return {"images": sorted((i.anchor._from.row, i.anchor._from.col) for i in ws._images), "titles": ws.print_title_rows,
+            "area_covers": bool(ws.print_area) and max(end(r) for r in ws.print_area.split(",")) >= last,
+            "cf": [(end(r) == total - 1, len(cf.rules)) for cf in ws.conditional_formatting for r in str(cf.sqref).split()],
+            "dv": [end(r) == total - 1 for dv in ws.data_validations.dataValidation for r in str(dv.sqref).split()]}
+
+def extras_missing(xlsx, template, format_type):
+    # 樣板版每張工作表 (含 copy_worksheet 複製出來的月份) 與樣板本身比
+    import openpyxl
+    from cuesheet.sheet_meta import SHEET_META
+    label = SHEET_META[format_type]["total_label"]
+    want = sheet_extras(openpyxl.load_workbook(io.BytesIO(template)).worksheets[0], label)
+    out = []
+    for ws in openpyxl.load_workbook(io.BytesIO(xlsx)).worksheets:
+        got = sheet_extras(ws, label)
+        out += [(f"{ws.title}/{k}", want[k], got[k]) for k in want if got[k] != want[k]]
+    return out
+
+def diff(a, b):
+    # 回傳 [(位置, 樣板版, 串流版)]
+    out = []
+    if len(a) != len(b): out.append(("pages", [p["title"] for p in a], [p["title"] for p in b]))
+    for pa, pb in zip(a, b):
+        t = pa["title"]
+        for key in ("title", "header", "date", "total", "footer", "remarks"):
+            if pa[key] != pb[key]: out.append((f"{t}/{key}", pa[key], pb[key]))
+        # 樣板版資料列依樣板中區塊的上下順序，串流版固定 廣播 / 新鮮視 / 家樂福；比對時不計順序
+        ra, rb = sorted(pa["rows"], key=repr), sorted(pb["rows"], key=repr)
+        if len(ra) != len(rb): out.append((f"{t}/rows", len(ra), len(rb)))
+        for i, (x, y) in enumerate(zip(ra, rb)):
+            if x != y: out.append((f"{t}/row{i}", x, y))
+    return out
+
+def run(sizes, formats, verbose=False):
+    from cuesheet.planner import calculate_plan_data
+    from cuesheet.excel_render import generate_excel_from_template
+    from cuesheet.excel_stream import generate_excel_stream
+    pricing = pricing_index()
+    failed = 0
+    for size in sizes:
+        case = plan_case(size)
+        rows, total_list, _ = calculate_plan_data(case["config"], case["budget"], case["days"], pricing)
+        p_str = f"{'、'.join([f'{s}秒' for s in sorted(set(r['seconds'] for r in rows))])} 布丁"
+        args = (case["start"], case["end"], "客戶", p_str, rows, ["r1", "r2"])
+        for fmt in formats:
+            xa, err_a = generate_excel_from_template(fmt, *args, template_bytes(fmt), total_list)
+            xb, err_b = generate_excel_stream(fmt, *args, total_list)
+            if err_a or err_b:
+                print(f"{fmt + '/' + size:<20} ERROR 樣板版: {err_a} / 串流版: {err_b}")
+                failed += 1
+                continue
+            pa, pb = extract(xa, fmt), extract(xb, fmt)
+            diffs = diff(pa, pb) + money_misplaced(pa, fmt) + money_misplaced(pb, fmt) + extras_missing(xa, template_bytes(fmt), fmt)
+            print(f"{fmt + '/' + size:<20} {'OK' if not diffs else f'{len(diffs)} 處不同'}  ({len(xa) / 1024:.0f} KB → {len(xb) / 1024:.0f} KB)")
+            if diffs: failed += 1
+            if verbose:
+                for where, x, y in diffs[:20]: print(f"    {where}: {x!r} ≠ {y!r}")
+    return failed
+
+def run_incremental(sizes, formats, verbose=False):
+    from cuesheet.planner import calculate_plan_data
+    from cuesheet.excel_render import generate_excel_from_template
+    from cuesheet.excel_incremental import IncrementalExcel
+    pricing = pricing_index()
+    failed = 0
+    for size in sizes:
+        case = plan_case(size)
+        nudged = nudge_config(case["config"])
+        if nudged is None:
+            print(f"{size:<20} skipped (只有一種秒數)")
+            continue
+        plans = [calculate_plan_data(cfg, case["budget"], case["days"], pricing)[:2] for cfg in (case["config"], nudged)]
+        for fmt in formats:
+            tpl, inc = template_bytes(fmt), IncrementalExcel()
+            for i, (rows, total_list) in enumerate(plans):
+                args = (fmt, case["start"], case["end"], f"客戶{i}", "布丁", rows, ["r1", "r2", "r3"][:2 + i], tpl, total_list)
+                xb, err_b = inc.render(*args)
+            xa, err_a = generate_excel_from_template(*args)
+            st = inc.stats()
+            if err_a or err_b or st["partial"] != 1:
+                print(f"{fmt + '/' + size:<20} ERROR 整本: {err_a} / 增量: {err_b} {st}")
+                failed += 1
+                continue
+            diffs = diff(extract(xa, fmt), extract(xb, fmt)) + extras_missing(xb, tpl, fmt)
+            print(f"{fmt + '/' + size:<20} {'OK' if not diffs else f'{len(diffs)} 處不同'}  (重寫 {st['sections_written']} 個區塊，略過 {st['sections_skipped']} 個)")
+            if diffs: failed += 1
+            if verbose:
+                for where, x, y in diffs[:20]: print(f"    {where}: {x!r} ≠ {y!r}")
+    return failed
+
+def random_config(rng):
+    # 隨機挑媒體 / 佔比 / 區域 / 秒數比例；佔比或秒數比例可能是 0 (單筆版會略過該 line)
+    from cuesheet.pricing import REGIONS_ORDER, DURATIONS, PKG_MEDIA, CF_MEDIA
+    media = rng.sample((*PKG_MEDIA, CF_MEDIA), rng.randint(1, len(PKG_MEDIA) + 1))
+    cuts = sorted(rng.randint(0, 100) for _ in media[1:])
+    shares = [b - a for a, b in zip([0, *cuts], [*cuts, 100])]
+    config = {}
+    for m, share in zip(media, shares):
+        secs = rng.sample(DURATIONS, rng.randint(1, len(DURATIONS)))
+        sec_cuts = sorted(rng.randint(0, 100) for _ in secs[1:])
+        sec_shares = {sec: b - a for sec, a, b in zip(secs, [0, *sec_cuts], [*sec_cuts, 100])}
+        if m == CF_MEDIA:
+            config[m] = {"regions": ["全省"], "sec_shares": sec_shares, "share": share}
+            continue
+        national = rng.random() < 0.3
+        regions = ["全省"] if national else rng.sample(REGIONS_ORDER, rng.randint(1, len(REGIONS_ORDER)))
+        config[m] = {"is_national": national, "regions": regions, "sec_shares": sec_shares, "share": share}
+    return config
+
+def run_scenarios(count, seed, verbose=False):
+    import random
+    from cuesheet.planner import calculate_plan_data
+    from cuesheet.scenarios import evaluate_scenarios
+    pricing = pricing_index()
+    rng = random.Random(seed)
+    failed = 0
+    # 同一批的走期天數相同；分幾批涵蓋短走期到跨月
+    for days in (1, 7, 31, 95):
+        scenarios = [(random_config(rng), rng.choice((0, 1, 5000, 80000, 300000, 1234567, 10 ** 7))) for _ in range(count)]
+        res = evaluate_scenarios(pricing, scenarios, days)
+        bad = 0
+        for i, (config, budget) in enumerate(scenarios):
+            rows, total_list, logs = calculate_plan_data(config, budget, days, pricing)
+            b_rows, b_total, b_logs = res.result(i)
+            diffs = [k for k, x, y in (("rows", rows, b_rows), ("total_list", total_list, b_total), ("debug", logs, b_logs)) if x != y]
+            diffs += [f"rows[{j}].{k}" for j, (x, y) in enumerate(zip(rows, b_rows)) for k in x if type(x[k]) is not type(y.get(k))]
+            if not diffs: continue
+            bad += 1
+            if verbose: print(f"    days={days} #{i} {', '.join(diffs[:5])}: {config} 預算 {budget}")
+        print(f"{f'{days} 天 × {count} 筆':<20} {'OK' if not bad else f'{bad} 筆不同'}")
+        if bad: failed += 1
+    return failed
+
+def pdf_objects(pdf):
+    import re
+    return {int(m.group(1)): m.group(2) for m in re.finditer(rb"(\d+) 0 obj\n(.*?)\nendobj\n", pdf, re.S)}
+
+def pdf_stream(body):
+    import zlib
+    return zlib.decompress(body[body.index(b"stream\n") + 7:body.rindex(b"\nendstream")])
+
+def pdf_problems(pdf):
+    # xref / trailer / 頁面樹的結構檢查；回傳 (問題清單, 每頁文字)
+    import re
+    out = []
+    xref = int(pdf[pdf.rindex(b"startxref") + 9:].split()[0])
+    if not pdf.startswith(b"xref", xref): return [("startxref", xref, "不是 xref")], []
+    head = pdf[xref:].split(b"\n", 2)
+    first, n = map(int, head[1].split())
+    entries = head[2][:20 * n].split(b"\n")[:n]
+    for i, e in enumerate(entries[1:], first + 1):
+        off = int(e[:10])
+        if not pdf.startswith(f"{i} 0 obj\n".encode(), off): out.append((f"xref[{i}]", off, pdf[off:off + 12]))
+    trailer = pdf[pdf.rindex(b"trailer"):]
+    size = int(re.search(rb"/Size (\d+)", trailer).group(1))
+    if size != n: out.append(("/Size", n, size))
+    objs = pdf_objects(pdf)
+    info = re.search(rb"/Info (\d+) 0 R", trailer)
+    if info is None or b"/Producer" not in objs.get(int(info.group(1)), b""): out.append(("/Info", "間接物件", trailer[:120]))
+    if b"/CreationDate" in pdf: out.append(("/CreationDate", "不應出現", "有"))
+    pages = next(b for b in objs.values() if b.startswith(b"<< /Type /Pages"))
+    kids = [int(k) for k in re.findall(rb"(\d+) 0 R", pages)]
+    count = int(re.search(rb"/Count (\d+)", pages).group(1))
+    if count != len(kids) or count != sum(b.startswith(b"<< /Type /Page ") for b in objs.values()): out.append(("/Count", len(kids), count))
+    # ToUnicode 把 CID 轉回文字，拿來看每頁的內容
+    cmap = next(pdf_stream(b) for b in objs.values() if b"stream\n" in b and b"/Subtype" not in b[:80] and b"beginbfchar" in pdf_stream(b))
+    uni = {int(c, 16): bytes.fromhex(u.decode()).decode("utf-16-be") for c, u in re.findall(rb"<([0-9A-F]{4})> <([0-9A-F]+)>", cmap)}
+    texts = []
+    for k in kids:
+        data = pdf_stream(objs[int(re.search(rb"/Contents (\d+) 0 R", objs[k]).group(1))])
+        texts.append("".join(uni.get(int(h[i:i + 4], 16), "?") for h in re.findall(rb"<([0-9A-F]*)> Tj", data) for i in range(0, len(h), 4)))
+    return out, texts
+
+def run_pdf(sizes, formats, verbose=False):
+    import os
+    from cuesheet import pdf_render
+    from cuesheet.font_assets import FontAssets
+    from cuesheet.planner import calculate_plan_data
+    from cuesheet.paging import paginate
+    from cuesheet.sheet_meta import SHEET_META
+    pricing = pricing_index()
+    fonts = FontAssets(path=os.environ.get("CUE_FONT_PATH", "NotoSansTC-Regular.ttf"))
+    failed = 0
+    normal = pdf_render.DAY_MIN_W
+    for size in sizes:
+        case = plan_case(size)
+        rows, total_list, _ = calculate_plan_data(case["config"], case["budget"], case["days"], pricing)
+        p_str = f"{'、'.join([f'{s}秒' for s in sorted(set(r['seconds'] for r in rows))])} 布丁"
+        args = (case["start"], case["end"], "客戶", p_str, rows, ["r1", "r2"], total_list)
+        for fmt in formats:
+            for day_w, label in ((normal, ""), (24, " (窄)")):
+                pdf_render.DAY_MIN_W = day_w
+                try:
+                    pdf, err = pdf_render.render_pdf(fmt, *args, fonts)
+                    again, _ = pdf_render.render_pdf(fmt, *args, fonts)
+                    max_cols = pdf_render._Layout(fmt, SHEET_META[fmt], None).max_cols
+                finally:
+                    pdf_render.DAY_MIN_W = normal
+                if err:
+                    print(f"{fmt + '/' + size + label:<24} ERROR {err}")
+                    failed += 1
+                    continue
+                diffs, texts = pdf_problems(pdf)
+                if again != pdf: diffs.append(("bytes", "同一計畫輸出相同", "不同"))
+                # 每個月份頁依寬度切段；多段時表頭標 (i/n)，每段都要有頁
+                n = sum(-(-mp.days // max_cols) for mp in paginate(case["start"], case["days"], SHEET_META[fmt]["max_days"]))
+                if len(texts) < n: diffs.append(("pages", f">= {n}", len(texts)))
+                if n > 1: diffs += [("chunk", f"({i}/{n})", "沒有這一段") for i in range(1, n + 1) if not any(f"({i}/{n})" in t for t in texts)]
+                print(f"{fmt + '/' + size + label:<24} {'OK' if not diffs else f'{len(diffs)} 個問題'}  ({len(texts)} 頁 / {n} 段, {len(pdf) / 1024:.0f} KB)")
+                if diffs: failed += 1
+                if verbose:
+                    for where, x, y in diffs[:20]: print(f"    {where}: {x!r} ≠ {y!r}")
+    # 沒有中文字型：回傳錯誤讓呼叫端改走其他 PDF 路徑，不能丟例外
+    case = plan_case(sizes[0])
+    rows, total_list, _ = calculate_plan_data(case["config"], case["budget"], case["days"], pricing)
+    for fonts, label in ((None, "fonts=None"), (FontAssets(path=os.devnull + ".missing", url=None), "字型檔不存在")):
+        pdf, err = pdf_render.render_pdf(formats[0], case["start"], case["end"], "客戶", "", rows, [], total_list, fonts)
+        ok = pdf is None and bool(err)
+        print(f"{'無字型 / ' + label:<24} {'OK' if ok else f'預期錯誤訊息，得到 {err!r}'}")
+        if not ok: failed += 1
+    return failed
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="串流 Excel 與樣板版內容比對")
+    ap.add_argument("--sizes", default=",".join(PLAN_SIZES))
+    ap.add_argument("--formats", default=",".join(FORMATS))
+    ap.add_argument("-v", "--verbose", action="store_true", help="列出不同的儲存格")
+    ap.add_argument("--incremental", action="store_true", help="比對增量渲染與整本重畫")
+    ap.add_argument("--scenarios", action="store_true", help="比對批次情境試算與單筆版排程計算")
+    ap.add_argument("--count", type=int, default=200, help="--scenarios 每種走期隨機產生幾筆計畫")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--pdf", action="store_true", help="檢查原生 PDF 的結構 (xref、頁數、橫向切段、缺字型)")
+    args = ap.parse_args(argv)
+    if args.scenarios: return 1 if run_scenarios(args.count, args.seed, args.verbose) else 0
+    failed = (run_pdf if args.pdf else run_incremental if args.incremental else run)([s for s in args.sizes.split(",") if s], [f for f in args.formats.split(",") if f], args.verbose)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import io
+from datetime import date, timedelta
+from cuesheet.pricing import REGIONS_ORDER, DURATIONS, PKG_MEDIA, CF_MEDIA, CF_HYPER, CF_SUPER
+
+# =========================================================
+# 合成測資 (基準測試用)
+# 價格表與 東吳 / 聲活 樣板都由程式產生，不需要連 Google Sheet、也不需要真的樣板檔，
+# 每次產出的內容固定 (沒有亂數)，不同機器 / 不同版本的數字才能互相比較。
+# 樣板的版面照 SHEET_META：表頭、日期列、三個媒體區塊 (anchor + 一列樣式來源)、Total / 頁尾 / Remarks，
+# 資料列整排有框線與底色，渲染時複製樣式的成本與真實樣板相近。
+# 也放了真實樣板常見、openpyxl 複製工作表不會帶過去的東西：右上角 logo、列印標題 / 範圍、
+# 每日檔次的設定格式化條件與資料驗證 (fidelity 檢查多月份的每張工作表都有)。
+# =========================================================
+def pricing_frames():
+    import pandas as pd
+    stores, pricing = [], []
+    for i, r in enumerate(REGIONS_ORDER):
+        stores.append((r, f"{r}店", 1000 + 100 * i))
+        stores.append((f"新鮮視_{r}", r, 500 + 10 * i))
+    stores += [("全省", "全省", 4000), ("家樂福_量販", "量販", 68), ("家樂福_超市", "超市", 250)]
+    for m, std in zip(PKG_MEDIA, (720, 504)):
+        for i, r in enumerate(REGIONS_ORDER):
+            pricing.append((m, r, 300000 + 20000 * i, 180000 + 12000 * i, std, "00:00-24:00"))
+        pricing.append((m, "全省", 1500000, 900000, std, "00:00-24:00"))
+    pricing += [(CF_MEDIA, CF_HYPER, 300000, 150000, 420, "09:00-23:00"), (CF_MEDIA, CF_SUPER, 0, 0, 700, "00:00-24:00")]
+    factors = [(m, s, s / 20) for m in (*PKG_MEDIA, CF_MEDIA) for s in DURATIONS]
+    return {
+        "Stores": pd.DataFrame(stores, columns=["Key", "Display_Name", "Count"]),
+        "Factors": pd.DataFrame(factors, columns=["Media", "Seconds", "Factor"]),
+        "Pricing": pd.DataFrame(pricing, columns=["Media", "Region", "List_Price", "Net_Price", "Std_Spots", "Day_Part"]),
+    }
+
+def pricing_index():
+    from cuesheet.pricing import PricingIndex
+    return PricingIndex.from_frames(pricing_frames(), "bench")
+
+def template_bytes(format_type):
+    import openpyxl
+    from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+    from openpyxl.utils import column_index_from_string, get_column_letter
+    from cuesheet.excel_render import SHEET_META
+    meta = SHEET_META[format_type]
+    cols = meta["cols"]
+    first_day = column_index_from_string(meta["schedule_start_col"])
+    last_col = max(column_index_from_string(meta["total_col"]), *(column_index_from_string(c) for c in cols.values()))
+    thin = Side(style="thin")
+    box = Border(left=thin, right=thin, top=thin, bottom=thin)
+    head = PatternFill("solid", fgColor="4472C4" if format_type == "Dongwu" else "BDD7EE")
+    total = PatternFill("solid", fgColor="E2EFDA")
+    center = Alignment(horizontal="center", vertical="center", wrap_text=True)
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = meta["sheet_name"]
+    def styled_row(r, fill=None, bold=False, height=18):
+        ws.row_dimensions[r].height = height
+        for c in range(2, last_col + 1):
+            cell = ws.cell(r, c)
+            cell.border, cell.alignment, cell.font = box, center, Font(name="Arial", size=10, bold=bold)
+            if fill: cell.fill = fill
+
+    ws["B1"] = "Media Schedule"
+    ws["B1"].font = Font(size=16, bold=True)
+    labels = {"client": "客戶名稱", "product": "Product", "period": "Period", "medium": "Medium"}
+    for key, addr in meta["header_cells"].items():
+        if key in labels:
+            ws.cell(ws[addr].row, 2, labels[key])
+            ws.merge_cells(f"{addr}:F{ws[addr].row}")
+
+    # 日期列 (第一格由渲染寫入日期，其餘為公式) + 星期列
+    styled_row(7, head, True, 30)
+    styled_row(8, head, True)
+    for c, title in zip((column_index_from_string(x) for x in cols.values()), ("Station", "Location", "Program", "Day-part", "Size", "rate", "Package-cost")):
+        ws.cell(7, c, title)
+        ws.merge_cells(start_row=7, start_column=c, end_row=8, end_column=c)
+    for i in range(1, meta["max_days"]):
+        ws.cell(7, first_day + i, f"={get_column_letter(first_day + i - 1)}7+1")
+    for i in range(meta["max_days"]):
+        ws.cell(8, first_day + i, f'=MID("一二三四五六日",WEEKDAY({get_column_letter(first_day + i)}7,2),1)')
+    ws.cell(7, column_index_from_string(meta["total_col"]), "檔次")
+
+    # 三個媒體區塊：anchor 列 + 一列樣式來源 + 一列空白
+    r = 9
+    for m in ("全家廣播", "新鮮視", CF_MEDIA):
+        styled_row(r, bold=True, height=24)
+        ws.cell(r, column_index_from_string(cols["station"]), ("" if m == CF_MEDIA else "全家便利商店\n") + meta["anchors"][m])
+        styled_row(r + 1)
+        ws.cell(r + 1, column_index_from_string(cols["location"]), "x")
+        r += 3
+
+    styled_row(r, total, True)
+    ws.cell(r, 2, meta["total_label"])
+    for i, key in enumerate(("make", "vat", "grand")):
+        styled_row(r + 1 + i, total if key == "grand" else None, key == "grand")
+        ws.cell(r + 1 + i, 2, meta["footer_labels"][key])
+    ws.merge_cells(start_row=r + 3, start_column=2, end_row=r + 3, end_column=6)
+    ws.cell(r + 5, 2, "Remarks：")
+    for c in range(first_day, first_day + meta["max_days"]): ws.column_dimensions[get_column_letter(c)].width = 4
+
+    # logo (固定內容的 PNG)、列印標題 / 範圍、每日檔次 (各區塊到 Total 之前) 的格式化條件與資料驗證
+    from PIL import Image as PILImage
+    from openpyxl.drawing.image import Image
+    from openpyxl.formatting.rule import CellIsRule
+    from openpyxl.worksheet.datavalidation import DataValidation
+    png = io.BytesIO()
+    PILImage.new("RGB", (120, 36), (68, 114, 196)).save(png, format="PNG")
+    ws.add_image(Image(io.BytesIO(png.getvalue())), f"{get_column_letter(last_col - 5)}1")
+    ws.print_title_rows = "7:8"
+    ws.print_area = f"B1:{get_column_letter(last_col)}{r + 5}"
+    days = f"{get_column_letter(first_day)}9:{get_column_letter(first_day + meta['max_days'] - 1)}{r - 1}"
+    ws.conditional_formatting.add(days, CellIsRule(operator="greaterThan", formula=["0"], fill=PatternFill("solid", fgColor="FFF2CC")))
+    dv = DataValidation(type="whole", operator="greaterThanOrEqual", formula1="0", allow_blank=True)
+    dv.add(days)
+    ws.add_data_validation(dv)
+
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+# ---------- 計畫規模 ----------
+def plan_config(n_media=1, n_regions=1, n_secs=1, national=False):
+    # n_regions: 分區媒體選幾區 (national=True 時為全省聯播)；n_secs: 每個媒體用幾種秒數 (平均分配佔比)
+    media = (*PKG_MEDIA, CF_MEDIA)[:n_media]
+    secs = DURATIONS[:n_secs]
+    sec_shares = {s: 100 // n_secs + (100 % n_secs if i == 0 else 0) for i, s in enumerate(secs)}
+    config = {}
+    for i, m in enumerate(media):
+        share = 100 // n_media + (100 % n_media if i == 0 else 0)
+        if m == CF_MEDIA: config[m] = {"regions": ["全省"], "sec_shares": dict(sec_shares), "share": share}
+        else: config[m] = {"is_national": national, "regions": ["全省"] if national else REGIONS_ORDER[:n_regions], "sec_shares": dict(sec_shares), "share": share}
+    return config
+
+def nudge_config(config, step=10):
+    # 模擬在 UI 拉一下秒數比例：最後一個有兩種以上秒數的媒體，第一種秒數 +step、最後一種 -step (區塊列數不變)；
+    # 只有一種秒數的計畫回傳 None
+    import copy
+    for m in reversed(list(config)):
+        shares = config[m]["sec_shares"]
+        if len(shares) < 2: continue
+        secs = sorted(shares)
+        step = min(step, shares[secs[-1]] - 1)
+        out = copy.deepcopy(config)
+        out[m]["sec_shares"][secs[0]] += step
+        out[m]["sec_shares"][secs[-1]] -= step
+        return out
+    return None
+
+# 名稱 → (媒體數, 區域數, 秒數種類, 全省聯播, 走期天數, 預算)
+PLAN_SIZES = {
+    "xs": (1, 1, 1, False, 1, 100000),
+    "s": (1, 3, 1, False, 7, 500000),
+    "m": (2, 3, 2, False, 14, 1000000),
+    "l": (3, 5, 3, False, 31, 3000000),
+    "national": (3, 6, 2, True, 31, 3000000),
+    "xl": (3, 5, 12, False, 31, 10000000),
+    "long": (3, 5, 2, False, 120, 10000000),  # 多月分頁
+}
+
+def plan_case(name):
+    n_media, n_regions, n_secs, national, days, budget = PLAN_SIZES[name]
+    start = date(2026, 1, 1)
+    return {
+        "config": plan_config(n_media, n_regions, n_secs, national), "budget": budget, "days": days,
+        "start": start, "end": start + timedelta(days=days - 1),
+    }
@@ -0,0 +1,336 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+import http.server
+from benchmarks.bench import percentile, environment
+from benchmarks.fixtures import pricing_frames, template_bytes
+
+# =========================================================
+# 多人同時使用的負載測試 (Streamlit app)
+# 月底二十個業務同時開 app 時撐不撐得住：在同一個 process 裡開 N 個 AppTest session 同時操作 app.py，
+# 和真的 Streamlit server 一樣共用一份 st.cache_resource (價格表 / 背景渲染佇列 / 產出物快取 / LibreOffice 池)。
+# 每個 session 照業務實際的操作順序：上傳樣板、勾選媒體 (cb_rad / cb_fv / cb_cf)、拉預算佔比、
+# 等背景產出、按下載 (走 download_button 的延後產生)，可選擇中途切換格式再上傳另一份樣板。
+#
+# 價格表改由本機的假 Google Sheet 提供 (benchmarks.fixtures 的合成價格表)，不連外；
+# LibreOffice 換成假的 soffice (固定延遲後寫出一頁 PDF)，量的是排隊 / 池子大小，不是 LibreOffice 本身。
+# 報告：每種操作的 rerun 延遲百分位數、從最後一次調整到可下載的時間、下載延遲、PDF 吞吐量 (含實際渲染份數)、
+# 每個 session 的記憶體 (process RSS 增量平均 + session_state 裡的預覽 / 樣板大小)。
+#
+#   python -m benchmarks.loadtest --sessions 20 --iterations 3 --save loadtest.json
+#   python -m benchmarks.loadtest --sessions 10 --pdf-engine soffice --soffice-delay 1.5   # PDF 全走 (假) LibreOffice
+# =========================================================
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+UPLOAD_KEYS = {"Dongwu": "upl_dw", "Shenghuo": "upl_sh"}
+
+# ---------- 假的價格表來源 / LibreOffice ----------
+def start_pricing_stub():
+    # 與 Google Sheet CSV 匯出相同的介面：GET /<file_id>?sheet=<名稱>
+    csv = {name: df.to_csv(index=False).encode("utf-8") for name, df in pricing_frames().items()}
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            data = csv.get(self.path.rsplit("sheet=", 1)[-1])
+            self.send_response(200 if data else 404)
+            self.send_header("Content-Type", "text/csv")
+            self.end_headers()
+            if data: self.wfile.write(data)
+        def log_message(self, *args): pass
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/{{file_id}}?sheet={{sheet}}"
+
+STUB_SOFFICE = '''#!{python}
+# 假的 soffice：--convert-to pdf --outdir <dir> <檔案>，等一下再寫出一頁空白 PDF
+import os, sys, time
+time.sleep(float(os.environ.get("CUE_STUB_SOFFICE_DELAY", "0.5")))
+outdir, src = sys.argv[sys.argv.index("--outdir") + 1], sys.argv[-1]
+pdf = b"%PDF-1.4\\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj 2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj " \\
+      b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 842 595]>>endobj\\ntrailer<</Root 1 0 R>>\\n%%EOF\\n"
+with open(os.path.join(outdir, os.path.splitext(os.path.basename(src))[0] + ".pdf"), "wb") as f: f.write(pdf)
+'''
+
+def install_stub_soffice(tmp):
+    bin_dir = os.path.join(tmp, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, "soffice")
+    with open(path, "w") as f: f.write(STUB_SOFFICE.format(python=sys.executable))
+    os.chmod(path, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+
+# ---------- 多個 AppTest 同時跑 ----------
+@contextlib.contextmanager
+def shared_runtime():
+    # AppTest 原本一次只跑一個 session：每次 run 都換一個全域的 mock Runtime、跑完設回 None，
+    # 同時也暫時改掉 config (global.appTest)，session id 也固定是同一個。多個 session 同時跑會互相蓋掉
+    # (別人的 rerun 會把你的下載按鈕當成沒人用的檔案清掉)。這裡改成整個負載測試共用一個 Runtime 與 ScriptCache
+    # (真的 server 也是所有 session 共用；各自編譯 app.py 在 Python 3.11 還會因 ast.parse 不是 thread-safe 而失敗)，
+    # config 一開始就設好，每個 thread 各用自己的 session id。
+    from unittest.mock import MagicMock
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.components.v2.component_manager import BidiComponentManager
+    from streamlit.testing.v1 import app_test
+
+    storage = MemoryMediaFileStorage("/mock/media")
+    rt = MagicMock(spec=Runtime)
+    rt.media_file_mgr = MediaFileManager(storage)
+    rt.dataframe_source_mgr = DataframeSourceManager()
+    rt.cache_storage_manager = MemoryCacheStorageManager()
+    rt.bidi_component_registry = BidiComponentManager()
+    rt.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+
+    script_cache = ScriptCache()
+    class SessionScriptRunner(app_test.LocalScriptRunner):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._session_id = threading.current_thread().name
+            self._script_cache = script_cache
+
+    saved = Runtime.__dict__["instance"], Runtime.__dict__["exists"], app_test.patch_config_options, app_test.LocalScriptRunner
+    Runtime.instance = classmethod(lambda cls: rt)
+    Runtime.exists = classmethod(lambda cls: True)
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+    app_test.LocalScriptRunner = SessionScriptRunner
+    config.set_option("global.appTest", True)
+    # AppTest 每次 rerun 都會把 app 既有的警告 (例如空白 label) 連同 stack 印出來，N 個 session 會洗掉報告；
+    # log 等級要在 config 讀進來之後才設 (讀 config 時會重設)
+    set_log_level("error")
+    try: yield rt.media_file_mgr, storage
+    finally:
+        Runtime.instance, Runtime.exists, app_test.patch_config_options, app_test.LocalScriptRunner = saved
+        config.set_option("global.appTest", False)
+
+def rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"): return int(line.split()[1]) * 1024
+    except OSError: pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+# ---------- 單一 session ----------
+class Session:
+    def __init__(self, idx, media, storage, templates, rng, think=0.0, timeout=120, switch_format=False):
+        from streamlit.testing.v1 import AppTest
+        self.idx = idx
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.media, self.storage, self.templates = media, storage, templates
+        self.rng, self.think, self.switch_format = rng, think, switch_format
+        self.format = "Dongwu"
+        self.samples = []    # (操作, 秒數, 是否出錯)
+        self.ready = []      # 最後一次調整 → 下載按鈕出現
+        self.downloads = []  # (種類, 秒數, bytes)
+        self.errors = []
+
+    def _rerun(self, action, change=None):
+        if self.think: time.sleep(self.rng.uniform(0, self.think))
+        t = time.perf_counter()
+        try:
+            if change is not None: change()
+            self.at.run()
+            err = [e.message for e in self.at.exception] + [e.value for e in self.at.error]
+        except Exception as e:
+            err = [f"{type(e).__name__}: {e}"]
+        self.samples.append((action, time.perf_counter() - t, bool(err)))
+        if err: self.errors.append(f"{action}: {err[0]}")
+        return not err
+
+    def _checkbox(self, key, value):
+        try: cb = self.at.checkbox(key=key)
+        except KeyError: return self.errors.append(f"media: 畫面上沒有 {key}")
+        if cb.value != value: self._rerun("media", lambda: cb.set_value(value))
+
+    def _upload(self):
+        up = self.at.file_uploader(key=UPLOAD_KEYS[self.format])
+        self._rerun("upload", lambda: up.set_value((f"{self.format.lower()}.xlsx", self.templates[self.format], XLSX_MIME)))
+
+    def _wait_ready(self, timeout=120):
+        # 背景產出完成前畫面上是「⏳ 背景產生」，這裡和瀏覽器一樣每秒重跑一次直到下載按鈕出現
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < timeout:
+            if not [i for i in self.at.info if "背景" in i.value]:
+                if [b for b in self.at.get("download_button") if b.proto.deferred_file_id]:
+                    self.ready.append(time.perf_counter() - t0)
+                    return True
+                if self.at.error: break
+            time.sleep(0.2)
+            self._rerun("poll")
+        self.errors.append("等不到下載按鈕")
+        return False
+
+    def _download(self, zip_too):
+        for b in self.at.get("download_button"):
+            file_id = b.proto.deferred_file_id
+            if not file_id: continue
+            kind = "zip" if "ZIP" in b.proto.label else "pdf" if "PDF" in b.proto.label else "xlsx"
+            if kind == "zip" and not zip_too: continue
+            t = time.perf_counter()
+            try:
+                url = self.media.execute_deferred(file_id)
+                name = url.rsplit("/", 1)[-1].split(".")[0]
+                size = len(self.storage.get_file(name).content)
+                self.storage.delete_file(name)  # 瀏覽器拿走後就不再佔記憶體
+            except Exception as e:
+                self.errors.append(f"download {kind}: {e}")
+                continue
+            self.downloads.append((kind, time.perf_counter() - t, size))
+
+    def run(self, iterations, zip_every=0):
+        if not self._rerun("open"): return self
+        # 每個業務填自己的客戶，產出物才不會全被別的 session 的快取接走
+        if self.idx >= 0: self._rerun("client", lambda: self.at.text_input[0].set_value(f"客戶 {self.idx:03d}"))
+        for it in range(iterations):
+            if it == 0 or (self.switch_format and it % 2 == 1):
+                if it: self._rerun("format", lambda: self.at.radio[0].set_value("Shenghuo" if self.format == "Dongwu" else "Dongwu"))
+                self.format = self.at.radio[0].value
+                self._upload()
+            # 勾選媒體 → 拉佔比 → 再加一個媒體 → 再拉一次，然後等產出、下載；
+            # 接著試試拿掉廣播再加回來，最後取消勾選回到原狀
+            self._checkbox("cb_fv", True)
+            self._rerun("slider", lambda: self.at.slider(key="rad_share").set_value(self.rng.choice((40, 50, 60, 70))))
+            self._checkbox("cb_cf", True)
+            self._rerun("slider", lambda: self.at.slider(key="fv_share").set_value(self.rng.choice((10, 20, 30))))
+            if self._wait_ready(): self._download(zip_every and (it + 1) % zip_every == 0)
+            self._checkbox("cb_rad", False)
+            self._checkbox("cb_rad", True)
+            self._checkbox("cb_cf", False)
+            self._checkbox("cb_fv", False)
+        return self
+
+    def state_bytes(self):
+        # session_state 裡自己留的大東西：預覽 (含字型) 記憶與上傳的樣板
+        ss = self.at.session_state
+        n = ss["plan_memo"].stats()["bytes"] if "plan_memo" in ss else 0
+        if "templates" in ss: n += sum(len(t["bytes"]) for t in ss["templates"].values())
+        return n
+
+# ---------- 主程序 ----------
+def summarize(values):
+    values = sorted(values)
+    if not values: return {"n": 0}
+    return {"n": len(values), "p50": percentile(values, 0.5), "p90": percentile(values, 0.9), "p99": percentile(values, 0.99),
+            "max": values[-1], "mean": sum(values) / len(values)}
+
+def run(sessions=10, iterations=2, think=0.5, ramp=2.0, seed=0, timeout=120, switch_format=False, zip_every=0, progress=None):
+    from cuesheet.metrics import REGISTRY
+    templates = {f: template_bytes(f) for f in UPLOAD_KEYS}
+    with shared_runtime() as (media, storage):
+        # 先讓一個 session 跑一輪：import、價格表載入、樣板編譯、字型都先暖好，RSS 基準線才不含這些一次性成本
+        warm = Session(-1, media, storage, templates, random.Random(seed), timeout=timeout).run(1)
+        if warm.errors: raise RuntimeError(f"暖機失敗: {warm.errors[0]}")
+        rss0 = rss_bytes()
+        pool = [Session(i, media, storage, templates, random.Random(seed + i + 1), think, timeout, switch_format) for i in range(sessions)]
+        def worker(s, delay):
+            time.sleep(delay)
+            try: s.run(iterations, zip_every)
+            except Exception as e: s.errors.append(f"中斷: {type(e).__name__}: {e}")
+            if progress: progress(s)
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(s, ramp * i / max(1, sessions)), name=f"load-{i}") for i, s in enumerate(pool)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        wall = time.perf_counter() - t0
+        rss1 = rss_bytes()
+
+    samples = [x for s in pool for x in s.samples]
+    downloads = [x for s in pool for x in s.downloads]
+    pdfs = [d for d in downloads if d[0] == "pdf"]
+    actions = sorted({a for a, _, _ in samples})
+    spans = REGISTRY.snapshot()
+    return {
+        "sessions": sessions, "iterations": iterations, "wall": wall,
+        "reruns": {a: {**summarize([dt for x, dt, _ in samples if x == a]), "errors": sum(1 for x, _, e in samples if x == a and e)} for a in actions},
+        "rerun_all": summarize([dt for a, dt, _ in samples if a != "poll"]),
+        "ready": summarize([dt for s in pool for dt in s.ready]),
+        "downloads": {k: {**summarize([dt for x, dt, _ in downloads if x == k]), "bytes": sum(n for x, _, n in downloads if x == k)} for k in sorted({d[0] for d in downloads})},
+        "pdf_per_s": len(pdfs) / wall if wall > 0 else None,
+        "pdf_rendered": sum(v["count"] for k, v in spans.items() if k in ("pdf.native|ok", "pdf.soffice|ok")),
+        "jobs_superseded": spans.get("render|error", {}).get("count", 0),
+        "renders": {k: v for k, v in spans.items() if k.split("|")[0] in ("calc", "render", "excel", "excel.incremental", "excel.stream", "pdf.native", "pdf.soffice", "bundle")},
+        "memory": {"rss_base_mb": rss0 / 1024 / 1024, "rss_end_mb": rss1 / 1024 / 1024, "per_session_mb": (rss1 - rss0) / max(1, sessions) / 1024 / 1024,
+                   "state_kb_mean": sum(s.state_bytes() for s in pool) / max(1, sessions) / 1024},
+        "errors": [f"session {s.idx} {e}" for s in pool for e in s.errors],
+    }
+
+def _fmt(r):
+    if not r.get("n"): return "-"
+    return f"n={r['n']:<4} p50 {r['p50'] * 1000:8.1f}  p90 {r['p90'] * 1000:8.1f}  p99 {r['p99'] * 1000:8.1f}  max {r['max'] * 1000:8.1f} ms"
+
+def print_report(rep):
+    print(f"\n{rep['sessions']} sessions × {rep['iterations']} 輪，{rep['wall']:.1f}s")
+    print("rerun 延遲：")
+    for a, r in rep["reruns"].items(): print(f"  {a:<10} {_fmt(r)}" + (f"  錯誤 {r['errors']}" if r["errors"] else ""))
+    print(f"  {'(全部)':<9} {_fmt(rep['rerun_all'])}")
+    print(f"調整 → 可下載：  {_fmt(rep['ready'])}")
+    for k, r in rep["downloads"].items(): print(f"下載 {k:<5}       {_fmt(r)}  共 {r['bytes'] / 1024 / 1024:.1f} MB")
+    if rep["pdf_per_s"] is not None: print(f"PDF 吞吐量：{rep['pdf_per_s']:.2f} 份/s (下載 {rep['downloads'].get('pdf', {}).get('n', 0)} 份；背景實際渲染 {rep['pdf_rendered']} 份，"
+                                                f"另有 {rep['jobs_superseded']} 個背景 job 被新的調整取代而中止)")
+    m = rep["memory"]
+    print(f"記憶體：RSS {m['rss_base_mb']:.0f} → {m['rss_end_mb']:.0f} MB (每個 session 約 {m['per_session_mb']:.1f} MB)，session_state 平均 {m['state_kb_mean']:.0f} KB")
+    if rep["errors"]:
+        print(f"{len(rep['errors'])} 個錯誤：")
+        for e in rep["errors"][:20]: print(f"  {e}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Streamlit app 多人同時使用的負載測試")
+    ap.add_argument("--sessions", type=int, default=10, help="同時操作的 session 數")
+    ap.add_argument("--iterations", type=int, default=2, help="每個 session 跑幾輪 (勾選 / 拉佔比 / 等產出 / 下載)")
+    ap.add_argument("--think", type=float, default=0.5, help="每次操作前隨機停頓的上限 (秒)")
+    ap.add_argument("--ramp", type=float, default=2.0, help="所有 session 在幾秒內陸續進場")
+    ap.add_argument("--switch-format", action="store_true", help="每隔一輪切換格式並上傳另一份樣板")
+    ap.add_argument("--zip-every", type=int, default=0, help="每幾輪多下載一次全部格式 ZIP (0 = 不下載)")
+    ap.add_argument("--pdf-engine", choices=("native", "soffice"), default="native")
+    ap.add_argument("--font", default=os.environ.get("CUE_FONT_PATH", "NotoSansTC-Regular.ttf"), help="原生 PDF / 預覽用的字型 (不存在時 PDF 退回假的 LibreOffice)")
+    ap.add_argument("--soffice-delay", type=float, default=0.5, help="假 LibreOffice 每次轉檔的秒數")
+    ap.add_argument("--render-workers", type=int, help="背景渲染 thread 數 (CUE_RENDER_WORKERS)")
+    ap.add_argument("--soffice-pool", type=int, help="LibreOffice 池大小 (CUE_SOFFICE_POOL_SIZE)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--timeout", type=int, default=120, help="單次 rerun 上限 (秒)")
+    ap.add_argument("--save", help="結果存成 JSON")
+    args = ap.parse_args(argv)
+
+    # app 的設定全由環境變數帶入，要在第一個 session 跑之前設好
+    tmp = tempfile.mkdtemp(prefix="cue-loadtest-")
+    server, url_template = start_pricing_stub()
+    install_stub_soffice(tmp)
+    os.environ.update({"CUE_SHEET_URL_TEMPLATE": url_template, "CUE_SNAPSHOT_DIR": os.path.join(tmp, "snapshots"),
+                       "CUE_CACHE_DIR": os.path.join(tmp, "cache"), "CUE_PDF_ENGINE": args.pdf_engine,
+                       "CUE_FONT_PATH": args.font, "CUE_STUB_SOFFICE_DELAY": str(args.soffice_delay)})
+    if args.render_workers: os.environ["CUE_RENDER_WORKERS"] = str(args.render_workers)
+    if args.soffice_pool: os.environ["CUE_SOFFICE_POOL_SIZE"] = str(args.soffice_pool)
+    from cuesheet.soffice_pool import find_uno_python
+    if find_uno_python(): print("⚠️ 這台機器有 uno / unoserver，LibreOffice 池會走常駐模式而繞過假的 soffice", file=sys.stderr)
+
+    done = [0]
+    def progress(s):
+        done[0] += 1
+        print(f"[{done[0]}/{args.sessions}] session {s.idx}：{len(s.samples)} 次 rerun，{len(s.downloads)} 次下載" + (f"，{len(s.errors)} 個錯誤" if s.errors else ""), file=sys.stderr, flush=True)
+    try:
+        rep = run(args.sessions, args.iterations, args.think, args.ramp, args.seed, args.timeout, args.switch_format, args.zip_every, progress)
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+    print_report(rep)
+    if args.save:
+        report = {"env": {**environment(), **{k: v for k, v in vars(args).items() if k != "save"}, "font": os.path.exists(args.font)}, "results": rep}
+        with open(args.save, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        print(f"結果已存到 {args.save}")
+    return 1 if rep["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
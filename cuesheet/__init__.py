@@ -0,0 +1,42 @@
+# =========================================================
+# Cue 表核心函式庫 (不依賴 Streamlit)
+# 價格表 / 排程計算 / Excel 渲染 / HTML 預覽 / PDF 轉檔，UI (app.py) 與批次 (batch_cli.py) 共用。
+# 價格表 (PricingIndex) 一律由呼叫端傳入，不讀全域變數。
+#
+# import cuesheet 本身不載入任何重的相依套件：這裡列的名稱第一次被用到時才 import 對應模組，
+# openpyxl 只在渲染 Excel 時、weasyprint 只在 Web 版 PDF 時、pandas / requests 只在讀取價格表時載入。
+# =========================================================
+import importlib
+
+_EXPORTS = {
+    "PricingIndex": "pricing", "PricingError": "pricing",
+    "REGIONS_ORDER": "pricing", "DURATIONS": "pricing", "PKG_MEDIA": "pricing", "CF_MEDIA": "pricing",
+    "calculate_plan_data": "planner", "calculate_schedule": "planner", "get_remarks_text": "planner",
+    "region_display": "planner", "safe_filename": "planner", "html_escape": "planner",
+    "optimize_budget": "optimizer",
+    "SHEET_META": "sheet_meta", "generate_excel_from_template": "excel_render", "generate_excel_stream": "excel_stream",
+    "IncrementalExcel": "excel_incremental",
+    "TemplateCache": "template_cache", "TemplatePlan": "template_cache",
+    "preview_body": "html_preview", "preview_page": "html_preview", "html_to_pdf_weasyprint": "html_preview",
+    "FontAssets": "font_assets",
+    "render_pdf": "pdf_render",
+    "render_bundle": "bundle", "bundle_zip": "bundle",
+    "SofficePool": "soffice_pool",
+    "ConfigStore": "config_loader", "read_frames": "config_loader",
+    "ArtifactCache": "artifact_cache",
+    "RenderJobQueue": "render_jobs", "plan_fingerprint": "render_jobs",
+    "Memo": "memo", "calc_fingerprint": "memo",
+    "span": "metrics", "timed": "metrics", "collect": "metrics", "REGISTRY": "metrics",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    mod = _EXPORTS.get(name)
+    if mod is None: raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{mod}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
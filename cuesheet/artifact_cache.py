@@ -0,0 +1,157 @@
+import os
+import threading
+from collections import OrderedDict
+
+# =========================================================
+# 產出物快取 (Excel / PDF)
+# key = plan_fingerprint (輸入 + 樣板 SHA-256)，同樣輸入必得同樣檔案。
+# 記憶體 LRU；超出上限的項目可溢寫到本機目錄 (有總量上限，依 mtime 淘汰)。
+# 放入時可標記 owner (session)：每個 owner 在記憶體裡另有上限，超過就先把它自己最舊的項目溢寫到磁碟，
+# 一個 session 連續產大檔不會把其他 session 的產出物擠出記憶體。
+# =========================================================
+class ArtifactCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None, disk_max_bytes=512 * 1024 * 1024, owner_max_bytes=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.owner_max_bytes = owner_max_bytes
+        self._mem = OrderedDict()
+        self._mem_bytes = 0
+        self._disk = {}
+        self._owner = {}        # name -> owner (記憶體或磁碟上的項目)
+        self._owner_bytes = {}  # owner -> 記憶體中的 bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.spills = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            for fn in os.listdir(disk_dir):
+                if fn.endswith(".tmp"): continue
+                try: self._disk[fn] = os.path.getsize(os.path.join(disk_dir, fn))
+                except OSError: pass
+
+    @staticmethod
+    def _name(key, kind): return f"{key}.{kind}"
+
+    def get(self, key, kind, promote=True):
+        # promote=False：磁碟上的項目讀出來就好，不搬回記憶體 (下載這種只用一次的大檔)
+        name = self._name(key, kind)
+        with self._lock:
+            data = self._mem.get(name)
+            if data is not None:
+                self._mem.move_to_end(name)
+                self.hits += 1
+                return data
+            if name not in self._disk:
+                self.misses += 1
+                return None
+        data = self._read_disk(name)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            if promote: self._store_mem(name, data, self._owner.get(name))
+        return data
+
+    def size(self, key, kind):
+        name = self._name(key, kind)
+        with self._lock:
+            data = self._mem.get(name)
+            return len(data) if data is not None else self._disk.get(name)
+
+    def put(self, key, kind, data, owner=None):
+        if data is None: return
+        with self._lock: self._store_mem(self._name(key, kind), data, owner)
+
+    def _store_mem(self, name, data, owner=None):
+        self._drop_mem(name)
+        if owner is not None: self._owner[name] = owner
+        else: self._owner.pop(name, None)
+        if len(data) > self.max_bytes or (owner is not None and self.owner_max_bytes is not None and len(data) > self.owner_max_bytes):
+            self._spill(name, data)
+            return
+        self._mem[name] = data
+        self._mem_bytes += len(data)
+        if owner is not None:
+            self._owner_bytes[owner] = self._owner_bytes.get(owner, 0) + len(data)
+            if self.owner_max_bytes is not None and self._owner_bytes[owner] > self.owner_max_bytes:
+                for n in [n for n in self._mem if self._owner.get(n) == owner]:
+                    if self._owner_bytes.get(owner, 0) <= self.owner_max_bytes: break
+                    self._spill(n, self._drop_mem(n))
+        while self._mem_bytes > self.max_bytes and self._mem:
+            old_name = next(iter(self._mem))
+            self._spill(old_name, self._drop_mem(old_name))
+
+    def _drop_mem(self, name):
+        data = self._mem.pop(name, None)
+        if data is None: return None
+        self._mem_bytes -= len(data)
+        owner = self._owner.get(name)
+        if owner is not None:
+            left = self._owner_bytes.get(owner, 0) - len(data)
+            if left > 0: self._owner_bytes[owner] = left
+            else: self._owner_bytes.pop(owner, None)
+        return data
+
+    def _spill(self, name, data):
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            self._owner.pop(name, None)
+            return
+        path = os.path.join(self.disk_dir, name)
+        try:
+            with open(path + ".tmp", "wb") as f: f.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            self._owner.pop(name, None)
+            return
+        self._disk[name] = len(data)
+        self.spills += 1
+        self._trim_disk()
+
+    def _trim_disk(self):
+        total = sum(self._disk.values())
+        if total <= self.disk_max_bytes: return
+        def mtime(n):
+            try: return os.path.getmtime(os.path.join(self.disk_dir, n))
+            except OSError: return 0
+        for n in sorted(self._disk, key=mtime):
+            if total <= self.disk_max_bytes: break
+            total -= self._disk.pop(n)
+            if n not in self._mem: self._owner.pop(n, None)
+            try: os.remove(os.path.join(self.disk_dir, n))
+            except OSError: pass
+
+    def _read_disk(self, name):
+        path = os.path.join(self.disk_dir, name)
+        try:
+            with open(path, "rb") as f: data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            with self._lock:
+                self._disk.pop(name, None)
+                if name not in self._mem: self._owner.pop(name, None)
+            return None
+
+    def usage(self, owner):
+        # 某個 session 目前佔用的量 (記憶體 / 已溢寫到磁碟)
+        with self._lock:
+            names = [n for n, o in self._owner.items() if o == owner]
+            disk = [n for n in names if n not in self._mem and n in self._disk]
+            return {"mem_items": len(names) - len(disk), "mem_bytes": self._owner_bytes.get(owner, 0),
+                    "disk_items": len(disk), "disk_bytes": sum(self._disk[n] for n in disk)}
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits, "misses": self.misses, "disk_hits": self.disk_hits, "spills": self.spills,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "mem_items": len(self._mem), "mem_bytes": self._mem_bytes, "max_bytes": self.max_bytes,
+                "disk_items": len(self._disk), "disk_bytes": sum(self._disk.values()),
+                "owners": len(self._owner_bytes),
+            }
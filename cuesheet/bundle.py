@@ -0,0 +1,81 @@
+import io
+import json
+import zipfile
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from .sheet_meta import SHEET_META
+from .metrics import span
+
+# =========================================================
+# 多格式打包 (東吳 / 聲活 / 之後加進 SHEET_META 的格式)
+# 排程只算一次 (rows 與格式無關)，每個格式的 Excel 與 PDF 各自一個工作同時渲染，最後打成一個 ZIP。
+# 有樣板的格式套樣板 (經 TemplateCache)，沒有的走串流 Excel；PDF 直接從 rows 排版，
+# 失敗才交給呼叫端給的 pdf_fallback (LibreOffice，需等該格式的 Excel 完成)。
+# 呼叫端已經有的檔案 (例如目前格式剛產好的 Excel / PDF) 放在 ready 裡，不再重產，多一個格式只多它自己的渲染時間。
+# =========================================================
+def _excel(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, total_list_accum, template_bytes, template_cache):
+    with span("bundle.excel", format=format_type):
+        if template_bytes is None:
+            from .excel_stream import generate_excel_stream
+            return generate_excel_stream(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, total_list_accum)
+        from .excel_render import generate_excel_from_template
+        return generate_excel_from_template(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, template_bytes, total_list_accum, template_cache)
+
+def _pdf(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, total_list_accum, fonts):
+    from .pdf_render import render_pdf
+    with span("bundle.pdf", format=format_type):
+        return render_pdf(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, total_list_accum, fonts)
+
+def render_bundle(start_dt, end_dt, client_name, product_display_str, rows, remarks_list, total_list_accum, templates=None, fonts=None,
+                  template_cache=None, pdf=True, pdf_fallback=None, formats=None, ready=None, max_workers=None):
+    # templates: 格式 → 樣板 bytes (沒有的格式走串流)；pdf_fallback(xlsx) → (pdf, method, err)
+    # ready: 格式 → {"xlsx": bytes, "pdf": bytes, "pdf_method": ...}
+    # 回傳每個格式一筆 {"format", "excel_mode", "xlsx", "pdf", "pdf_method", "error", "warning"}，順序同 formats
+    templates, ready = templates or {}, ready or {}
+    formats = list(formats or SHEET_META)
+    args = (start_dt, end_dt, client_name, product_display_str, rows, remarks_list, total_list_accum)
+    items = {fmt: {"format": fmt, "excel_mode": "stream" if templates.get(fmt) is None else "template", "xlsx": None, "pdf": None,
+                   "pdf_method": None, "error": None, "warning": None, **ready.get(fmt, {})} for fmt in formats}
+    with span("bundle", formats=len(formats)), ThreadPoolExecutor(max_workers=max_workers or 2 * len(formats), thread_name_prefix="cue-bundle") as ex:
+        # 每個工作各帶一份 context，計時 span 照樣收進呼叫端的 collect()
+        def submit(fn, *a): return ex.submit(contextvars.copy_context().run, fn, *a)
+        xf = {fmt: submit(_excel, fmt, *args, templates.get(fmt), template_cache) for fmt, it in items.items() if it["xlsx"] is None}
+        pf = {fmt: submit(_pdf, fmt, *args, fonts) for fmt, it in items.items() if pdf and fonts is not None and it["pdf"] is None}
+        for fmt, fut in xf.items():
+            try: xlsx, err = fut.result()
+            except Exception as e: xlsx, err = None, f"{type(e).__name__}: {e}"
+            if xlsx: items[fmt]["xlsx"] = xlsx
+            else: items[fmt]["error"] = f"無法生成 Excel: {err}"
+        fallback = {}
+        for fmt, it in items.items():
+            if not pdf or it["pdf"]: continue
+            err = "沒有可嵌入的中文字型"
+            if fmt in pf:
+                try: it["pdf"], err = pf[fmt].result()
+                except Exception as e: err = f"{type(e).__name__}: {e}"
+                if it["pdf"]:
+                    it["pdf_method"] = "native"
+                    continue
+            if pdf_fallback is not None and it["xlsx"]: fallback[fmt] = submit(pdf_fallback, it["xlsx"])
+            else: it["warning"] = f"PDF 產出失敗 ({err})"
+        for fmt, fut in fallback.items():
+            try: pdf_bytes, method, err = fut.result()
+            except Exception as e: pdf_bytes, method, err = None, None, f"{type(e).__name__}: {e}"
+            if pdf_bytes: items[fmt]["pdf"], items[fmt]["pdf_method"] = pdf_bytes, method
+            else: items[fmt]["warning"] = f"PDF 產出失敗 ({err})"
+    return [items[fmt] for fmt in formats]
+
+def bundle_zip(items, base_name="Cue", extra=None):
+    # xlsx / pdf 本身已壓縮，ZIP 裡直接存 (不再 deflate)；附 manifest.json 記每個格式的結果
+    out = io.BytesIO()
+    manifest = {**(extra or {}), "files": []}
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as zf:
+        for it in items:
+            entry = {k: v for k, v in it.items() if k not in ("xlsx", "pdf")}
+            for ext in ("xlsx", "pdf"):
+                if not it[ext]: continue
+                entry[ext] = f"{base_name}_{it['format']}.{ext}"
+                zf.writestr(entry[ext], it[ext])
+            manifest["files"].append(entry)
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2, default=str), compress_type=zipfile.ZIP_DEFLATED)
+    return out.getvalue()
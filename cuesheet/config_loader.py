@@ -0,0 +1,165 @@
+import io
+import os
+import re
+import time
+import shutil
+import hashlib
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import span
+
+# =========================================================
+# 價格表載入 (Google Sheet → 本機版本快照)
+# 三張表併發抓取 (共用連線池 + 逾時)；每次成功都寫成一份版本快照。
+# 啟動時先用最後一份好的快照，背景再去更新，Google Sheet 掛掉也能開。
+# validate 失敗的資料不會取代現有版本，也不會寫成快照。
+# =========================================================
+SHEETS = ("Stores", "Factors", "Pricing")
+REQUIRED_COLUMNS = {
+    "Stores": ["Key", "Display_Name", "Count"],
+    "Factors": ["Media", "Seconds", "Factor"],
+    "Pricing": ["Media", "Region", "List_Price", "Net_Price", "Std_Spots", "Day_Part"],
+}
+GSHEET_SHARE_URL = "https://docs.google.com/spreadsheets/d/1bzmG-N8XFsj8m3LUPqA8K70AcIqaK4Qhq1VPWcK0w_s/edit?usp=sharing"
+GSHEET_CSV_URL = "https://docs.google.com/spreadsheets/d/{file_id}/gviz/tq?tqx=out:csv&sheet={sheet}"
+
+def parse_file_id(share_url):
+    match = re.search(r"/d/([a-zA-Z0-9-_]+)", share_url)
+    return match.group(1) if match else None
+
+def read_frames(raw):
+    import pandas as pd
+    frames = {}
+    for name in SHEETS:
+        df = pd.read_csv(io.BytesIO(raw[name]))
+        df.columns = [str(c).strip() for c in df.columns]
+        missing = [c for c in REQUIRED_COLUMNS[name] if c not in df.columns]
+        if missing: raise ValueError(f"{name} 缺少欄位: {', '.join(missing)}")
+        frames[name] = df
+    return frames
+
+def _make_session(pool_size):
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class ConfigStore:
+    def __init__(self, share_url, snapshot_dir, url_template=GSHEET_CSV_URL, ttl=300, timeout=10, keep=10, validate=None):
+        self.share_url = share_url
+        self.validate = validate
+        self.snapshot_dir = snapshot_dir
+        self.url_template = url_template
+        self.ttl = ttl
+        self.timeout = timeout
+        self.keep = keep
+        self.frames = None
+        self.version = None
+        self.source = None
+        self.last_error = None
+        self.last_attempt = 0.0
+        self._digest = None
+        self._lock = threading.Lock()
+        self._refreshing = threading.Event()
+        self._session = None  # 第一次連線才建 (requests 也到那時才載入)
+
+    # ---------- 讀取 ----------
+    def current(self):
+        with self._lock: return self.frames, self.version, self.last_error
+
+    def load(self):
+        # 有快照就直接用 (背景再更新)；完全沒有快照才同步抓
+        if self._load_latest_snapshot():
+            self.maybe_refresh(force=True)
+            return True
+        return self.refresh()
+
+    def maybe_refresh(self, force=False):
+        if self._refreshing.is_set(): return False
+        if not force and time.time() - self.last_attempt < self.ttl: return False
+        self._refreshing.set()
+        threading.Thread(target=self._refresh_bg, name="config-refresh", daemon=True).start()
+        return True
+
+    def _refresh_bg(self):
+        try: self.refresh()
+        finally: self._refreshing.clear()
+
+    # ---------- 抓取 ----------
+    def fetch_raw(self):
+        file_id = parse_file_id(self.share_url)
+        if not file_id: raise ValueError("連結格式錯誤")
+        if self._session is None: self._session = _make_session(len(SHEETS))
+        session = self._session
+
+        def get(sheet):
+            r = session.get(self.url_template.format(file_id=file_id, sheet=sheet), timeout=self.timeout)
+            r.raise_for_status()
+            return sheet, r.content
+
+        with ThreadPoolExecutor(max_workers=len(SHEETS), thread_name_prefix="config-fetch") as ex:
+            return dict(ex.map(get, SHEETS))
+
+    def refresh(self):
+        self.last_attempt = time.time()
+        with span("config.fetch") as sp:
+            try:
+                raw = self.fetch_raw()
+                frames = read_frames(raw)
+                if self.validate: self.validate(frames)
+            except Exception as e:
+                with self._lock: self.last_error = f"讀取失敗: {str(e)}"
+                sp["status"] = "fail"
+                return False
+
+        digest = hashlib.sha256(b"".join(raw[n] for n in SHEETS)).hexdigest()
+        with self._lock:
+            if digest == self._digest:
+                self.source, self.last_error = "cloud", None
+                return True
+        version = self._save_snapshot(raw, digest)
+        with self._lock:
+            self.frames, self.version, self._digest = frames, version, digest
+            self.source = "cloud"
+            self.last_error = None
+        return True
+
+    # ---------- 快照 ----------
+    def _save_snapshot(self, raw, digest):
+        version = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{digest[:8]}"
+        try:
+            path = os.path.join(self.snapshot_dir, version)
+            os.makedirs(path, exist_ok=True)
+            for name in SHEETS:
+                with open(os.path.join(path, f"{name}.csv"), "wb") as f: f.write(raw[name])
+            tmp = os.path.join(self.snapshot_dir, "LATEST.tmp")
+            with open(tmp, "w") as f: f.write(version)
+            os.replace(tmp, os.path.join(self.snapshot_dir, "LATEST"))
+            self._prune_snapshots()
+        except OSError: pass
+        return version
+
+    def _prune_snapshots(self):
+        versions = sorted(d for d in os.listdir(self.snapshot_dir) if os.path.isdir(os.path.join(self.snapshot_dir, d)))
+        for d in versions[:-self.keep]: shutil.rmtree(os.path.join(self.snapshot_dir, d), ignore_errors=True)
+
+    def _load_latest_snapshot(self):
+        try:
+            with open(os.path.join(self.snapshot_dir, "LATEST")) as f: version = f.read().strip()
+            raw = {}
+            for name in SHEETS:
+                with open(os.path.join(self.snapshot_dir, version, f"{name}.csv"), "rb") as f: raw[name] = f.read()
+            frames = read_frames(raw)
+            if self.validate: self.validate(frames)
+        except Exception:
+            return False
+        with self._lock:
+            self.frames, self.version, self.source = frames, version, "snapshot"
+            self._digest = hashlib.sha256(b"".join(raw[n] for n in SHEETS)).hexdigest()
+        return True
@@ -0,0 +1,84 @@
+import io
+import threading
+from .template_cache import template_digest
+from .paging import daily_totals
+from .sheet_meta import SHEET_META
+from .excel_render import build_workbook, group_rows, section_order, write_header, write_section, write_totals, write_remarks
+from .metrics import span, timed
+
+# =========================================================
+# 增量 Excel 渲染 (每個 session 一份)
+# 拉一下秒數比例通常只改到一個媒體區塊的幾列。這裡保留上一次渲染好的 workbook 與分組後的 rows，
+# 版面結構 (格式 / 樣板 / 走期 / 各區塊列數與是否合併全省總價) 沒變時，
+# 只重寫內容有變的區塊，外加表頭、Total / 製作 / VAT / Grand Total 與 Remarks，然後存檔；
+# 不再重新載入樣板、重排區塊、重寫沒變的排程。結構一變就整本重畫 (與 generate_excel_from_template 相同)。
+# 輸出內容與整本重畫逐格相同 (python -m benchmarks.fidelity --incremental)。
+# 樣板裡的圖片 (logo)：openpyxl 存檔時會讀完並關掉圖片的 BytesIO，同一本 workbook 要存第二次，
+# 所以先留一份圖片的 bytes，每次存檔前換上新的 BytesIO。
+# =========================================================
+class IncrementalExcel:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self.full = 0
+        self.partial = 0
+        self.sections_written = 0
+        self.sections_skipped = 0
+
+    @staticmethod
+    def _structure(format_type, start_dt, end_dt, template_bytes, grouped):
+        return (format_type, template_digest(template_bytes), start_dt, end_dt,
+                tuple((m, len(d), bool(d) and d[0].get("is_pkg_member", False)) for m, d in grouped.items()))
+
+    @timed("excel.incremental")
+    def render(self, format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, template_bytes, total_list_accum, template_cache=None):
+        # 介面與 generate_excel_from_template 相同：回傳 (xlsx bytes, 錯誤訊息)
+        # 同一個 session 的背景 job 可能重疊 (舊的還沒停、新的已送出)，一次只讓一個碰 workbook
+        with self._lock:
+            try:
+                wb, err = self._update(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, template_bytes, total_list_accum, template_cache)
+            except Exception:
+                self._state = None  # 寫到一半的 workbook 不能再拿來改
+                raise
+            if err: return None, err
+            for img, data in self._state["images"]: img.ref = io.BytesIO(data)
+            with span("excel.save"):
+                out = io.BytesIO()
+                wb.save(out)
+            return out.getvalue(), None
+
+    def _update(self, format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, template_bytes, total_list_accum, template_cache):
+        grouped = group_rows(rows)
+        structure = self._structure(format_type, start_dt, end_dt, template_bytes, grouped)
+        st = self._state
+        if st is None or st["structure"] != structure:
+            self._state = None
+            wb, tpl, pages, err = build_workbook(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, template_bytes, total_list_accum, template_cache)
+            if err: return None, err
+            self.full += 1
+            images = [(img, img.ref.getvalue()) for ws in wb.worksheets for img in ws._images if hasattr(img.ref, "getvalue")]
+            self._state = {"structure": structure, "wb": wb, "tpl": tpl, "pages": pages, "grouped": grouped, "remarks": len(remarks_list), "images": images}
+            return wb, None
+
+        meta, tpl = SHEET_META[format_type], st["tpl"]
+        changed = {m for m, data in grouped.items() if data != st["grouped"][m]}
+        totals = daily_totals(rows, (end_dt - start_dt).days + 1)
+        with span("excel.write"):
+            for page, ws, layout in st["pages"]:
+                write_header(ws, meta, page, start_dt, end_dt, client_name, product_display_str, rows)
+                for m_key, start_row_orig in section_order(tpl):
+                    if m_key in changed: write_section(ws, meta, format_type, page, m_key, layout.row(start_row_orig + 1), grouped[m_key])
+                write_totals(ws, tpl, meta, page, layout, totals, total_list_accum)
+                write_remarks(ws, tpl, layout, remarks_list, clear=st["remarks"])
+        self.partial += 1
+        self.sections_written += len(changed)
+        self.sections_skipped += len(grouped) - len(changed)
+        st["grouped"], st["remarks"] = grouped, len(remarks_list)
+        return st["wb"], None
+
+    def reset(self):
+        with self._lock: self._state = None
+
+    def stats(self):
+        return {"full": self.full, "partial": self.partial, "sections_written": self.sections_written,
+                "sections_skipped": self.sections_skipped, "cached": self._state is not None}
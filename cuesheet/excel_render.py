@@ -0,0 +1,293 @@
+import io
+from copy import copy, deepcopy
+from datetime import datetime
+from openpyxl.utils import column_index_from_string, get_column_letter, range_boundaries
+from openpyxl.cell.cell import MergedCell
+from openpyxl.styles import Alignment
+from .pricing import REGIONS_ORDER
+from .planner import region_display
+from .merged_index import merged_index
+from .template_cache import TemplatePlan
+from .sheet_layout import SectionLayout
+from .paging import paginate, daily_totals
+from .sheet_meta import SHEET_META, station_title
+from .metrics import span, timed
+
+# =========================================================
+# OpenPyXL 渲染引擎 (含錯誤回報)
+# 不依賴 Streamlit；樣板快取由呼叫端傳入 (UI 為全站共用，批次為每個 worker 一份)。
+# =========================================================
+def safe_write_rc(ws, row, col, value, center=False):
+    if isinstance(col, str): col = column_index_from_string(col)
+    cell = ws.cell(row, col)
+    if isinstance(cell, MergedCell):
+        master = merged_index(ws).master(row, col)
+        if master: cell = ws.cell(*master)
+    cell.value = value
+    if center:
+        if cell.has_style:
+            new_align = copy(cell.alignment)
+            new_align.horizontal = 'center'
+            new_align.vertical = 'center'
+            new_align.wrap_text = True
+            cell.alignment = new_align
+        else:
+            cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+
+def safe_write_addr(ws, addr, value):
+    cell = ws[addr]
+    if isinstance(cell, MergedCell):
+        master = merged_index(ws).master(cell.row, cell.column)
+        if master: cell = ws.cell(*master)
+    cell.value = value
+
+def unmerge_col_overlap(ws, col_letter, start_row, end_row):
+    st_col = column_index_from_string(col_letter)
+    to_unmerge = []
+    for mr in list(ws.merged_cells.ranges):
+        if mr.min_col == st_col and mr.max_col == st_col:
+            if not (mr.max_row < start_row or mr.min_row > end_row):
+                to_unmerge.append(str(mr))
+    idx = merged_index(ws)
+    for s in set(to_unmerge):
+        try: idx.unmerge(s)
+        except: pass
+
+def set_schedule(ws, row, start_col_letter, max_days, schedule_list):
+    start_col = column_index_from_string(start_col_letter)
+    for i in range(max_days):
+        v = schedule_list[i] if (schedule_list and i < len(schedule_list)) else None
+        safe_write_rc(ws, row, start_col + i, v)
+
+def force_center_columns_range(ws, col_letters, start_row, end_row):
+    if start_row is None or end_row is None: return
+    for r in range(start_row, end_row + 1):
+        for col in col_letters:
+            safe_col = column_index_from_string(col)
+            cell = ws.cell(r, safe_col)
+            if isinstance(cell, MergedCell):
+                master = _get_master_cell(ws, cell)
+                if master: cell = master
+                else: continue
+            if cell.has_style:
+                new_align = copy(cell.alignment)
+                new_align.horizontal = 'center'
+                new_align.vertical = 'center'
+                cell.alignment = new_align
+
+def _get_master_cell(ws, cell):
+    if not isinstance(cell, MergedCell): return cell
+    master = merged_index(ws).master(cell.row, cell.column)
+    return ws.cell(*master) if master else None
+
+@timed("excel")
+def generate_excel_from_template(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, template_bytes, total_list_accum, template_cache=None):
+    wb, _, _, err = build_workbook(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, template_bytes, total_list_accum, template_cache)
+    if err: return None, err
+    with span("excel.save"):
+        out = io.BytesIO()
+        wb.save(out)
+    return out.getvalue(), None
+
+def group_rows(rows):
+    reg_map = {r: i for i, r in enumerate(REGIONS_ORDER + ["全省量販", "全省超市"])}
+    def sort_key(x): return (x["seconds"], reg_map.get(x["region"], 999))
+    return {
+        "全家廣播": sorted([r for r in rows if r["media"] == "全家廣播"], key=sort_key),
+        "新鮮視": sorted([r for r in rows if r["media"] == "新鮮視"], key=sort_key),
+        "家樂福": sorted([r for r in rows if r["media"] == "家樂福"], key=sort_key),
+    }
+
+def build_workbook(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, template_bytes, total_list_accum, template_cache=None):
+    # 回傳 (workbook, 樣板, [(page, worksheet, layout)], 錯誤訊息)；尚未存檔
+    meta = SHEET_META[format_type]
+    with span("excel.load") as sp:
+        # 沒給快取 (單次呼叫) 就直接編譯樣板
+        if template_cache is not None: tpl, err = template_cache.get(format_type, template_bytes, meta)
+        else: tpl, err = TemplatePlan.compile(format_type, template_bytes, meta)
+        if err:
+            sp["status"] = "fail"
+            return None, None, None, err
+        wb = tpl.workbook()
+    target_sheet = wb.sheetnames[0] 
+    ws = wb[target_sheet]
+
+    # 走期超過一頁 (max_days) 就依月份分頁：每頁一張工作表，都從還沒寫入的樣板複製
+    days_count = (end_dt - start_dt).days + 1
+    pages = paginate(start_dt, days_count, meta["max_days"])
+    sheets = [ws]
+    if len(pages) > 1:
+        for page in pages[1:]:
+            copy_ws = wb.copy_worksheet(ws)
+            copy_sheet_extras(ws, copy_ws)
+            wb.move_sheet(copy_ws, offset=wb.index(ws) + page.index - wb.index(copy_ws))
+            sheets.append(copy_ws)
+        for page, sheet in zip(pages, sheets): sheet.title = page.title
+
+    grouped_data = group_rows(rows)
+    # 每日合計整個走期算一次，各頁取切片
+    totals = daily_totals(rows, days_count)
+
+    rendered = []
+    for page, sheet in zip(pages, sheets):
+        layout = render_page(sheet, tpl, meta, format_type, page, start_dt, end_dt, client_name, product_display_str, rows, grouped_data, totals, remarks_list, total_list_accum)
+        rendered.append((page, sheet, layout))
+    return wb, tpl, rendered, None
+
+def copy_sheet_extras(src, dst):
+    # copy_worksheet 只帶儲存格、欄寬列高、合併、邊界與版面設定；
+    # 樣板的 logo、列印標題 / 範圍、設定格式化條件、資料驗證要另外複製，後面幾個月份的工作表 (與轉出的 PDF) 才會一樣
+    from openpyxl.drawing.image import Image
+    dst.print_title_rows, dst.print_title_cols = src.print_title_rows, src.print_title_cols
+    if src.print_area: dst.print_area = src.print_area
+    for img in src._images:
+        # Image 存檔時會讀完並關掉 ref，每張工作表要有自己的一份
+        ref = img.ref
+        new = Image(io.BytesIO(ref.getvalue()) if hasattr(ref, "getvalue") else ref)
+        new.width, new.height = img.width, img.height
+        dst.add_image(new, deepcopy(img.anchor))
+    for cf in src.conditional_formatting:
+        for rule in cf.rules: dst.conditional_formatting.add(str(cf.sqref), copy(rule))
+    for dv in src.data_validations.dataValidation: dst.add_data_validation(deepcopy(dv))
+
+def render_page(ws, tpl, meta, format_type, page, start_dt, end_dt, client_name, product_display_str, rows, grouped_data, totals, remarks_list, total_list_accum):
+    # 回傳這一頁的 SectionLayout (樣板列號 → 最終列號)，增量渲染時用來找各區塊 / Total / 頁尾的位置
+    sec_order = section_order(tpl)
+    
+    # 先算好所有區塊的最終列數，一次重排 (儲存格 / 合併範圍 / 列高)
+    current_end_marker = tpl.total_row - 1
+    sections = []
+    for m_key, start_row_orig in sec_order:
+        sections.append((start_row_orig + 1, current_end_marker, len(grouped_data.get(m_key, []))))
+        current_end_marker = start_row_orig - 1
+    with span("excel.layout"):
+        layout = SectionLayout(sections)
+        layout.apply(ws)
+        merged_index(ws).rebuild()
+    
+    with span("excel.write"):
+        # Header (在重排之後寫；表頭列在所有區塊之上，不受重排影響)
+        write_header(ws, meta, page, start_dt, end_dt, client_name, product_display_str, rows)
+        for m_key, start_row_orig in sec_order:
+            write_section(ws, meta, format_type, page, m_key, layout.row(start_row_orig + 1), grouped_data.get(m_key, []))
+        total_row = write_totals(ws, tpl, meta, page, layout, totals, total_list_accum)
+        write_remarks(ws, tpl, layout, remarks_list)
+
+        if format_type == "Dongwu":
+            force_center_columns_range(ws, meta["force_center_cols"], 9, total_row)
+    return layout
+
+def section_order(tpl):
+    # 由下往上 (anchor 列號大的先)
+    return sorted(tpl.anchors.items(), key=lambda x: x[1], reverse=True)
+
+def write_header(ws, meta, page, start_dt, end_dt, client_name, product_display_str, rows):
+    hc = meta["header_cells"]
+    if "client" in hc: safe_write_addr(ws, hc["client"], client_name)
+    if "product" in hc: safe_write_addr(ws, hc["product"], product_display_str)
+    if "period" in hc: safe_write_addr(ws, hc["period"], f"{start_dt.strftime('%Y. %m. %d')} - {end_dt.strftime('%Y.%m. %d')}")
+    if "medium" in hc: safe_write_addr(ws, hc["medium"], " ".join(sorted(set([r["media"] for r in rows]))))
+    if "month" in hc: safe_write_addr(ws, hc["month"], f" {page.start.month}月")
+    safe_write_addr(ws, meta["date_start_cell"], datetime(page.start.year, page.start.month, page.start.day))
+
+    for addr, text in meta.get("header_override", {}).items(): 
+        safe_write_addr(ws, addr, text)
+
+def write_section(ws, meta, format_type, page, m_key, style_source_row, data):
+    cols = meta["cols"]
+    needed = len(data)
+    # 金額欄只寫在最後一頁 (見 sheet_meta 的 MONEY_COLS)
+    def money(v): return v if page.is_last else None
+
+    if needed == 0:
+         for c in range(1, ws.max_column+1): safe_write_rc(ws, style_source_row, c, None)
+         return
+
+    curr_row = style_source_row
+
+    if meta["station_merge"]:
+        unmerge_col_overlap(ws, cols["station"], curr_row, curr_row + needed - 1)
+        merge_rng = f"{cols['station']}{curr_row}:{cols['station']}{curr_row + needed - 1}"
+        merged_index(ws).merge(merge_rng)
+        safe_write_rc(ws, curr_row, cols["station"], station_title(m_key, format_type), center=True)
+
+    if needed > 0 and data[0].get("is_pkg_member", False):
+        pkg_col = cols.get("pkg")
+        if pkg_col:
+            unmerge_col_overlap(ws, pkg_col, curr_row, curr_row + needed - 1)
+            merge_pkg = f"{pkg_col}{curr_row}:{pkg_col}{curr_row + needed - 1}"
+            merged_index(ws).merge(merge_pkg)
+            safe_write_rc(ws, curr_row, pkg_col, money(data[0]["nat_pkg_display"]), center=True)
+
+    for idx, r_data in enumerate(data):
+        if not meta["station_merge"]:
+            safe_write_rc(ws, curr_row, cols["station"], station_title(m_key, format_type))
+    
+        safe_write_rc(ws, curr_row, cols["location"], region_display(r_data["region"]))
+        prog_val = r_data.get("program_num", 0)
+        safe_write_rc(ws, curr_row, cols["program"], int(prog_val))
+
+        if format_type == "Dongwu":
+            safe_write_rc(ws, curr_row, cols["daypart"], r_data["daypart"])
+            if m_key == "家樂福": safe_write_rc(ws, curr_row, cols["seconds"], f"{r_data['seconds']}秒")
+            else: safe_write_rc(ws, curr_row, cols["seconds"], int(r_data["seconds"]))
+        
+            safe_write_rc(ws, curr_row, cols["rate"], money(r_data["rate_display"]))
+            if not r_data.get("is_pkg_member", False):
+                safe_write_rc(ws, curr_row, cols["pkg"], money(r_data["pkg_display"]))
+        else:
+            safe_write_rc(ws, curr_row, cols["daypart"], r_data["daypart"])
+            safe_write_rc(ws, curr_row, cols["seconds"], f"{r_data['seconds']}秒廣告")
+            if "pkg" in cols and not r_data.get("is_pkg_member", False):
+                safe_write_rc(ws, curr_row, cols["pkg"], money(r_data["pkg_display"]))
+
+        sch = page.cut(r_data["schedule"])
+        set_schedule(ws, curr_row, meta["schedule_start_col"], meta["max_days"], sch)
+        spot_sum = sum(sch)
+        safe_write_rc(ws, curr_row, meta["total_col"], spot_sum)
+        curr_row += 1
+
+def write_totals(ws, tpl, meta, page, layout, totals, total_list_accum):
+    def shifted(r): return layout.row(r) if r else None
+    cols = meta["cols"]
+    total_row = shifted(tpl.total_row)
+    if total_row:
+        daily_sums = page.cut(totals)
+        set_schedule(ws, total_row, meta["schedule_start_col"], meta["max_days"], daily_sums)
+        safe_write_rc(ws, total_row, meta["total_col"], sum(daily_sums))
+    
+        # 金額 (List 總價 / 製作 / VAT / Grand Total) 是整個走期的，分頁時只寫在最後一頁
+        pkg_col = cols.get("pkg") or cols.get("proj_price")
+        if page.is_last: safe_write_rc(ws, total_row, pkg_col, total_list_accum)
+
+        make_fee = 10000 
+        pos_make = shifted(tpl.footer_rows.get("make"))
+        if pos_make and page.is_last: safe_write_rc(ws, pos_make, pkg_col, make_fee)
+    
+        vat = int(round((total_list_accum + make_fee) * 0.05))
+        pos_vat = shifted(tpl.footer_rows.get("vat"))
+        if pos_vat and page.is_last: safe_write_rc(ws, pos_vat, pkg_col, vat)
+    
+        pos_grand = shifted(tpl.footer_rows.get("grand"))
+        if pos_grand and page.is_last: safe_write_rc(ws, pos_grand, pkg_col, total_list_accum + make_fee + vat)
+    return total_row
+
+def write_remarks(ws, tpl, layout, remarks_list, clear=0):
+    # clear: 上一版的備註行數 (增量渲染時，多出來的舊備註要清掉)
+    rem_pos = layout.row(tpl.remarks_row) if tpl.remarks_row else None
+    if rem_pos:
+        for i, rm in enumerate(remarks_list):
+            ws.cell(rem_pos + 1 + i, 2).value = rm
+        for i in range(len(remarks_list), clear):
+            ws.cell(rem_pos + 1 + i, 2).value = None
+        extend_print_area(ws, rem_pos, rem_pos + len(remarks_list))
+
+def extend_print_area(ws, row, last_row):
+    # 備註行寫在 Remarks 列下面，可能超出樣板的列印範圍；涵蓋 Remarks 列的範圍往下延伸到最後一行
+    if not ws.print_area: return
+    refs = []
+    for ref in ws.print_area.split(","):
+        c1, r1, c2, r2 = range_boundaries(ref.split("!")[-1].replace("$", ""))
+        if r1 <= row <= r2 < last_row: r2 = last_row
+        refs.append(f"{get_column_letter(c1)}{r1}:{get_column_letter(c2)}{r2}")
+    ws.print_area = refs
@@ -0,0 +1,189 @@
+import io
+from datetime import datetime
+from .pricing import REGIONS_ORDER
+from .planner import region_display
+from .paging import paginate, daily_totals
+from .sheet_meta import SHEET_META, station_title
+from .metrics import timed
+
+# =========================================================
+# 串流 Excel 輸出 (xlsxwriter，不讀樣板)
+# 不需要與樣板像素一致時用：版面 (欄位 / 表頭 / 日期列 / 區塊 / Total / 頁尾 / Remarks 的位置) 照 SHEET_META，
+# 樣式 (底色 / 框線 / 字型 / 欄寬) 由 STREAM_STYLES 先定義好，逐列往下寫，
+# 不載入 openpyxl、不解析 / 複製樣板，也不必逐格找合併儲存格的 master。
+# 內容 (各列數值 / 排程 / 合計 / 分頁) 與樣板版相同，可用 benchmarks/fidelity.py 逐格比對。
+# =========================================================
+STREAM_STYLES = {
+    "Dongwu": {
+        "font": "Arial", "head_bg": "#4472C4", "head_fg": "#FFFFFF", "weekend_bg": "#FFD966",
+        "headers": {"station": "Station", "location": "Location", "program": "Program", "daypart": "Day-part", "seconds": "Size", "rate": "rate\n(Net)", "pkg": "Package-cost\n(Net)"},
+        "widths": {"station": 20, "location": 16, "program": 9, "daypart": 13, "seconds": 7, "rate": 13, "pkg": 14},
+    },
+    "Shenghuo": {
+        "font": "Arial", "head_bg": "#BDD7EE", "head_fg": "#000000", "weekend_bg": None,
+        "headers": {"station": "頻道", "location": "播出地區", "program": "播出店數", "daypart": "播出時間", "seconds": "秒數\n規格", "pkg": "專案價\n(Net)"},
+        "widths": {"station": 20, "location": 16, "program": 9, "daypart": 13, "seconds": 10, "pkg": 14},
+    },
+}
+TOTAL_BG = "#E2EFDA"
+GRAND_BG = "#FFC107"
+HEADER_LABELS = {"client": "客戶名稱：", "product": "Product：", "period": "Period：", "medium": "Medium："}
+MEDIA_ORDER = ("全家廣播", "新鮮視", "家樂福")
+MAKE_FEE = 10000
+WEEKDAYS = "一二三四五六日"
+
+def _col(letter):
+    n = 0
+    for ch in letter: n = n * 26 + ord(ch.upper()) - 64
+    return n - 1
+
+def _cell(addr):
+    i = next(i for i, ch in enumerate(addr) if ch.isdigit())
+    return int(addr[i:]) - 1, _col(addr[:i])
+
+class _Formats:
+    # xlsxwriter 的 format 要掛在 workbook 上；整本只建一次，所有頁共用
+    def __init__(self, wb, style):
+        base = {"font_name": style["font"], "font_size": 10, "align": "center", "valign": "vcenter", "text_wrap": True}
+        box = {**base, "border": 1}
+        head = {**box, "bold": True, "bg_color": style["head_bg"], "font_color": style["head_fg"]}
+        self.title = wb.add_format({**base, "font_size": 16, "bold": True, "align": "left"})
+        self.label = wb.add_format({**base, "align": "left", "bold": True})
+        self.value = wb.add_format({**base, "align": "left"})
+        self.head = wb.add_format(head)
+        self.date = wb.add_format({**head, "num_format": "d"})
+        self.weekend = wb.add_format({**head, "num_format": "d", "bg_color": style["weekend_bg"] or style["head_bg"]})
+        self.weekend_wd = wb.add_format({**head, "bg_color": style["weekend_bg"] or style["head_bg"]})
+        self.anchor = wb.add_format({**box, "bold": True, "align": "left"})
+        self.cell = wb.add_format(box)
+        self.money = wb.add_format({**box, "num_format": "#,##0"})
+        self.total = wb.add_format({**box, "bold": True, "bg_color": TOTAL_BG})
+        self.total_money = wb.add_format({**box, "bold": True, "bg_color": TOTAL_BG, "num_format": "#,##0"})
+        self.total_label = wb.add_format({**box, "bold": True, "bg_color": TOTAL_BG, "align": "left"})
+        self.foot_label = wb.add_format({**box, "align": "left"})
+        self.grand = wb.add_format({**box, "bold": True, "bg_color": GRAND_BG, "num_format": "#,##0"})
+        self.grand_label = wb.add_format({**box, "bold": True, "bg_color": GRAND_BG, "align": "left"})
+        self.remarks = wb.add_format({**base, "font_size": 9, "align": "left", "text_wrap": False})
+
+def _write_page(ws, f, meta, style, format_type, page, start_dt, end_dt, client_name, product_display_str, rows, grouped, totals, remarks_list, total_list_accum):
+    cols = {k: _col(v) for k, v in meta["cols"].items()}
+    day0 = _col(meta["schedule_start_col"])
+    total_c = _col(meta["total_col"])
+    last_c = max(total_c, *cols.values())
+    money_c = cols.get("pkg", cols.get("rate"))
+    label_span = cols["seconds"]  # Total / 頁尾標籤合併 B ~ 秒數欄
+
+    # 欄寬 / 列印設定
+    ws.set_column(0, 0, 2)
+    for k, c in cols.items(): ws.set_column(c, c, style["widths"].get(k, 10))
+    ws.set_column(day0, day0 + meta["max_days"] - 1, 4)
+    ws.set_column(total_c, total_c, 7)
+    ws.set_landscape()
+    ws.set_paper(9)
+    ws.fit_to_pages(1, 0)
+
+    # 表頭
+    ws.write(0, 1, "Media Schedule", f.title)
+    hc = meta["header_cells"]
+    values = {
+        "client": client_name, "product": product_display_str,
+        "period": f"{start_dt.strftime('%Y. %m. %d')} - {end_dt.strftime('%Y.%m. %d')}",
+        "medium": " ".join(sorted(set(r["media"] for r in rows))), "month": f" {page.start.month}月",
+    }
+    for key, addr in hc.items():
+        r, c = _cell(addr)
+        if key in HEADER_LABELS: ws.write(r, 1, HEADER_LABELS[key], f.label)
+        ws.write(r, c, values[key], f.value)
+
+    # 欄名 + 日期列 / 星期列
+    date_row, _ = _cell(meta["date_start_cell"])
+    ws.set_row(date_row, 30)
+    for k, c in cols.items(): ws.merge_range(date_row, c, date_row + 1, c, style["headers"][k], f.head)
+    for i in range(page.days):
+        d = datetime.fromordinal(page.start.toordinal() + i)
+        weekend = d.weekday() >= 5
+        ws.write_datetime(date_row, day0 + i, d, f.weekend if weekend else f.date)
+        ws.write(date_row + 1, day0 + i, WEEKDAYS[d.weekday()], f.weekend_wd if weekend else f.head)
+    ws.merge_range(date_row, total_c, date_row + 1, total_c, "檔次", f.head)
+
+    # 金額欄只寫在最後一頁 (見 sheet_meta 的 MONEY_COLS)，前面各頁留白但保留格式與合併
+    def money(r, c, v):
+        if page.is_last: ws.write(r, c, v, f.money)
+        else: ws.write_blank(r, c, None, f.money)
+
+    # 各媒體區塊：anchor 列 + 資料列
+    r = date_row + 2
+    for m in MEDIA_ORDER:
+        data = grouped.get(m)
+        if not data: continue
+        ws.write(r, cols["station"], ("" if m == "家樂福" else "全家便利商店\n") + meta["anchors"][m], f.anchor)
+        ws.set_row(r, 24)
+        r += 1
+        first, n = r, len(data)
+        if meta["station_merge"] and n > 1: ws.merge_range(first, cols["station"], first + n - 1, cols["station"], station_title(m, format_type), f.cell)
+        if data[0].get("is_pkg_member", False) and "pkg" in cols:
+            if n > 1: ws.merge_range(first, cols["pkg"], first + n - 1, cols["pkg"], data[0]["nat_pkg_display"] if page.is_last else "", f.money)
+            else: money(first, cols["pkg"], data[0]["nat_pkg_display"])
+        for row in data:
+            if not meta["station_merge"] or n == 1: ws.write(r, cols["station"], station_title(m, format_type), f.cell)
+            ws.write(r, cols["location"], region_display(row["region"]), f.cell)
+            ws.write_number(r, cols["program"], int(row.get("program_num", 0)), f.cell)
+            ws.write(r, cols["daypart"], row["daypart"], f.cell)
+            if format_type == "Dongwu":
+                if m == "家樂福": ws.write(r, cols["seconds"], f"{row['seconds']}秒", f.cell)
+                else: ws.write_number(r, cols["seconds"], int(row["seconds"]), f.cell)
+                money(r, cols["rate"], row["rate_display"])
+            else:
+                ws.write(r, cols["seconds"], f"{row['seconds']}秒廣告", f.cell)
+            if "pkg" in cols and not row.get("is_pkg_member", False): money(r, cols["pkg"], row["pkg_display"])
+            sch = page.cut(row["schedule"])
+            ws.write_row(r, day0, sch, f.cell)
+            for c in range(day0 + len(sch), day0 + meta["max_days"]): ws.write_blank(r, c, None, f.cell)
+            ws.write_number(r, total_c, sum(sch), f.total)
+            r += 1
+
+    # Total / 頁尾 (金額是整個走期的，分頁時只寫在最後一頁)
+    day_sums = page.cut(totals)
+    ws.merge_range(r, 1, r, label_span, meta["total_label"], f.total_label)
+    for c in range(label_span + 1, last_c + 1): ws.write_blank(r, c, None, f.total)
+    ws.write_row(r, day0, day_sums, f.total)
+    ws.write_number(r, total_c, sum(day_sums), f.total)
+    if page.is_last: ws.write_number(r, money_c, total_list_accum, f.total_money)
+    vat = int(round((total_list_accum + MAKE_FEE) * 0.05))
+    labels = meta["footer_labels"]
+    for i, (key, amount) in enumerate((("make", MAKE_FEE), ("vat", vat), ("grand", total_list_accum + MAKE_FEE + vat))):
+        grand = key == "grand"
+        ws.merge_range(r + 1 + i, 1, r + 1 + i, label_span, labels[key], f.grand_label if grand else f.foot_label)
+        if page.is_last: ws.write_number(r + 1 + i, money_c, amount, f.grand if grand else f.money)
+        else: ws.write_blank(r + 1 + i, money_c, None, f.grand if grand else f.money)
+    r += 5  # 跳過 Total、製作 / VAT / Grand Total 三列與一列空白，到 Remarks
+    ws.write(r, 1, "Remarks：", f.label)
+    for i, rm in enumerate(remarks_list): ws.write(r + 1 + i, 1, rm, f.remarks)
+    ws.repeat_rows(date_row, date_row + 1)
+
+@timed("excel.stream")
+def generate_excel_stream(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, total_list_accum):
+    # 介面與 generate_excel_from_template 相同 (少了樣板)：回傳 (xlsx bytes, 錯誤訊息)
+    import xlsxwriter
+    meta = SHEET_META.get(format_type)
+    if meta is None: return None, f"未知的格式: {format_type}"
+    style = STREAM_STYLES[format_type]
+    reg_map = {r: i for i, r in enumerate(REGIONS_ORDER + ["全省量販", "全省超市"])}
+    def sort_key(x): return (x["seconds"], reg_map.get(x["region"], 999))
+    grouped = {m: sorted([r for r in rows if r["media"] == m], key=sort_key) for m in MEDIA_ORDER}
+
+    days_count = (end_dt - start_dt).days + 1
+    pages = paginate(start_dt, days_count, meta["max_days"])
+    totals = daily_totals(rows, days_count)
+
+    out = io.BytesIO()
+    try:
+        wb = xlsxwriter.Workbook(out, {"in_memory": True})
+        f = _Formats(wb, style)
+        for page in pages:
+            ws = wb.add_worksheet(meta["sheet_name"] if len(pages) == 1 else page.title)
+            _write_page(ws, f, meta, style, format_type, page, start_dt, end_dt, client_name, product_display_str, rows, grouped, totals, remarks_list, total_list_accum)
+        wb.close()
+    except Exception as e:
+        return None, str(e)
+    return out.getvalue(), None
@@ -0,0 +1,163 @@
+import io
+import os
+import time
+import base64
+import string
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+# =========================================================
+# 字型資產 (預覽 / PDF 用的中文字型)
+# 完整字型只讀 (或下載) 一次。預覽優先用靜態檔：完整字型轉成 WOFF 寫到 app 的 static/ 一次，
+# 每份預覽只帶一行指向它的 @font-face，瀏覽器下載一次後就快取 (static_font_face)。
+# 不能用靜態檔時才在預覽裡嵌入「實際用到的字」的子集 (font_face_css)；原生 PDF 一律嵌入子集 (sfnt)。
+# 子集依字集快取，同樣內容重跑不必再切字型、再 base64。沒有 fontTools 時退回完整字型 (同樣只處理一次)。
+# 下載失敗後 retry_after 秒內不再重試，離線時不會每次 rerun 都卡住 15 秒。
+# =========================================================
+FONT_FAMILY = "NotoSansTC"
+FONT_URL = "https://github.com/googlefonts/noto-cjk/raw/main/Sans/TTF/TraditionalChinese/NotoSansTC-Regular.ttf"
+BASE_CHARS = string.printable + "，。、：；（）「」—－～％"
+
+try:
+    from fontTools import subset as ft_subset
+    from fontTools.ttLib import TTFont
+    logging.getLogger("fontTools.subset").setLevel(logging.ERROR)
+except ImportError:
+    ft_subset = None
+
+class FontAssets:
+    def __init__(self, path="NotoSansTC-Regular.ttf", url=FONT_URL, max_subsets=32, timeout=15, retry_after=300):
+        self.path = path
+        self.url = url
+        self.max_subsets = max_subsets
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._data = None
+        self._full_b64 = None
+        self._static_css = None
+        self._failed_at = 0.0
+        self._subsets = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- 完整字型 ----------
+    def font_bytes(self):
+        with self._lock:
+            if self._data is not None: return self._data
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f: self._data = f.read()
+                return self._data
+            if time.time() - self._failed_at < self.retry_after: return None
+            try:
+                import requests
+                r = requests.get(self.url, timeout=self.timeout)
+                r.raise_for_status()
+            except Exception:
+                self._failed_at = time.time()
+                return None
+            self._data = r.content
+            try:
+                with open(self.path + ".tmp", "wb") as f: f.write(self._data)
+                os.replace(self.path + ".tmp", self.path)
+            except OSError: pass
+            return self._data
+
+    # ---------- 子集 ----------
+    def _subset(self, data, chars, flavor="woff"):
+        font = TTFont(io.BytesIO(data))
+        options = ft_subset.Options()
+        options.flavor = flavor
+        # PDF 內嵌只需要字形與寬度 (排版在我們這邊做)
+        options.layout_features = ["*"] if flavor else []
+        options.name_IDs = ["*"]
+        options.notdef_outline = True
+        sub = ft_subset.Subsetter(options=options)
+        sub.populate(unicodes={ord(c) for c in chars})
+        sub.subset(font)
+        out = io.BytesIO()
+        ft_subset.save_font(font, out, options)
+        return out.getvalue()
+
+    # ---------- 靜態檔 ----------
+    def static_font_face(self, static_dir, url_prefix="app/static"):
+        # 完整字型存成 static_dir/fonts/<名稱>-<指紋>.woff (檔名含指紋，內容變了網址就變，可放心長期快取)；
+        # 回傳參照它的 @font-face。沒有字型回傳空字串，寫不進 static_dir 回傳 None (呼叫端改嵌入子集)
+        with self._lock:
+            if self._static_css is not None: return self._static_css
+        data = self.font_bytes()
+        if data is None: return ""
+        fmt = "woff" if ft_subset is not None else "truetype"
+        name = f"fonts/{FONT_FAMILY}-{hashlib.sha256(data).hexdigest()[:16]}.{'woff' if fmt == 'woff' else 'ttf'}"
+        path = os.path.join(static_dir, *name.split("/"))
+        if not os.path.exists(path):
+            if fmt == "woff":
+                font, out = TTFont(io.BytesIO(data)), io.BytesIO()
+                font.flavor = "woff"
+                font.save(out)
+                data = out.getvalue()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + ".tmp", "wb") as f: f.write(data)
+                os.replace(path + ".tmp", path)
+            except OSError:
+                return None
+        css = f"@font-face {{ font-family: '{FONT_FAMILY}'; src: url({url_prefix}/{name}) format('{fmt}'); }}"
+        with self._lock: self._static_css = css
+        return css
+
+    def font_face_css(self, text):
+        # 回傳只含 text 用到字元的 @font-face；沒有字型時回傳空字串
+        data = self.font_bytes()
+        if data is None: return ""
+        if ft_subset is None:
+            with self._lock:
+                if self._full_b64 is None:
+                    self._full_b64 = f"@font-face {{ font-family: '{FONT_FAMILY}'; src: url(data:font/ttf;base64,{base64.b64encode(data).decode('ascii')}) format('truetype'); }}"
+                return self._full_b64
+
+        chars = "".join(sorted(set(text) | set(BASE_CHARS)))
+        key = hashlib.sha256(chars.encode("utf-8")).hexdigest()
+        with self._lock:
+            css = self._subsets.get(key)
+            if css is not None:
+                self._subsets.move_to_end(key)
+                self.hits += 1
+                return css
+            self.misses += 1
+        woff = self._subset(data, chars)
+        css = f"@font-face {{ font-family: '{FONT_FAMILY}'; src: url(data:font/woff;base64,{base64.b64encode(woff).decode('ascii')}) format('woff'); }}"
+        with self._lock:
+            self._subsets[key] = css
+            while len(self._subsets) > self.max_subsets: self._subsets.popitem(last=False)
+        return css
+
+    def pdf_subset(self, text):
+        # 原生 PDF 用：只含 text 用到字元的 TrueType / OpenType (不壓成 WOFF)；沒有字型或 fontTools 時回傳 None
+        data = self.font_bytes()
+        if data is None or ft_subset is None: return None
+        chars = "".join(sorted(set(text) | set(BASE_CHARS)))
+        key = "pdf:" + hashlib.sha256(chars.encode("utf-8")).hexdigest()
+        with self._lock:
+            sfnt = self._subsets.get(key)
+            if sfnt is not None:
+                self._subsets.move_to_end(key)
+                self.hits += 1
+                return sfnt
+            self.misses += 1
+        sfnt = self._subset(data, chars, flavor=None)
+        with self._lock:
+            self._subsets[key] = sfnt
+            while len(self._subsets) > self.max_subsets: self._subsets.popitem(last=False)
+        return sfnt
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits, "misses": self.misses, "subsets": len(self._subsets),
+                "subset_bytes": sum(len(c) for c in self._subsets.values()),
+                "font_bytes": len(self._data) if self._data else 0, "subsetting": ft_subset is not None,
+                "static": self._static_css is not None,
+            }
@@ -0,0 +1,180 @@
+import os
+import re
+import threading
+from datetime import timedelta
+from functools import lru_cache
+from .pricing import REGIONS_ORDER
+from .planner import region_display, html_escape
+from .metrics import span, timed
+from .paging import MAX_DAYS, paginate, daily_totals
+
+# =========================================================
+# HTML Preview (不依賴 Streamlit)
+# 表格本體與字型分開：呼叫端自行快取 preview_body，再套上 font_face 組成整頁。
+# =========================================================
+PREVIEW_WEEKDAYS = ["一", "二", "三", "四", "五", "六", "日"]
+PREVIEW_MEDIA_RANK = {"全家廣播": 1, "新鮮視": 2, "家樂福": 3}
+PREVIEW_REGION_RANK = {r: i for i, r in enumerate(REGIONS_ORDER)}
+PREVIEW_COLS = {
+    "Dongwu": ["Station", "Location", "Program", "Day-part", "Size", "rate<br>(Net)", "Package-cost<br>(Net)"],
+    "Shenghuo": ["頻道", "播出地區", "播出店數", "播出時間", "秒數<br>規格", "專案價<br>(Net)"],
+}
+PREVIEW_CSS = """
+    body { font-family: 'NotoSansTC', sans-serif !important; font-size: 10px; }
+    table { width: 100%; border-collapse: collapse; }
+    th, td { border: 0.5pt solid #000; padding: 2px; text-align: center; white-space: nowrap; }
+    .bg-dw-head { background-color: #4472C4; color: white; -webkit-print-color-adjust: exact; }
+    .bg-sh-head { background-color: #BDD7EE; color: black; -webkit-print-color-adjust: exact; }
+    .bg-weekend { background-color: #FFD966; -webkit-print-color-adjust: exact; }
+    .bg-total   { background-color: #E2EFDA; -webkit-print-color-adjust: exact; }
+    .bg-grand   { background-color: #FFC107; -webkit-print-color-adjust: exact; }
+    .left { text-align: left; }
+    .right { text-align: right; }
+    .remarks { margin-top: 10px; font-size: 9px; text-align: left; white-space: pre-wrap; }
+    </style></head><body>"""
+
+def preview_header_cls(format_type): return "bg-dw-head" if format_type == "Dongwu" else "bg-sh-head"
+
+@lru_cache(maxsize=64)
+def preview_date_header(start_dt, eff_days, format_type):
+    header_cls = preview_header_cls(format_type)
+    th1, th2 = [], []
+    curr = start_dt
+    for i in range(eff_days):
+        wd = curr.weekday()
+        bg = "bg-weekend" if (format_type == "Dongwu" and wd >= 5) else header_cls
+        th1.append(f"<th class='{bg} col_day'>{curr.day}</th>")
+        th2.append(f"<th class='{bg} col_day'>{PREVIEW_WEEKDAYS[wd]}</th>")
+        curr += timedelta(days=1)
+    th_fixed = "".join([f"<th rowspan='2' class='{header_cls}'>{c}</th>" for c in PREVIEW_COLS[format_type]])
+    return f"<thead><tr>{th_fixed}{''.join(th1)}<th class='{header_cls}' rowspan='2'>檔次</th></tr><tr>{''.join(th2)}</tr></thead>"
+
+def preview_station_name(m, format_type):
+    if m == "全家廣播": return "全家便利商店<br>廣播通路廣告" if format_type == "Shenghuo" else "全家便利商店<br>通路廣播廣告"
+    return "全家便利商店<br>新鮮視廣告" if m == "新鮮視" else "家樂福"
+
+@timed("html.body")
+def preview_body(rows, days_cnt, start_dt, end_dt, c_name, p_display, format_type, remarks, total_list, grand_total, budget, prod):
+    # 與 Excel 相同的分頁 (每頁最多 MAX_DAYS 天，超過依月份切)；單頁時輸出與原本相同
+    pages = paginate(start_dt, days_cnt, MAX_DAYS.get(format_type, 31))
+    out = []
+    w = out.append
+    w(f"""
+    <div style="margin-bottom:10px;">
+        <div style="font-size:16px; font-weight:bold; text-align:center;">Media Schedule</div>
+        <b>客戶名稱：</b>{html_escape(c_name)} &nbsp; <b>Product：</b>{html_escape(p_display)}<br>
+        <b>Period：</b>{start_dt.strftime('%Y. %m. %d')} - {end_dt.strftime('%Y. %m. %d')} &nbsp; <b>Medium：</b>全家廣播/新鮮視/家樂福
+    </div>""")
+
+    rows_sorted = sorted(rows, key=lambda x: (PREVIEW_MEDIA_RANK.get(x["media"], 99), x["seconds"], PREVIEW_REGION_RANK.get(x["region"], 99)))
+    grouped_rows = {}
+    for r in rows_sorted:
+        grouped_rows.setdefault((r['media'], r['seconds']), []).append(r)
+    totals = daily_totals(rows, days_cnt)
+
+    for page in pages:
+        if len(pages) > 1:
+            brk = " page-break-before:always;" if page.index else ""
+            w(f"""
+    <div style="margin:10px 0 4px; font-weight:bold;{brk}">{page.start.year}年{page.start.month}月 ({page.start.strftime('%m/%d')} - {page.end.strftime('%m/%d')})</div>""")
+        preview_table(w, grouped_rows, format_type, page, page.cut(totals), total_list, grand_total, budget, prod)
+    w(f"""
+    <div class="remarks"><b>Remarks：</b><br>{"<br>".join([html_escape(x) for x in remarks])}</div>
+    </body></html>
+    """)
+    return "".join(out)
+
+def preview_table(w, grouped_rows, format_type, page, totals, total_list, grand_total, budget, prod):
+    eff_days = page.days
+    w(f"""
+    <table>
+        {preview_date_header(page.start, eff_days, format_type)}
+        <tbody>""")
+
+    for (m, sec), group in grouped_rows.items():
+        is_nat = group[0].get('is_pkg_member', False)
+        group_size = len(group)
+        display_name = preview_station_name(m, format_type)
+
+        for k, r_data in enumerate(group):
+            w("<tr>")
+            if format_type == "Shenghuo": w(f"<td class='left'>{display_name}</td>")
+            elif k == 0: w(f"<td class='left' rowspan='{group_size}'>{display_name}</td>")
+
+            loc_txt = region_display(r_data['region'])
+            if "北北基" in loc_txt and "廣播" in r_data['media']: loc_txt = "北區-北北基+東"
+            w(f"<td>{loc_txt}</td><td class='right'>{r_data.get('program_num','')}</td><td>{r_data['daypart']}</td>")
+            sec_txt = f"{r_data['seconds']}秒" if format_type=="Dongwu" and m=="家樂福" else f"{r_data['seconds']}" if format_type=="Dongwu" else f"{r_data['seconds']}秒廣告"
+            w(f"<td>{sec_txt}</td>")
+
+            # 金額欄只放最後一頁 (見 sheet_meta 的 MONEY_COLS)
+            if format_type == "Dongwu":
+                rate = f"{r_data['rate_display']:,}" if isinstance(r_data['rate_display'], int) else r_data['rate_display']
+                w(f"<td class='right'>{rate if page.is_last else ''}</td>")
+            if is_nat:
+                nat_pkg = f"{r_data['nat_pkg_display']:,}" if page.is_last else ""
+                if k == 0: w(f"<td class='right' rowspan='{group_size}'>{nat_pkg}</td>")
+            else:
+                pkg = f"{r_data['pkg_display']:,}" if isinstance(r_data['pkg_display'], int) else r_data['pkg_display']
+                w(f"<td class='right'>{pkg if page.is_last else ''}</td>")
+
+            sch = page.cut(r_data['schedule'])
+            w("".join([f"<td>{d}</td>" for d in sch]))
+            # 分頁時每列檔次為該頁小計
+            w(f"<td class='bg-total'>{r_data['spots'] if page.count == 1 else sum(sch)}</td></tr>")
+
+    # 金額是整個走期的，分頁時只放在最後一頁
+    empty_td = "<td></td>" if format_type == "Dongwu" else ""
+    w(f"<tr class='bg-total'><td colspan='5' class='right'>Total (List Price)</td>{empty_td}<td class='right'>{f'{total_list:,}' if page.is_last else ''}</td>")
+    w("".join([f"<td>{t}</td>" for t in totals]))
+    w(f"<td>{sum(totals)}</td></tr>")
+
+    if page.is_last:
+        vat = int(round((budget + prod) * 0.05))
+        fill = f"<td colspan='{eff_days+1}'></td></tr>"
+        w(f"<tr><td colspan='6' class='right'>製作</td><td class='right'>{prod:,}</td>{fill}")
+        w(f"<tr><td colspan='6' class='right'>專案優惠價 (Budget)</td><td class='right' style='color:red; font-weight:bold;'>{budget:,}</td>{fill}")
+        w(f"<tr><td colspan='6' class='right'>5% VAT</td><td class='right'>{vat:,}</td>{fill}")
+        w(f"<tr class='bg-grand'><td colspan='6' class='right'>Grand Total</td><td class='right'>{grand_total:,}</td>{fill}")
+    w("""</tbody>
+    </table>""")
+
+def preview_page(font_face, body):
+    return f"""
+    <html><head><style>
+    {font_face}{PREVIEW_CSS}{body}"""
+
+# =========================================================
+# Web 版 PDF (WeasyPrint)
+# FontConfiguration / 版面 CSS 每個 thread 建一次 (每次重建都要重新掃系統字型)，各 thread 互不排隊。
+# 中文字型 (完整字型) 在建立時註冊一次；頁面裡給瀏覽器的 @font-face (靜態網址或內嵌子集) 不送進 WeasyPrint，
+# 否則每份 PDF 都會在 FontConfiguration 裡多登記一份字型、越用越大。
+# =========================================================
+_WEASYPRINT_LOCAL = threading.local()
+_FONT_FACE_RE = re.compile(r"@font-face\s*\{[^}]*\}")
+
+def weasyprint_env(font_path=None):
+    envs = _WEASYPRINT_LOCAL.__dict__.setdefault("envs", {})
+    if font_path not in envs:
+        from pathlib import Path
+        from weasyprint import CSS
+        from .font_assets import FONT_FAMILY
+        from weasyprint.text.fonts import FontConfiguration
+        font_config = FontConfiguration()
+        face = f"@font-face {{ font-family: '{FONT_FAMILY}'; src: url({Path(font_path).resolve().as_uri()}); }}" if font_path else ""
+        css = CSS(string=face + "@page { size: A4 landscape; margin: 1cm; } body { font-family: sans-serif; }", font_config=font_config)
+        envs[font_path] = (css, font_config)
+    return envs[font_path]
+
+def html_to_pdf_weasyprint(html_str, fonts=None):
+    # fonts: FontAssets (沒有或找不到字型時用系統字型)
+    with span("pdf.weasyprint") as sp:
+        try:
+            from weasyprint import HTML
+            font_path = fonts.path if fonts is not None and fonts.font_bytes() is not None and os.path.exists(fonts.path) else None
+            css, font_config = weasyprint_env(font_path)
+            pdf_bytes = HTML(string=_FONT_FACE_RE.sub("", html_str)).write_pdf(stylesheets=[css], font_config=font_config)
+            return pdf_bytes, ""
+        except Exception as e:
+            sp["status"] = "fail"
+            return None, str(e)
@@ -0,0 +1,47 @@
+from collections import OrderedDict
+from .render_jobs import plan_fingerprint
+
+# =========================================================
+# 跨 rerun 的計算記憶 (每個 session 一份)
+# Streamlit 每動一個 widget 就整支重跑；改備註日期、客戶名稱這類不影響排程的欄位時，
+# 排程計算與預覽不必重做。key 是輸入的正規化指紋 (config dict 排序後序列化 + 價格表版本)，
+# 價格表一換版本 key 就不同，舊結果自然不會再被用到，等 LRU 擠掉。
+# 回傳的是同一個物件，呼叫端不可修改 (rows / 預覽字串本來就只讀)。
+# 預覽字串內嵌字型，一筆可能上 MB：傳了 size 的項目另計 bytes，超過 max_bytes 也依 LRU 淘汰 (至少留最新一筆)。
+# =========================================================
+class Memo:
+    def __init__(self, max_items=8, max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, fn, size=None):
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+        self.misses += 1
+        value = self._items[key] = fn()
+        if size is not None:
+            self._sizes[key] = size(value)
+            self.bytes += self._sizes[key]
+        while len(self._items) > self.max_items or (self.max_bytes is not None and self.bytes > self.max_bytes and len(self._items) > 1):
+            old, _ = self._items.popitem(last=False)
+            self.bytes -= self._sizes.pop(old, 0)
+        return value
+
+    def clear(self):
+        self._items.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "items": len(self._items), "max_items": self.max_items, "bytes": self.bytes}
+
+def calc_fingerprint(config, total_budget, days_count, pricing):
+    # 沒有版本的價格表 (測試 / 臨時建立) 以物件本身區分
+    return plan_fingerprint("calc", pricing.version or id(pricing), config, total_budget, days_count)
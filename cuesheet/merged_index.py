@@ -0,0 +1,55 @@
+import weakref
+from openpyxl.worksheet.cell_range import CellRange
+
+# =========================================================
+# 合併儲存格索引
+# 每個 worksheet 一份 (row, col) → 左上角 master 的對照表，
+# 寫入 MergedCell 時 O(1) 找到 master，不必每次掃過全部 merged ranges。
+# merge / unmerge 走這裡會就地更新；insert_rows / delete_rows 之後呼叫 rebuild()。
+# 同一格落在多個範圍時，以 ws.merged_cells.ranges 中最先出現的為準 (與原本逐一掃描相同)。
+# =========================================================
+_INDEXES = weakref.WeakKeyDictionary()
+
+class MergedCellIndex:
+    def __init__(self, ws):
+        self._ws = weakref.ref(ws)
+        self._master = {}
+        self.rebuild()
+
+    @staticmethod
+    def _cells(mr):
+        for r in range(mr.min_row, mr.max_row + 1):
+            for c in range(mr.min_col, mr.max_col + 1): yield r, c
+
+    def rebuild(self):
+        self._master = {}
+        for mr in self._ws().merged_cells.ranges: self._add(mr)
+
+    def _add(self, mr):
+        top_left = (mr.min_row, mr.min_col)
+        for rc in self._cells(mr): self._master.setdefault(rc, top_left)
+
+    def master(self, row, col):
+        return self._master.get((row, col))
+
+    def merge(self, rng):
+        ws = self._ws()
+        ws.merge_cells(rng)
+        self._add(CellRange(rng))
+
+    def unmerge(self, rng):
+        ws = self._ws()
+        mr = CellRange(rng)
+        ws.unmerge_cells(rng)
+        top_left = (mr.min_row, mr.min_col)
+        for rc in self._cells(mr):
+            if self._master.get(rc) == top_left: del self._master[rc]
+        # 與其他範圍重疊時 (樣板很少見) 直接重建，維持「先出現者優先」
+        if any(o.min_row <= mr.max_row and o.max_row >= mr.min_row and o.min_col <= mr.max_col and o.max_col >= mr.min_col
+               for o in ws.merged_cells.ranges):
+            self.rebuild()
+
+def merged_index(ws):
+    idx = _INDEXES.get(ws)
+    if idx is None: idx = _INDEXES[ws] = MergedCellIndex(ws)
+    return idx
@@ -0,0 +1,181 @@
+import io
+import json
+import time
+import logging
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =========================================================
+# 熱路徑計時 (spans)
+# with span("excel.save"): ...  → 記進整個 process 共用的統計 (Prometheus 格式由 /metrics 提供)，
+# 目前有 collect() / Trace 在收集的話也附上一筆 (給單次 rerun / 背景 job 的計時面板)，
+# 有設定 JSON log 時每個 span 寫一行。
+# 只用標準函式庫；沒有人收集、沒開 log 時每個 span 只多一次 perf_counter 與一次加總。
+# =========================================================
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_collector = contextvars.ContextVar("cue_span_collector", default=None)
+_parent = contextvars.ContextVar("cue_span_parent", default=None)
+_log = logging.getLogger("cuesheet.metrics")
+_log.propagate = False
+
+class Registry:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._stats = {}  # (span, status) → [bucket 計數..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, status="ok"):
+        key = (name, status)
+        with self._lock:
+            st = self._stats.get(key)
+            if st is None: st = self._stats[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, b in enumerate(self.buckets):
+                if seconds <= b: st[i] += 1
+            st[-2] += 1
+            st[-1] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {f"{name}|{status}": {"count": st[-2], "sum": st[-1]} for (name, status), st in self._stats.items()}
+
+    def prometheus(self):
+        out = ["# HELP cue_stage_seconds 各階段耗時 (秒)", "# TYPE cue_stage_seconds histogram"]
+        with self._lock: items = sorted((k, list(v)) for k, v in self._stats.items())
+        for (name, status), st in items:
+            labels = f'stage="{name}",status="{status}"'
+            for b, n in zip(self.buckets, st):
+                out.append(f'cue_stage_seconds_bucket{{{labels},le="{b:g}"}} {n}')
+            out.append(f'cue_stage_seconds_bucket{{{labels},le="+Inf"}} {st[-2]}')
+            out.append(f"cue_stage_seconds_sum{{{labels}}} {st[-1]:.6f}")
+            out.append(f"cue_stage_seconds_count{{{labels}}} {st[-2]}")
+        return "\n".join(out) + "\n"
+
+REGISTRY = Registry()
+
+@contextmanager
+def span(name, **attrs):
+    # attrs 可在區塊內補上 (例如 attrs["status"] = "fail" 表示沒丟例外但失敗)
+    t0, started = time.perf_counter(), time.time()
+    token = _parent.set(name)
+    try:
+        yield attrs
+    except BaseException:
+        attrs["status"] = "error"
+        raise
+    finally:
+        dt = time.perf_counter() - t0
+        _parent.reset(token)
+        status = attrs.pop("status", "ok")
+        REGISTRY.observe(name, dt, status)
+        spans = _collector.get()
+        if spans is not None or _log.handlers:
+            rec = {"span": name, "ms": round(dt * 1000, 3), "status": status, "parent": _parent.get(), "ts": started, **attrs}
+            if spans is not None: spans.append(rec)
+            if _log.handlers: _log.info(json.dumps(rec, ensure_ascii=False, default=str))
+
+def timed(name):
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name): return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+# ---------- 收集 (單次 rerun / 背景 job) ----------
+@contextmanager
+def collect():
+    spans = []
+    token = _collector.set(spans)
+    try: yield spans
+    finally: _collector.reset(token)
+
+class Trace:
+    # 給沒辦法包成 with 區塊的地方 (Streamlit 整支 script)：activate() 之後這個 thread / context 的 span 都收進來
+    def __init__(self):
+        self.spans = []
+        self.started = time.perf_counter()
+
+    def activate(self):
+        _collector.set(self.spans)
+        _parent.set(None)
+        return self
+
+    @property
+    def elapsed(self): return time.perf_counter() - self.started
+
+# ---------- 輸出 ----------
+def configure_json_log(path):
+    # 每個 span 一行 JSON；同一個路徑只加一次 handler
+    if not path or any(getattr(h, "baseFilename", None) == path for h in _log.handlers): return
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _log.addHandler(handler)
+    _log.setLevel(logging.INFO)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body, ctype = REGISTRY.prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?")[0] == "/metrics.json":
+            body, ctype = json.dumps(REGISTRY.snapshot(), ensure_ascii=False).encode("utf-8"), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): pass
+
+def start_metrics_server(port, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="cue-metrics", daemon=True).start()
+    return server
+
+# ---------- profile (選用) ----------
+class Profile:
+    # mode: "cprofile" (標準函式庫) 或 "pyinstrument" (有安裝才用)；只量目前的 thread
+    def __init__(self, mode="cprofile"):
+        self.mode = mode
+        self._prof = None
+        self.text = ""
+
+    def __enter__(self):
+        try:
+            if self.mode == "pyinstrument":
+                from pyinstrument import Profiler
+                self._prof = Profiler()
+                self._prof.start()
+            else:
+                import cProfile
+                self._prof = cProfile.Profile()
+                self._prof.enable()
+        except (ImportError, ValueError) as e:
+            # 沒裝 pyinstrument，或別的 session 正在 profile (同時只能有一個)
+            self._prof, self.text = None, f"無法啟動 profiler: {e}"
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def stop(self, limit=40):
+        if self._prof is None: return self.text
+        if self.mode == "pyinstrument":
+            self._prof.stop()
+            self.text = self._prof.output_text(unicode=True, color=False)
+        else:
+            import pstats
+            self._prof.disable()
+            buf = io.StringIO()
+            pstats.Stats(self._prof, stream=buf).sort_stats("cumulative").print_stats(limit)
+            self.text = buf.getvalue()
+        self._prof = None
+        return self.text
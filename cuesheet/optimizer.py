@@ -0,0 +1,134 @@
+import time
+import itertools
+import numpy as np
+from .pricing import REGIONS_ORDER, CF_MEDIA
+from .scenarios import MAX_REGIONS, line_budget, evaluate_lines, region_index, evaluate_scenarios
+
+# =========================================================
+# 預算最佳化
+# 給定總預算與限制 (必選媒體、可用區域、佔比上下限、可用秒數)，
+# 找出總檔次 (或店數加權觸及) 最大的 媒體 / 秒數 / 區域 配置。
+#
+# 每個 line (媒體 × 秒數) 的檔次只取決於自己的預算，目標值可直接相加，所以：
+#   1. 每個媒體把「區域組合 × 秒數 × 媒體佔比 × 秒數佔比」一次向量化算完
+#   2. 秒數分配用 DP (每個媒體佔比、區域組合各自求最佳)
+#   3. 最後只在媒體佔比 (總和 100%) 上列舉
+# 懲罰 (未達 Std_Spots x1.1) 由 evaluate_lines 依原規則計算；allow_penalty=False 時未達標的 line 直接排除。
+# =========================================================
+OBJECTIVES = {"spots": "line_spots", "reach": "line_reach"}
+MEDIA_ORDER = ["全家廣播", "新鮮視", CF_MEDIA]
+
+def _region_candidates(allowed):
+    allowed = [r for r in REGIONS_ORDER if r in allowed]
+    cands = []
+    for k in range(1, len(allowed) + 1):
+        for regs in itertools.combinations(allowed, k):
+            cands.append((True, list(REGIONS_ORDER)) if len(regs) == MAX_REGIONS else (False, list(regs)))
+    return cands
+
+def _media_table(P, m, total_budget, shares, pcts, secs, allowed_regions, objective, allow_penalty):
+    # 回傳 value[c, a, u]：區域組合 c、媒體佔比 shares[a]、秒數佔比總和 pcts[u] 時的最佳值，以及回推用的選擇
+    is_cf = m == CF_MEDIA
+    cands = [(False, [])] if is_cf else _region_candidates(allowed_regions)
+    C, S, A, U = len(cands), len(secs), len(shares), len(pcts)
+
+    c_i, s_i, a_i, u_i = [x.ravel() for x in np.meshgrid(np.arange(C), np.arange(S), np.arange(A), np.arange(U), indexing="ij")]
+    nat = np.asarray([c[0] for c in cands], dtype=bool)[c_i]
+    if is_cf:
+        calc = np.asarray([region_index(P, ["量販_全省"])] * C, dtype=np.int64)
+        disp = np.asarray([region_index(P, [])] * C, dtype=np.int64)
+    else:
+        calc = np.asarray([region_index(P, ["全省"] if n else regs) for n, regs in cands], dtype=np.int64)
+        disp = np.asarray([region_index(P, regs) for _, regs in cands], dtype=np.int64)
+    s_budget = line_budget(float(total_budget), shares.astype(np.float64)[a_i], pcts.astype(np.float64)[u_i])
+    out = evaluate_lines(
+        P, np.full(len(c_i), P.media_ids[m], dtype=np.int64), np.asarray(secs, dtype=np.int64)[s_i], s_budget,
+        nat, np.full(len(c_i), is_cf), calc[c_i], disp[c_i],
+    )
+    v = out[OBJECTIVES[objective]].astype(np.float64)
+    if not allow_penalty: v = np.where(out["under"], -np.inf, v)
+    v = v.reshape(C, S, A, U)
+
+    # 秒數佔比 DP：best[c, a, u] = 前 k 個秒數共用掉 pcts[u] 時的最佳值
+    best = np.full((C, A, U), -np.inf)
+    best[:, :, 0] = 0.0
+    choice = np.zeros((S, C, A, U), dtype=np.int64)
+    for k in range(S):
+        nxt = np.full((C, A, U), -np.inf)
+        for u in range(U):
+            for q in range(u + 1):
+                cand = best[:, :, u - q] + v[:, k, :, q]
+                better = cand > nxt[:, :, u]
+                nxt[:, :, u] = np.where(better, cand, nxt[:, :, u])
+                choice[k, :, :, u] = np.where(better, q, choice[k, :, :, u])
+        best = nxt
+    return cands, best[:, :, U - 1], choice
+
+def optimize_budget(pricing, total_budget, media, required=(), regions=None, seconds=None,
+                    min_share=None, max_share=None, objective="spots", share_step=5, sec_step=10, allow_penalty=True):
+    t0 = time.perf_counter()
+    P = pricing
+    if objective not in OBJECTIVES: raise ValueError(f"objective 必須是 {', '.join(OBJECTIVES)}")
+    if 100 % share_step or 100 % sec_step: raise ValueError("share_step / sec_step 必須能整除 100")
+    media = [m for m in MEDIA_ORDER if m in media]
+    if total_budget <= 0 or not media: return None
+    regions, seconds = regions or {}, seconds or {}
+    min_share, max_share = min_share or {}, max_share or {}
+    shares = np.arange(0, 101, share_step)
+    pcts = np.arange(0, 101, sec_step)
+
+    tables = {}
+    evaluated = 0
+    for m in list(media):
+        secs = sorted(set(seconds[m] if m in seconds else [20]))
+        allowed = regions.get(m, REGIONS_ORDER)
+        if not secs or (m != CF_MEDIA and not allowed):
+            if m in required: return None
+            media.remove(m)
+            continue
+        lo = max(min_share.get(m, 0), share_step if m in required else 0)
+        hi = min(max_share.get(m, 100), 100)
+        cands, val, choice = _media_table(P, m, total_budget, shares, pcts, secs, allowed, objective, allow_penalty)
+        evaluated += val.size * len(secs) * len(pcts)
+        # 每個媒體佔比只留最佳的區域組合
+        c_best = np.argmax(val, axis=0)
+        v_best = val[c_best, np.arange(len(shares))]
+        ok = (shares >= lo) & (shares <= hi)
+        v_best = np.where(ok, v_best, -np.inf)
+        if lo == 0: v_best[0] = 0.0
+        tables[m] = (cands, c_best, v_best, choice, secs)
+
+    # 媒體佔比列舉 (總和 100%)
+    if not media: return None
+    best_val, best_combo = -np.inf, None
+    for combo in itertools.product(range(len(shares)), repeat=len(media)):
+        if shares[list(combo)].sum() != 100: continue
+        v = sum(tables[m][2][a] for m, a in zip(media, combo))
+        if v > best_val: best_val, best_combo = v, combo
+    if best_combo is None or not np.isfinite(best_val): return None
+
+    config = {}
+    for m, a in zip(media, best_combo):
+        share = int(shares[a])
+        if share == 0: continue
+        cands, c_best, _, choice, secs = tables[m]
+        c = c_best[a]
+        sec_shares, u = {}, len(pcts) - 1
+        for k in range(len(secs) - 1, -1, -1):
+            q = choice[k, c, a, u]
+            if q > 0: sec_shares[secs[k]] = int(pcts[q])
+            u -= q
+        sec_shares = dict(sorted(sec_shares.items()))
+        if m == CF_MEDIA:
+            config[m] = {"regions": ["全省"], "sec_shares": sec_shares, "share": share}
+        else:
+            nat, regs = cands[c]
+            config[m] = {"is_national": nat, "regions": ["全省"] if nat else regs, "sec_shares": sec_shares, "share": share}
+
+    res = evaluate_scenarios(P, [(config, total_budget)], 1)
+    return {
+        "config": config, "objective": objective, "value": float(best_val),
+        "total_spots": int(res.total_spots[0]), "total_list": int(res.total_list[0]),
+        "reach": int(res.line_reach[res.valid].sum()),
+        "evaluated": int(evaluated), "elapsed": time.perf_counter() - t0,
+    }
@@ -0,0 +1,58 @@
+from array import array
+from datetime import timedelta
+
+# =========================================================
+# 長走期分頁 (不依賴 openpyxl)
+# 樣板一頁最多 MAX_DAYS 天；走期放得下就維持單頁 (與原本輸出相同)，
+# 超過就依月份切頁，單月超過一頁的天數 (聲活 23 天) 再切成數段。
+# 每列的排程只存一份 (array)，各頁取 [offset:offset+days] 的切片；
+# 每日合計整個走期只算一次 (daily_totals)，各頁直接切片，不必每頁每天再掃過所有列。
+# =========================================================
+MAX_DAYS = {"Dongwu": 31, "Shenghuo": 23}
+
+class Page:
+    __slots__ = ("index", "count", "offset", "start", "days")
+
+    def __init__(self, index, count, offset, start, days):
+        self.index = index
+        self.count = count      # 總頁數
+        self.offset = offset    # 在整個走期中的第幾天開始
+        self.start = start
+        self.days = days
+
+    @property
+    def end(self): return self.start + timedelta(days=self.days - 1)
+
+    @property
+    def is_last(self): return self.index == self.count - 1
+
+    @property
+    def title(self):
+        # 工作表名稱 (最多 31 字、不能有 / 等字元)：2026-01；同月切成數段時，後面的段加上起始日 2026-01 (24)
+        return f"{self.start.year}-{self.start.month:02d}" + (f" ({self.start.day})" if self.start.day != 1 and self.index else "")
+
+    def cut(self, schedule):
+        return schedule[self.offset:self.offset + self.days]
+
+def paginate(start_dt, days_count, max_days):
+    if days_count <= max_days: return [Page(0, 1, 0, start_dt, max(days_count, 0))]
+    spans, offset = [], 0
+    while offset < days_count:
+        d = start_dt + timedelta(days=offset)
+        next_month = (d.replace(day=1) + timedelta(days=32)).replace(day=1)
+        n = min((next_month - d).days, max_days, days_count - offset)
+        spans.append((offset, d, n))
+        offset += n
+    return [Page(i, len(spans), off, d, n) for i, (off, d, n) in enumerate(spans)]
+
+def daily_totals(rows, days_count):
+    # 同一媒體 / 秒數的各區共用同一份排程物件：依物件合併、乘上列數，不必每列重加
+    shared = {}
+    for r in rows:
+        ent = shared.get(id(r["schedule"]))
+        if ent is None: shared[id(r["schedule"])] = [r["schedule"], 1]
+        else: ent[1] += 1
+    totals = array("q", bytes(8 * max(days_count, 0)))
+    for sch, n in shared.values():
+        for d, v in enumerate(sch[:days_count]): totals[d] += v * n
+    return totals
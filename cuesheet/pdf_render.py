@@ -0,0 +1,358 @@
+import io
+import zlib
+import hashlib
+from datetime import timedelta
+from .pricing import REGIONS_ORDER
+from .planner import region_display
+from .paging import paginate, daily_totals
+from .sheet_meta import SHEET_META, MONEY_COLS, station_title
+from .excel_stream import STREAM_STYLES, TOTAL_BG, GRAND_BG, MEDIA_ORDER, MAKE_FEE, WEEKDAYS
+from .metrics import span
+
+# =========================================================
+# 原生 PDF (不經 Excel / LibreOffice)
+# 直接從 rows 排版：表頭、日期列、資料列 (東吳的站名 / 全省總價跨列合併)、Total、製作 / VAT / Grand Total、Remarks。
+# 欄位與格式照 SHEET_META，顏色與串流 Excel 相同 (STREAM_STYLES)。
+# 走期依 paginate 分頁 (與 Excel 的工作表相同)，一頁放不下的天數再橫向切；列數超過一頁時換頁並重複表頭。
+# 中文字型只嵌入用到的字 (FontAssets.pdf_subset)，以 Identity-H 編碼，附 ToUnicode 可複製文字。
+# 純 Python、不呼叫外部程式，可以在同一個 process 裡平行產生。
+# =========================================================
+PAGE_W, PAGE_H = 842, 595  # A4 橫向 (pt)
+MARGIN = 24
+ROW_H = 16
+HEAD_H = 14
+DAY_MIN_W = 12.5
+TOTAL_W = 30
+FIXED_W = {"station": 70, "location": 64, "program": 34, "daypart": 54, "seconds": 30, "rate": 54, "pkg": 60}
+FONT_SIZE = 7
+LINE = 1.2
+
+def _rgb(hex_color):
+    h = hex_color.lstrip("#")
+    return " ".join(f"{int(h[i:i + 2], 16) / 255:.3f}" for i in (0, 2, 4))
+
+def _num(v):
+    return f"{v:,}" if isinstance(v, int) else ("" if v is None else str(v))
+
+# ---------- 字型 ----------
+class PdfFont:
+    # 子集字型的度量與編碼；code 為 Identity-H 的 2 bytes (TrueType = glyph id，CID-keyed CFF = CID)
+    def __init__(self, sfnt):
+        from fontTools.ttLib import TTFont
+        self.sfnt = sfnt
+        font = TTFont(io.BytesIO(sfnt))
+        self.upem = font["head"].unitsPerEm
+        self.cff = "CFF " in font
+        cid_keyed = self.cff and hasattr(font["CFF "].cff.topDictIndex[0], "ROS")
+        order = font.getGlyphOrder()
+        gid = {name: i for i, name in enumerate(order)}
+        def code(name): return int(name[3:]) if cid_keyed and name.startswith("cid") else gid[name]
+        hmtx = font["hmtx"].metrics
+        self.codes = {chr(u): code(name) for u, name in font.getBestCmap().items()}
+        self.widths = {code(name): hmtx[name][0] * 1000 / self.upem for name in order}
+        self.notdef = code(order[0])
+        head, hhea = font["head"], font["hhea"]
+        scale = 1000 / self.upem
+        self.bbox = [int(v * scale) for v in (head.xMin, head.yMin, head.xMax, head.yMax)]
+        self.ascent, self.descent = int(hhea.ascent * scale), int(hhea.descent * scale)
+        os2 = font["OS/2"] if "OS/2" in font else None
+        self.cap_height = int(getattr(os2, "sCapHeight", 0) * scale) if os2 else self.ascent
+        name = font["name"].getDebugName(6) or "CueFont"
+        self.name = hashlib.sha256(sfnt).hexdigest()[:6].upper().translate(str.maketrans("0123456789", "GHIJKLMNOP")) + "+" + "".join(c for c in name if c.isalnum() or c == "-")
+        self.used = {}
+
+    def encode(self, text):
+        out = []
+        for ch in text:
+            c = self.codes.get(ch, self.notdef)
+            if c != self.notdef: self.used[c] = ch
+            out.append(f"{c:04X}")
+        return "".join(out)
+
+    def width(self, text, size):
+        return sum(self.widths.get(self.codes.get(ch, self.notdef), 1000) for ch in text) * size / 1000
+
+# ---------- 版面 (先記成繪圖指令，最後才量字寬 / 編碼) ----------
+class _Page:
+    def __init__(self):
+        self.ops = []
+
+    def box(self, x, y, w, h, fill=None, stroke=True):
+        self.ops.append(("box", x, y, w, h, fill, stroke))
+
+    def text(self, x, y, w, h, text, size=FONT_SIZE, align="center", bold=False, color=None):
+        if text not in (None, ""): self.ops.append(("text", x, y, w, h, str(text), size, align, bold, color))
+
+    def cell(self, x, y, w, h, text, fill=None, align="center", bold=False, color=None, size=FONT_SIZE):
+        self.box(x, y, w, h, fill)
+        self.text(x, y, w, h, text, size, align, bold, color)
+
+class _Layout:
+    def __init__(self, format_type, meta, style):
+        self.format_type = format_type
+        self.meta = meta
+        self.style = style
+        self.keys = [k for k in meta["cols"]]
+        self.fixed = [(k, FIXED_W[k]) for k in self.keys]
+        self.fixed_w = sum(w for _, w in self.fixed)
+        self.max_cols = max(1, int((PAGE_W - 2 * MARGIN - self.fixed_w - TOTAL_W) // DAY_MIN_W))
+        self.pages = []
+
+    def new_page(self):
+        page = _Page()
+        self.pages.append(page)
+        return page
+
+def _lines(rows, format_type, meta):
+    # 依 Excel 的區塊順序排好每一列的固定欄文字；東吳的站名、全省聯播總價整個媒體區塊跨列
+    reg_map = {r: i for i, r in enumerate(REGIONS_ORDER + ["全省量販", "全省超市"])}
+    out, spans = [], []
+    for m in MEDIA_ORDER:
+        data = sorted([r for r in rows if r["media"] == m], key=lambda x: (x["seconds"], reg_map.get(x["region"], 999)))
+        if not data: continue
+        first = len(out)
+        for r in data:
+            cells = {"station": station_title(m, format_type), "location": region_display(r["region"]),
+                     "program": int(r.get("program_num", 0)), "daypart": r["daypart"]}
+            if format_type == "Dongwu":
+                cells["seconds"] = f"{r['seconds']}秒" if m == "家樂福" else int(r["seconds"])
+                cells["rate"] = r["rate_display"]
+            else:
+                cells["seconds"] = f"{r['seconds']}秒廣告"
+            cells["pkg"] = None if r.get("is_pkg_member", False) else r["pkg_display"]
+            out.append((cells, r["schedule"]))
+        if meta["station_merge"]: spans.append(("station", first, len(out), station_title(m, format_type)))
+        if data[0].get("is_pkg_member", False) and "pkg" in meta["cols"]: spans.append(("pkg", first, len(out), data[0]["nat_pkg_display"]))
+    return out, spans
+
+def _layout(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, total_list_accum):
+    meta = SHEET_META[format_type]
+    style = STREAM_STYLES[format_type]
+    L = _Layout(format_type, meta, style)
+    days_count = (end_dt - start_dt).days + 1
+    totals = daily_totals(rows, days_count)
+    lines, spans = _lines(rows, format_type, meta)
+    head_fill, head_fg = style["head_bg"], style["head_fg"]
+    vat = int(round((total_list_accum + MAKE_FEE) * 0.05))
+    medium = " ".join(sorted(set(r["media"] for r in rows)))
+    period = f"{start_dt.strftime('%Y. %m. %d')} - {end_dt.strftime('%Y.%m. %d')}"
+    label_w = sum(w for k, w in L.fixed[:L.keys.index("seconds") + 1])
+    money_key = "pkg" if "pkg" in meta["cols"] else "rate"
+
+    # 月份分頁，再依寬度切成數段 (一般 31 天都放得下)
+    chunks = []
+    for mp in paginate(start_dt, days_count, meta["max_days"]):
+        for off in range(0, mp.days, L.max_cols):
+            chunks.append((mp, mp.offset + off, min(L.max_cols, mp.days - off)))
+
+    for ci, (mp, offset, ndays) in enumerate(chunks):
+        last_chunk = ci == len(chunks) - 1
+        day_w = min(24, (PAGE_W - 2 * MARGIN - L.fixed_w - TOTAL_W) / max(ndays, 1))
+        table_w = L.fixed_w + day_w * ndays + TOTAL_W
+        x0 = MARGIN
+        start = start_dt + timedelta(days=offset)
+
+        def header(page):
+            y = PAGE_H - MARGIN
+            page.text(x0, y - 18, table_w, 18, "Media Schedule", size=14, bold=True)
+            y -= 22
+            page.text(x0, y - 11, table_w * 0.6, 11, f"客戶名稱：{client_name}    Product：{product_display_str}", size=8, align="left")
+            page.text(x0 + table_w * 0.6, y - 11, table_w * 0.4, 11, f"{start.year}年{start.month}月" + (f"  ({ci + 1}/{len(chunks)})" if len(chunks) > 1 else ""), size=8, align="right", bold=True)
+            y -= 12
+            page.text(x0, y - 11, table_w, 11, f"Period：{period}    Medium：{medium}", size=8, align="left")
+            y -= 16
+            # 欄名 (跨兩列) + 日期 / 星期
+            x = x0
+            for k, w in L.fixed:
+                page.cell(x, y - 2 * HEAD_H, w, 2 * HEAD_H, style["headers"][k], head_fill, bold=True, color=head_fg)
+                x += w
+            for i in range(ndays):
+                d = start + timedelta(days=i)
+                fill = style["weekend_bg"] if style["weekend_bg"] and d.weekday() >= 5 else head_fill
+                page.cell(x, y - HEAD_H, day_w, HEAD_H, d.day, fill, bold=True, color=head_fg)
+                page.cell(x, y - 2 * HEAD_H, day_w, HEAD_H, WEEKDAYS[d.weekday()], fill, color=head_fg)
+                x += day_w
+            page.cell(x, y - 2 * HEAD_H, TOTAL_W, 2 * HEAD_H, "檔次", head_fill, bold=True, color=head_fg)
+            return y - 2 * HEAD_H
+
+        # 金額欄只放最後一段 (見 sheet_meta 的 MONEY_COLS)
+        def money(k, v): return v if last_chunk or k not in MONEY_COLS else None
+
+        def data_row(page, y, cells, sch, skip):
+            x = x0
+            for k, w in L.fixed:
+                if k not in skip: page.cell(x, y - ROW_H, w, ROW_H, _num(money(k, cells.get(k))), align="center")
+                x += w
+            cut = sch[offset:offset + ndays]
+            for v in cut:
+                page.cell(x, y - ROW_H, day_w, ROW_H, v)
+                x += day_w
+            for _ in range(ndays - len(cut)):
+                page.box(x, y - ROW_H, day_w, ROW_H)
+                x += day_w
+            page.cell(x, y - ROW_H, TOTAL_W, ROW_H, sum(cut), TOTAL_BG, bold=True)
+
+        def col_x(key):
+            x = x0
+            for k, w in L.fixed:
+                if k == key: return x, w
+                x += w
+
+        # 資料列 (放不下就換頁、重複表頭；跨列合併在換頁處切開)
+        footer_h = ROW_H * 4 + 14 + 11 * (len(remarks_list) + 1)
+        page = L.new_page()
+        y = header(page)
+        i = 0
+        while i < len(lines):
+            fit = max(1, int((y - MARGIN) // ROW_H))
+            part = range(i, min(len(lines), i + fit))
+            merged = {}
+            for key, a, b, text in spans:
+                lo, hi = max(a, part.start), min(b, part.stop)
+                if lo < hi: merged[key] = merged.get(key, []) + [(lo, hi, text)]
+            for n, j in enumerate(part):
+                skip = {k for k, rs in merged.items() if any(lo <= j < hi for lo, hi, _ in rs)}
+                data_row(page, y - n * ROW_H, lines[j][0], lines[j][1], skip)
+            for key, rs in merged.items():
+                cx, cw = col_x(key)
+                for lo, hi, text in rs:
+                    top = y - (lo - part.start) * ROW_H
+                    page.cell(cx, top - (hi - lo) * ROW_H, cw, (hi - lo) * ROW_H, _num(money(key, text)))
+            y -= len(part) * ROW_H
+            i = part.stop
+            if i < len(lines):
+                page = L.new_page()
+                y = header(page)
+        if y - footer_h < MARGIN:
+            page = L.new_page()
+            y = header(page)
+
+        # Total / 頁尾 (金額是整個走期的，只放最後一頁)
+        money_x, money_w = col_x(money_key)
+        page.cell(x0, y - ROW_H, label_w, ROW_H, meta["total_label"], TOTAL_BG, align="left", bold=True)
+        x = x0 + label_w
+        for k, w in L.fixed[L.keys.index("seconds") + 1:]:
+            page.cell(x, y - ROW_H, w, ROW_H, _num(total_list_accum) if last_chunk and k == money_key else "", TOTAL_BG, bold=True)
+            x += w
+        cut = totals[offset:offset + ndays]
+        for v in cut:
+            page.cell(x, y - ROW_H, day_w, ROW_H, v, TOTAL_BG, bold=True)
+            x += day_w
+        page.cell(x, y - ROW_H, TOTAL_W, ROW_H, sum(cut), TOTAL_BG, bold=True)
+        y -= ROW_H
+        if last_chunk:
+            for key, amount in (("make", MAKE_FEE), ("vat", vat), ("grand", total_list_accum + MAKE_FEE + vat)):
+                fill = GRAND_BG if key == "grand" else None
+                page.cell(x0, y - ROW_H, label_w, ROW_H, meta["footer_labels"][key], fill, align="left", bold=key == "grand")
+                x = x0 + label_w
+                for k, w in L.fixed[L.keys.index("seconds") + 1:]:
+                    page.cell(x, y - ROW_H, w, ROW_H, _num(amount) if k == money_key else "", fill, bold=key == "grand")
+                    x += w
+                y -= ROW_H
+        y -= 14
+        page.text(x0, y - 11, table_w, 11, "Remarks：", size=7.5, align="left", bold=True)
+        for rm in remarks_list:
+            y -= 11
+            page.text(x0, y - 11, table_w, 11, rm, size=6.5, align="left")
+    return L.pages
+
+def _all_text(pages):
+    return "".join(op[5] for p in pages for op in p.ops if op[0] == "text")
+
+# ---------- 輸出 ----------
+def _content(page, font):
+    out = ["0.5 w 0 0 0 RG"]
+    for op in page.ops:
+        if op[0] == "box":
+            _, x, y, w, h, fill, stroke = op
+            if fill: out.append(f"{_rgb(fill)} rg {x:.2f} {y:.2f} {w:.2f} {h:.2f} re {'B' if stroke else 'f'}")
+            elif stroke: out.append(f"{x:.2f} {y:.2f} {w:.2f} {h:.2f} re S")
+            continue
+        _, x, y, w, h, text, size, align, bold, color = op
+        lines = text.split("\n")
+        # 放不下就縮小字級 (最小 4pt)
+        avail = w - 3
+        widest = max(font.width(t, size) for t in lines)
+        if widest > avail: size = max(4.0, size * avail / widest)
+        block = size * LINE * len(lines)
+        base = y + (h + block) / 2 - size * 0.95
+        rgb = _rgb(color) if color else "0 0 0"
+        out.append(f"BT /F1 {size:.2f} Tf {rgb} rg {rgb} RG {'2 Tr 0.25 w' if bold else '0 Tr'}")
+        for n, t in enumerate(lines):
+            tw = font.width(t, size)
+            tx = x + 1.5 if align == "left" else x + w - 1.5 - tw if align == "right" else x + (w - tw) / 2
+            out.append(f"1 0 0 1 {tx:.2f} {base - n * size * LINE:.2f} Tm <{font.encode(t)}> Tj")
+        out.append("ET 0 0 0 RG 0.5 w")
+    return "\n".join(out).encode("latin-1")
+
+def _tounicode(used):
+    entries = sorted(used.items())
+    out = ["/CIDInit /ProcSet findresource begin 12 dict begin begincmap",
+           "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+           "/CMapName /Adobe-Identity-UCS def /CMapType 2 def",
+           "1 begincodespacerange <0000> <FFFF> endcodespacerange"]
+    for i in range(0, len(entries), 100):
+        part = entries[i:i + 100]
+        out.append(f"{len(part)} beginbfchar")
+        out += [f"<{c:04X}> <{ch.encode('utf-16-be').hex().upper()}>" for c, ch in part]
+        out.append("endbfchar")
+    out.append("endcmap CMapName currentdict /CMap defineresource pop end end")
+    return "\n".join(out).encode("ascii")
+
+def _write_pdf(pages, font):
+    objs = []
+    def add(body):
+        objs.append(body)
+        return len(objs)
+    def stream(data, extra=""):
+        z = zlib.compress(data)
+        return f"<< /Length {len(z)} /Filter /FlateDecode{extra} >>\nstream\n".encode("latin-1") + z + b"\nendstream"
+
+    contents = [_content(p, font) for p in pages]  # 先編碼完所有文字，才知道用到哪些字 (ToUnicode / W)
+    catalog, pages_id = add(None), add(None)
+    if font.cff: ff = add(stream(font.sfnt, " /Subtype /OpenType"))
+    else: ff = add(stream(font.sfnt, f" /Length1 {len(font.sfnt)}"))
+    desc = add(f"<< /Type /FontDescriptor /FontName /{font.name} /Flags 4 /FontBBox [{' '.join(map(str, font.bbox))}] /ItalicAngle 0 "
+               f"/Ascent {font.ascent} /Descent {font.descent} /CapHeight {font.cap_height} /StemV 80 /{'FontFile3' if font.cff else 'FontFile2'} {ff} 0 R >>".encode("latin-1"))
+    widths = " ".join(f"{c} [{font.widths.get(c, 1000):.0f}]" for c in sorted(set(font.used) | {font.notdef}))
+    cid = add(f"<< /Type /Font /Subtype /{'CIDFontType0' if font.cff else 'CIDFontType2'} /BaseFont /{font.name} "
+              f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> /FontDescriptor {desc} 0 R "
+              f"/DW 1000 /W [{widths}]{'' if font.cff else ' /CIDToGIDMap /Identity'} >>".encode("latin-1"))
+    tu = add(stream(_tounicode(font.used)))
+    f1 = add(f"<< /Type /Font /Subtype /Type0 /BaseFont /{font.name} /Encoding /Identity-H /DescendantFonts [{cid} 0 R] /ToUnicode {tu} 0 R >>".encode("latin-1"))
+    kids = []
+    for data in contents:
+        c = add(stream(data))
+        kids.append(add(f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 {PAGE_W} {PAGE_H}] /Resources << /Font << /F1 {f1} 0 R >> >> /Contents {c} 0 R >>".encode("latin-1")))
+    objs[pages_id - 1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode("latin-1")
+    objs[catalog - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode("latin-1")
+    # 不放 /CreationDate：同一份計畫每次輸出都要一模一樣 (快取 / 比對用)；/ID 取內容雜湊
+    info = add(b"<< /Producer (cuesheet) >>")
+    doc_id = hashlib.md5(b"".join(objs)).hexdigest()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for i, body in enumerate(objs, 1):
+        offsets.append(out.tell())
+        out.write(f"{i} 0 obj\n".encode("latin-1") + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for off in offsets: out.write(f"{off:010d} 00000 n \n".encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objs) + 1} /Root {catalog} 0 R /Info {info} 0 R /ID [<{doc_id}> <{doc_id}>] >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue()
+
+def render_pdf(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, total_list_accum, fonts):
+    # fonts: FontAssets (子集依字集快取)。回傳 (pdf bytes, 錯誤訊息)；沒有中文字型時回傳錯誤，由呼叫端改走其他 PDF 路徑
+    with span("pdf.native") as sp:
+        try:
+            if format_type not in SHEET_META: return None, f"未知的格式: {format_type}"
+            pages = _layout(format_type, start_dt, end_dt, client_name, product_display_str, rows, remarks_list, total_list_accum)
+            sfnt = fonts.pdf_subset(_all_text(pages)) if fonts is not None else None
+            if sfnt is None:
+                sp["status"] = "fail"
+                return None, "沒有可嵌入的中文字型 (或未安裝 fontTools)"
+            return _write_pdf(pages, PdfFont(sfnt)), ""
+        except Exception as e:
+            sp["status"] = "fail"
+            return None, str(e)
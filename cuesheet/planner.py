@@ -0,0 +1,141 @@
+import re
+import math
+from array import array
+from .pricing import REGIONS_ORDER, PKG_MEDIA, CF_HYPER, CF_SUPER
+from .metrics import timed
+
+# =========================================================
+# 排程計算核心 (不依賴 Streamlit)
+# UI 與批次產出共用；價格表由呼叫端傳入 (PricingIndex)，不讀全域變數。
+# =========================================================
+def safe_filename(name: str) -> str:
+    return re.sub(r'[\\/*?:"<>|]', "_", name).strip()
+
+def html_escape(s):
+    if s is None: return ""
+    return str(s).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;").replace("'", "&#39;")
+
+REGION_DISPLAY_MAP = {
+    "北區": "北區-北北基", "桃竹苗": "桃區-桃竹苗", "中區": "中區-中彰投",
+    "雲嘉南": "雲嘉南區-雲嘉南", "高屏": "高屏區-高屏", "東區": "東區-宜花東",
+    "全省量販": "全省量販", "全省超市": "全省超市"
+}
+def region_display(region): return REGION_DISPLAY_MAP.get(region, region)
+
+def calculate_schedule(total_spots, days):
+    # 每日檔次存成 array (長走期一列上百天也只佔 4 bytes / 天)；同一媒體 / 秒數的各區共用同一份
+    if days <= 0: return array("I")
+    if total_spots % 2 != 0: total_spots += 1
+    half_spots = total_spots // 2
+    base, rem = divmod(half_spots, days)
+    return array("I", [(base + (1 if i < rem else 0)) * 2 for i in range(days)])
+
+def get_remarks_text(sign_deadline, billing_month, payment_date):
+    d_str = sign_deadline.strftime("%Y/%m/%d (%a) %H:%M") if sign_deadline else "____/__/__ (__) 12:00"
+    p_str = payment_date.strftime("%Y/%m/%d") if payment_date else "____/__/__"
+    return [
+        f"1.請於 {d_str}前 回簽及進單，方可順利上檔。",
+        "2.以上節目名稱如有異動，以上檔時節目名稱為主，如遇時段滿檔，上檔時間挪後或更換至同級時段。",
+        "3.通路店鋪數與開機率至少七成(以上)。每日因加盟數調整，或遇店舖年度季度改裝、設備維護升級及保修等狀況，會有一定幅度增減。",
+        "4.託播方需於上檔前 5 個工作天，提供廣告帶(mp3)、影片/影像 1920x1080 (mp4)。",
+        f"5.雙方同意費用請款月份 : {billing_month}，如有修正必要，將另行E-Mail告知，並視為正式合約之一部分。",
+        f"6.付款兌現日期：{p_str}"
+    ]
+
+
+# =========================================================
+# 核心計算函式 (Logic v4.5)
+# =========================================================
+@timed("calc")
+def calculate_plan_data(config, total_budget, days_count, pricing):
+    rows = []
+    total_list_accum = 0
+    debug_logs = []
+
+    for m, cfg in config.items():
+        m_budget_total = total_budget * (cfg["share"] / 100.0)
+        
+        for sec, sec_pct in cfg["sec_shares"].items():
+            s_budget = m_budget_total * (sec_pct / 100.0)
+            if s_budget <= 0: continue
+            
+            if m in PKG_MEDIA:
+                std_spots = pricing.std_spots(m)
+                calc_regs = ["全省"] if cfg["is_national"] else cfg["regions"]
+                display_regs = REGIONS_ORDER if cfg["is_national"] else cfg["regions"]
+                
+                unit_net_sum = 0
+                for r in calc_regs:
+                    unit_net_sum += pricing.unit_net(m, r, sec)
+                if unit_net_sum == 0: continue
+                
+                spots_init = math.ceil(s_budget / unit_net_sum)
+                is_under_target = spots_init < std_spots
+                calc_penalty = 1.1 if is_under_target else 1.0 
+                
+                if cfg["is_national"]:
+                    row_display_penalty = 1.0 
+                    total_display_penalty = 1.1 if is_under_target else 1.0
+                    status_msg = "全省(分區豁免/總價懲罰)" if is_under_target else "達標"
+                else:
+                    row_display_penalty = 1.1 if is_under_target else 1.0
+                    total_display_penalty = 1.0 
+                    status_msg = "未達標 x1.1" if is_under_target else "達標"
+
+                spots_final = math.ceil(s_budget / (unit_net_sum * calc_penalty))
+                if spots_final % 2 != 0: spots_final += 1
+                if spots_final == 0: spots_final = 2
+                
+                debug_logs.append({"media": m, "seconds": sec, "budget": s_budget, "net_unit": unit_net_sum, "std_spots": std_spots, "init_spots": spots_init, "status": status_msg, "penalty": calc_penalty, "final_spots": spots_final})
+
+                sch = calculate_schedule(spots_final, days_count)
+
+                nat_pkg_display = 0
+                if cfg["is_national"]:
+                    nat_unit_price = int(pricing.unit_list(m, "全省", sec) * total_display_penalty)
+                    nat_pkg_display = nat_unit_price * spots_final
+                    total_list_accum += nat_pkg_display
+
+                for i, r in enumerate(display_regs):
+                    unit_rate_display = int(pricing.unit_list(m, r, sec) * row_display_penalty)
+                    total_rate_display = unit_rate_display * spots_final 
+                    row_pkg_display = total_rate_display
+                    if not cfg["is_national"]:
+                        total_list_accum += row_pkg_display
+
+                    rows.append({
+                        "media": m, "region": r,
+                        "program_num": pricing.store_count(f"新鮮視_{r}" if m=="新鮮視" else r),
+                        "daypart": pricing.day_part(m), "seconds": sec,
+                        "spots": spots_final, "schedule": sch,
+                        "rate_display": total_rate_display, 
+                        "pkg_display": row_pkg_display,
+                        "is_pkg_member": cfg["is_national"],
+                        "nat_pkg_display": nat_pkg_display
+                    })
+
+            elif m == "家樂福":
+                base_std = pricing.std_spots(m, CF_HYPER)
+                unit_net = pricing.unit_net(m, CF_HYPER, sec)
+                spots_init = math.ceil(s_budget / unit_net)
+                penalty = 1.1 if spots_init < base_std else 1.0
+                status_msg = "未達標 x1.1" if penalty > 1 else "達標"
+                
+                spots_final = math.ceil(s_budget / (unit_net * penalty))
+                if spots_final % 2 != 0: spots_final += 1
+                sch_h = calculate_schedule(spots_final, days_count)
+                
+                debug_logs.append({"media": m, "seconds": sec, "budget": s_budget, "net_unit": unit_net, "std_spots": base_std, "init_spots": spots_init, "status": status_msg, "penalty": penalty, "final_spots": spots_final})
+                
+                unit_rate_h = int(pricing.unit_list(m, CF_HYPER, sec) * penalty)
+                total_rate_h = unit_rate_h * spots_final
+                total_list_accum += total_rate_h
+                
+                rows.append({"media": m, "region": "全省量販", "program_num": pricing.store_count("家樂福_量販"), "daypart": pricing.day_part(m, CF_HYPER), "seconds": sec, "spots": spots_final, "schedule": sch_h, "rate_display": total_rate_h, "pkg_display": total_rate_h, "is_pkg_member": False})
+                
+                spots_s = int(spots_final * (pricing.std_spots(m, CF_SUPER) / base_std))
+                sch_s = calculate_schedule(spots_s, days_count)
+                rows.append({"media": m, "region": "全省超市", "program_num": pricing.store_count("家樂福_超市"), "daypart": pricing.day_part(m, CF_SUPER), "seconds": sec, "spots": spots_s, "schedule": sch_s, "rate_display": "計量販", "pkg_display": "計量販", "is_pkg_member": False})
+
+    return rows, total_list_accum, debug_logs
+
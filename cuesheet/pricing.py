@@ -0,0 +1,185 @@
+import re
+import numpy as np
+
+# =========================================================
+# 編譯後的價格索引 (唯讀)
+# 由三張表以 pandas 向量運算一次建好，並預先算好每個 (媒體, 區域, 秒數)
+# 的 Net / List 單檔價；計算迴圈只做 O(1) 的陣列讀取。
+# 表格有缺漏時在載入階段就報錯，而不是算到一半才 KeyError。
+# =========================================================
+REGIONS_ORDER = ["北區", "桃竹苗", "中區", "雲嘉南", "高屏", "東區"]
+DURATIONS = [5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60]
+
+PKG_MEDIA = ("全家廣播", "新鮮視")  # 分區 / 全省聯播計價
+CF_MEDIA = "家樂福"                  # 量販 + 超市
+CF_HYPER, CF_SUPER = "量販_全省", "超市_全省"
+REQUIRED_REGIONS = {
+    "全家廣播": REGIONS_ORDER + ["全省"],
+    "新鮮視": REGIONS_ORDER + ["全省"],
+    CF_MEDIA: [CF_HYPER, CF_SUPER],
+}
+REQUIRED_STORE_KEYS = ["家樂福_量販", "家樂福_超市"]
+
+def parse_count_to_int(x):
+    if x is None: return 0
+    if isinstance(x, (int, float)): return int(x)
+    s = str(x)
+    m = re.findall(r"[\d,]+", s)
+    if not m: return 0
+    return int(m[0].replace(",", ""))
+
+class PricingError(ValueError):
+    pass
+
+def _frozen(a):
+    a.flags.writeable = False
+    return a
+
+def _nested(a):
+    return tuple(tuple(x.tolist()) if x.ndim == 1 else _nested(x) for x in a)
+
+class PricingIndex:
+    __slots__ = (
+        "version", "media_ids", "region_ids", "sec_ids",
+        "list_prices", "net_prices", "std_table", "rate_std", "media_std", "day_parts",
+        "factors", "unit_nets", "unit_lists",
+        "_list", "_net", "_std", "_media_std", "_day_part", "_factor", "_unit_net", "_unit_list",
+        "store_names", "store_counts",
+    )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PricingIndex is read-only")
+
+    def _set(self, **kw):
+        for k, v in kw.items(): object.__setattr__(self, k, v)
+
+    def __getstate__(self): return {k: getattr(self, k) for k in self.__slots__}
+
+    def __setstate__(self, state):
+        self._set(**{k: _frozen(v) if isinstance(v, np.ndarray) else v for k, v in state.items()})
+
+    # ---------- 建立 ----------
+    @classmethod
+    def from_frames(cls, frames, version=None):
+        import pandas as pd
+        problems = []
+        df_store, df_fact, df_price = frames["Stores"], frames["Factors"], frames["Pricing"]
+
+        store_names = dict(zip(df_store["Key"], df_store["Display_Name"]))
+        store_counts = dict(zip(df_store["Key"], df_store["Count"]))
+        for k in REQUIRED_STORE_KEYS:
+            if k not in store_counts: problems.append(f"Stores 缺少 {k}")
+
+        price = df_price[["Media", "Region", "List_Price", "Net_Price", "Std_Spots", "Day_Part"]].copy()
+        num_cols = ["List_Price", "Net_Price", "Std_Spots"]
+        price[num_cols] = price[num_cols].apply(pd.to_numeric, errors="coerce")
+        bad = price.index[price[num_cols].isna().any(axis=1)]
+        if len(bad): problems.append(f"Pricing 第 {', '.join(str(i + 2) for i in bad[:5])} 列價格/檔次不是數字")
+        price = price.drop(index=bad)
+
+        fact = df_fact[["Media", "Seconds", "Factor"]].copy()
+        fact[["Seconds", "Factor"]] = fact[["Seconds", "Factor"]].apply(pd.to_numeric, errors="coerce")
+        bad = fact.index[fact[["Seconds", "Factor"]].isna().any(axis=1)]
+        if len(bad): problems.append(f"Factors 第 {', '.join(str(i + 2) for i in bad[:5])} 列秒數/係數不是數字")
+        fact = fact.drop(index=bad)
+
+        medias = list(dict.fromkeys(list(REQUIRED_REGIONS) + list(price["Media"].unique()) + list(fact["Media"].unique())))
+        regions = list(dict.fromkeys(REGIONS_ORDER + ["全省", CF_HYPER, CF_SUPER] + list(price["Region"].unique())))
+        secs = sorted(set(DURATIONS) | set(int(s) for s in fact["Seconds"]))
+        media_ids = {m: i for i, m in enumerate(medias)}
+        region_ids = {r: i for i, r in enumerate(regions)}
+        sec_ids = {s: i for i, s in enumerate(secs)}
+        M, R, S = len(medias), len(regions), len(secs)
+
+        # 同一 (媒體, 區域) 重複時以最後一列為準；媒體層級的 Std_Spots / Day_Part 取該媒體第一列
+        first = price.groupby("Media", sort=False)[["Std_Spots", "Day_Part"]].first()
+        price = price.drop_duplicates(["Media", "Region"], keep="last")
+        mi = price["Media"].map(media_ids).to_numpy()
+        ri = price["Region"].map(region_ids).to_numpy()
+
+        present = np.zeros((M, R), dtype=bool)
+        present[mi, ri] = True
+        list_price = np.zeros((M, R), dtype=np.int64)
+        net_price = np.zeros((M, R), dtype=np.int64)
+        std_spots = np.zeros((M, R), dtype=np.int64)
+        day_part = np.full((M, R), None, dtype=object)
+        list_price[mi, ri] = price["List_Price"].astype(np.int64).to_numpy()
+        net_price[mi, ri] = price["Net_Price"].astype(np.int64).to_numpy()
+        std_spots[mi, ri] = price["Std_Spots"].astype(np.int64).to_numpy()
+        day_part[mi, ri] = price["Day_Part"].to_numpy()
+
+        media_std = np.zeros(M, dtype=np.int64)
+        media_day_part = np.full(M, None, dtype=object)
+        fm = first.index.map(media_ids).to_numpy()
+        media_std[fm] = first["Std_Spots"].astype(np.int64).to_numpy()
+        media_day_part[fm] = first["Day_Part"].to_numpy()
+
+        for m, regs in REQUIRED_REGIONS.items():
+            missing = [r for r in regs if not present[media_ids[m], region_ids[r]]]
+            if missing: problems.append(f"Pricing 缺少 {m}: {', '.join(missing)}")
+            elif (std_spots[media_ids[m], [region_ids[r] for r in regs]] <= 0).any() or media_std[media_ids[m]] <= 0:
+                problems.append(f"Pricing {m} 的 Std_Spots 必須大於 0")
+        if problems: raise PricingError("；".join(problems))
+
+        # 分區媒體用媒體層級 Std_Spots；家樂福各列用自己的 Std_Spots
+        rate_std = np.repeat(media_std[:, None], R, axis=1)
+        cf = media_ids[CF_MEDIA]
+        rate_std[cf] = std_spots[cf]
+        for m in PKG_MEDIA: day_part[media_ids[m]] = media_day_part[media_ids[m]]
+
+        factor = np.ones((M, S), dtype=np.float64)
+        fact = fact.drop_duplicates(["Media", "Seconds"], keep="last")
+        factor[fact["Media"].map(media_ids).to_numpy(), fact["Seconds"].astype(int).map(sec_ids).to_numpy()] = fact["Factor"].astype(float).to_numpy()
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            unit_net = (net_price / rate_std)[:, :, None] * factor[:, None, :]
+            unit_list = (list_price / rate_std)[:, :, None] * factor[:, None, :]
+
+        idx = object.__new__(cls)
+        idx._set(
+            version=version, media_ids=media_ids, region_ids=region_ids, sec_ids=sec_ids,
+            list_prices=_frozen(list_price), net_prices=_frozen(net_price), std_table=_frozen(std_spots),
+            rate_std=_frozen(rate_std), media_std=_frozen(media_std), day_parts=_frozen(day_part),
+            factors=_frozen(factor), unit_nets=_frozen(unit_net), unit_lists=_frozen(unit_list),
+            _list=_nested(list_price), _net=_nested(net_price), _std=_nested(std_spots),
+            _media_std=tuple(media_std.tolist()), _day_part=_nested(day_part), _factor=_nested(factor),
+            _unit_net=_nested(unit_net), _unit_list=_nested(unit_list),
+            store_names=store_names, store_counts=store_counts,
+        )
+        return idx
+
+    # ---------- 查詢 (O(1)) ----------
+    def sec_factor(self, media, seconds):
+        m, s = self.media_ids.get(media), self.sec_ids.get(seconds)
+        if m is None or s is None: return 1.0
+        return self._factor[m][s]
+
+    def unit_net(self, media, region, seconds):
+        m, r = self.media_ids[media], self.region_ids[region]
+        s = self.sec_ids.get(seconds)
+        if s is None: return (self._net[m][r] / self._rate_std(m, r)) * 1.0
+        return self._unit_net[m][r][s]
+
+    def unit_list(self, media, region, seconds):
+        m, r = self.media_ids[media], self.region_ids[region]
+        s = self.sec_ids.get(seconds)
+        if s is None: return (self._list[m][r] / self._rate_std(m, r)) * 1.0
+        return self._unit_list[m][r][s]
+
+    def _rate_std(self, m, r):
+        return self._std[m][r] if m == self.media_ids[CF_MEDIA] else self._media_std[m]
+
+    def std_spots(self, media, region=None):
+        m = self.media_ids[media]
+        if region is None: return self._media_std[m]
+        return self._std[m][self.region_ids[region]]
+
+    def day_part(self, media, region=None):
+        m = self.media_ids[media]
+        return self._day_part[m][self.region_ids[region] if region is not None else self.region_ids["全省"]]
+
+    def list_price(self, media, region): return self._list[self.media_ids[media]][self.region_ids[region]]
+
+    def net_price(self, media, region): return self._net[self.media_ids[media]][self.region_ids[region]]
+
+    def store_count(self, key, default=0): return self.store_counts.get(key, default)
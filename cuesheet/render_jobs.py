@@ -0,0 +1,116 @@
+import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+# =========================================================
+# 背景渲染佇列
+# Excel / PDF 在背景執行緒產生，不卡 Streamlit rerun。
+# 每個 owner (session) 同時只保留一個 job；輸入一變 (fingerprint 不同) 舊 job 即取消。
+# 輸入相同時沿用現有 job，但失敗 (例如 LibreOffice / 字型的暫時性錯誤) 或被取消的會重送。
+# =========================================================
+def _canon(o):
+    if isinstance(o, (datetime, date)): return o.isoformat()
+    if isinstance(o, (bytes, bytearray)): return hashlib.sha256(o).hexdigest()
+    if isinstance(o, (set, frozenset)): return sorted(o, key=str)
+    return str(o)
+
+def plan_fingerprint(*parts):
+    payload = json.dumps(parts, default=_canon, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class JobCancelled(Exception):
+    pass
+
+class RenderJob:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def done(self): return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def cancelled(self): return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None and self.future.cancel(): self._finish("cancelled")
+
+    def check_cancelled(self):
+        # 給渲染函式在各階段之間呼叫，讓執行中的舊 job 盡早放棄
+        if self._cancel.is_set(): raise JobCancelled()
+
+    def wait(self, timeout=None):
+        if self.future is None: return self
+        try: self.future.result(timeout=timeout)
+        except Exception: pass
+        return self
+
+    def _finish(self, status):
+        self.status = status
+        self.finished_at = time.time()
+
+    def _run(self, fn, args, kwargs):
+        if self._cancel.is_set(): return self._finish("cancelled")
+        self.status = "running"
+        try:
+            self.result = fn(self, *args, **kwargs)
+            self._finish("cancelled" if self._cancel.is_set() else "done")
+        except JobCancelled:
+            self._finish("cancelled")
+        except Exception as e:
+            self.error = str(e)
+            self._finish("failed")
+
+class RenderJobQueue:
+    def __init__(self, max_workers=2, max_owners=256):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cue-render")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_owners = max_owners
+
+    def submit(self, owner, fingerprint, fn, *args, **kwargs):
+        with self._lock:
+            cur = self._jobs.get(owner)
+            # 同一份輸入只沿用排隊 / 執行中 / 已完成的 job；失敗或取消的重送一次 (暫時性錯誤不必改設定才能重試)
+            if cur is not None and cur.fingerprint == fingerprint and cur.status in ("queued", "running", "done"):
+                self._jobs.move_to_end(owner)
+                return cur
+            if cur is not None: cur.cancel()
+
+            job = RenderJob(fingerprint)
+            job.future = self._pool.submit(job._run, fn, args, kwargs)
+            self._jobs[owner] = job
+            self._jobs.move_to_end(owner)
+            while len(self._jobs) > self.max_owners:
+                _, old = self._jobs.popitem(last=False)
+                old.cancel()
+            return job
+
+    def get(self, owner):
+        with self._lock: return self._jobs.get(owner)
+
+    def cancel(self, owner):
+        with self._lock: job = self._jobs.pop(owner, None)
+        if job is not None: job.cancel()
+
+    def stats(self):
+        with self._lock: jobs = list(self._jobs.values())
+        counts = {}
+        for j in jobs: counts[j.status] = counts.get(j.status, 0) + 1
+        return counts
+
+    def shutdown(self):
+        with self._lock: jobs = list(self._jobs.values())
+        for j in jobs: j.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,234 @@
+import itertools
+from array import array
+import numpy as np
+from .pricing import REGIONS_ORDER, PKG_MEDIA, CF_MEDIA, CF_HYPER, CF_SUPER, parse_count_to_int
+
+# =========================================================
+# 批次情境試算 (向量化版 calculate_plan_data)
+# 把 N 個 (config, 預算) 攤平成「媒體 × 秒數」的 line 陣列，一次用 NumPy 算完
+# 檔次、懲罰、List 總價與走期分配。運算順序與單筆版逐一對齊，結果完全相同。
+# Debug 紀錄只存原始數字，要顯示時才 format_debug_log()。
+# =========================================================
+MAX_REGIONS = len(REGIONS_ORDER)
+
+def format_debug_log(rec):
+    return {
+        "Media": f"{rec['media']} ({rec['seconds']}s)",
+        "Budget": f"${rec['budget']:,.0f}",
+        "Net_Unit": f"${rec['net_unit']:.2f}",
+        "Std_Spots": f"{rec['std_spots']}",
+        "Init_Spots": f"{rec['init_spots']}",
+        "Penalty_Status": rec["status"],
+        "Penalty_Factor": f"x{rec['penalty']}",
+        "Final_Cost": f"${rec['net_unit'] * rec['penalty']:.2f}",
+        "Final_Spots": rec["final_spots"],
+    }
+
+def schedule_matrix(spots, days):
+    # calculate_schedule 的向量版：每列一個 line，每欄一天
+    spots = np.asarray(spots, dtype=np.int64)
+    if days <= 0: return np.zeros((len(spots), 0), dtype=np.int64)
+    half = (spots + spots % 2) // 2
+    base, rem = np.divmod(half, days)
+    return 2 * (base[:, None] + (np.arange(days)[None, :] < rem[:, None]))
+
+def scenario_grid(base_config, budgets, shares=(None,), sec_splits=(None,), region_sets=(None,)):
+    # 每個軸是一串「覆寫值」：shares=[{媒體: %}]、sec_splits=[{媒體: {秒: %}}]、region_sets=[{媒體: [區域]}]
+    for budget, sh, ss, rs in itertools.product(budgets, shares, sec_splits, region_sets):
+        cfg = {m: dict(c) for m, c in base_config.items()}
+        for m, v in (sh or {}).items():
+            if m in cfg: cfg[m]["share"] = v
+        for m, v in (ss or {}).items():
+            if m in cfg: cfg[m]["sec_shares"] = dict(v)
+        for m, regs in (rs or {}).items():
+            if m not in cfg or m == CF_MEDIA: continue
+            nat = list(regs) == ["全省"] or len(regs) == MAX_REGIONS
+            cfg[m]["is_national"], cfg[m]["regions"] = nat, ["全省"] if nat else list(regs)
+        yield cfg, budget
+
+class ScenarioResults:
+    def __init__(self, pricing, scenarios, days_count, lines, arrays):
+        self.pricing = pricing
+        self.scenarios = scenarios
+        self.days = days_count
+        self.n = len(scenarios)
+        self._lines = lines
+        for k, v in arrays.items(): setattr(self, k, v)
+
+    def scenario_lines(self, i):
+        lo, hi = self.line_start[i], self.line_start[i + 1]
+        return [j for j in range(lo, hi) if self.valid[j]]
+
+    def schedules(self):
+        return schedule_matrix(self.spots, self.days)
+
+    def total_list_accum(self, i): return int(self.total_list[i])
+
+    def rows(self, i):
+        # 還原成與 calculate_plan_data 相同結構的 rows (每日檔次同樣是 array("I")，同一 line 的各區共用一份)
+        P, days = self.pricing, self.days
+        out = []
+        for j in self.scenario_lines(i):
+            m, sec, disp, nat = self._lines[j]
+            spots = int(self.spots[j])
+            sch = array("I", schedule_matrix([spots], days)[0].tolist())
+            if m in PKG_MEDIA:
+                pen = 1.0 if nat else float(self.penalty[j])
+                nat_pkg = int(self.line_list[j]) if nat else 0
+                for r in disp:
+                    rate = int(P.unit_list(m, r, sec) * pen) * spots
+                    out.append({
+                        "media": m, "region": r,
+                        "program_num": P.store_count(f"新鮮視_{r}" if m == "新鮮視" else r),
+                        "daypart": P.day_part(m), "seconds": sec,
+                        "spots": spots, "schedule": sch,
+                        "rate_display": rate, "pkg_display": rate,
+                        "is_pkg_member": nat, "nat_pkg_display": nat_pkg,
+                    })
+            else:
+                rate = int(self.line_list[j])
+                spots_s = int(self.spots_super[j])
+                out.append({"media": m, "region": "全省量販", "program_num": P.store_count("家樂福_量販"), "daypart": P.day_part(m, CF_HYPER), "seconds": sec, "spots": spots, "schedule": sch, "rate_display": rate, "pkg_display": rate, "is_pkg_member": False})
+                out.append({"media": m, "region": "全省超市", "program_num": P.store_count("家樂福_超市"), "daypart": P.day_part(m, CF_SUPER), "seconds": sec, "spots": spots_s, "schedule": array("I", schedule_matrix([spots_s], days)[0].tolist()), "rate_display": "計量販", "pkg_display": "計量販", "is_pkg_member": False})
+        return out
+
+    def debug_records(self, i):
+        recs = []
+        for j in self.scenario_lines(i):
+            m, sec, _, nat = self._lines[j]
+            under = bool(self.under[j])
+            if m in PKG_MEDIA and nat: status = "全省(分區豁免/總價懲罰)" if under else "達標"
+            else: status = "未達標 x1.1" if under else "達標"
+            recs.append({
+                "media": m, "seconds": sec, "budget": float(self.budget[j]), "net_unit": float(self.unit_net[j]),
+                "std_spots": int(self.std_spots[j]), "init_spots": int(self.spots_init[j]), "status": status,
+                "penalty": float(self.penalty[j]), "final_spots": int(self.spots[j]),
+            })
+        return recs
+
+    def debug_logs(self, i): return [format_debug_log(r) for r in self.debug_records(i)]
+
+    def result(self, i): return self.rows(i), self.total_list_accum(i), self.debug_records(i)
+
+def line_budget(total_budget, share, pct):
+    # 與 calculate_plan_data 相同的乘法順序
+    return (total_budget * (share / 100.0)) * (pct / 100.0)
+
+def evaluate_lines(P, mid, sec_v, s_budget, nat, is_cf, calc_idx, disp_idx):
+    # 向量化核心：每個 line = 一個 (媒體, 秒數, 區域組合, 預算)；calc_idx / disp_idx 以 pad_region() 補位
+    L = len(mid)
+    cf_id = P.media_ids[CF_MEDIA]
+    pad = pad_region(P)
+    nat_r = P.region_ids["全省"]
+
+    # 本批用到的秒數欄位 (不在價格表裡的秒數，係數 = 1.0)
+    secs = np.unique(sec_v).tolist()
+    col_of = {s: k for k, s in enumerate(secs)}
+    sec_col = np.asarray([col_of[s] for s in sec_v.tolist()], dtype=np.int64)
+    def table(unit, base):
+        zero = np.zeros((unit.shape[0], 1, len(secs)))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cols = [unit[:, :, P.sec_ids[s]] if s in P.sec_ids else (base / P.rate_std) * 1.0 for s in secs]
+            t = np.concatenate([np.stack(cols, axis=2) if cols else zero[:, :0], zero], axis=1)
+        return np.nan_to_num(t, nan=0.0, posinf=0.0, neginf=0.0)
+    UN = table(P.unit_nets, P.net_prices)
+    UL = table(P.unit_lists, P.list_prices)
+
+    # ---------- 檔次與懲罰 ----------
+    unit_net = np.zeros(L)
+    for k in range(calc_idx.shape[1]):  # 與單筆版相同的逐區累加順序
+        unit_net = unit_net + UN[mid, calc_idx[:, k], sec_col]
+    std_spots = np.where(is_cf, P.std_table[cf_id, P.region_ids[CF_HYPER]], P.media_std[mid])
+
+    valid = (s_budget > 0) & (unit_net != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spots_init = np.where(valid, np.ceil(s_budget / unit_net), 0)
+        under = valid & (spots_init < std_spots)
+        penalty = np.where(under, 1.1, 1.0)
+        spots = np.where(valid, np.ceil(s_budget / (unit_net * penalty)), 0).astype(np.int64)
+    spots = spots + spots % 2
+    spots = np.where(valid & ~is_cf & (spots == 0), 2, spots)
+
+    # ---------- List 總價 ----------
+    nat_pkg = np.trunc(UL[mid, nat_r, sec_col] * penalty).astype(np.int64) * spots
+    region_rates = np.trunc(UL[mid[:, None], disp_idx, sec_col[:, None]] * penalty[:, None]).astype(np.int64) * spots[:, None]
+    cf_rate = np.trunc(UL[mid, P.region_ids[CF_HYPER], sec_col] * penalty).astype(np.int64) * spots
+    line_list = np.where(is_cf, cf_rate, np.where(nat, nat_pkg, region_rates.sum(axis=1)))
+    line_list = np.where(valid, line_list, 0)
+
+    super_ratio = P.std_table[cf_id, P.region_ids[CF_SUPER]] / P.std_table[cf_id, P.region_ids[CF_HYPER]]
+    spots_super = np.where(is_cf, np.trunc(spots * super_ratio), 0).astype(np.int64)
+
+    # ---------- 總檔次 / 店數加權觸及 ----------
+    W = store_weights(P)
+    n_rows = np.where(is_cf, 2, (disp_idx != pad).sum(axis=1))
+    line_spots = np.where(valid, np.where(is_cf, spots + spots_super, spots * n_rows), 0)
+    reach_w = W[mid[:, None], disp_idx].sum(axis=1)
+    line_reach = np.where(valid, np.where(is_cf, spots * W[cf_id, pad + 1] + spots_super * W[cf_id, pad + 2], spots * reach_w), 0)
+
+    return dict(
+        media_id=mid, seconds=sec_v, national=nat, is_cf=is_cf, valid=valid, budget=s_budget,
+        unit_net=unit_net, std_spots=std_spots, spots_init=spots_init.astype(np.int64), under=under,
+        penalty=penalty, spots=spots, spots_super=spots_super, line_list=line_list,
+        line_spots=line_spots, line_reach=line_reach,
+    )
+
+def pad_region(P): return len(P.region_ids)
+
+def region_index(P, regions):
+    pad = pad_region(P)
+    return [P.region_ids[r] for r in regions] + [pad] * (MAX_REGIONS - len(regions))
+
+def store_weights(P):
+    # [媒體, 區域] 的播出店數 (program_num)；最後三欄：補位 0、家樂福量販、家樂福超市
+    R = len(P.region_ids)
+    W = np.zeros((len(P.media_ids), R + 3), dtype=np.int64)
+    for m, mi in P.media_ids.items():
+        for r, ri in P.region_ids.items():
+            W[mi, ri] = parse_count_to_int(P.store_count(f"新鮮視_{r}" if m == "新鮮視" else r))
+    W[:, R + 1] = parse_count_to_int(P.store_count("家樂福_量販"))
+    W[:, R + 2] = parse_count_to_int(P.store_count("家樂福_超市"))
+    return W
+
+def evaluate_scenarios(pricing, scenarios, days_count):
+    P = pricing
+    scenarios = list(scenarios)
+
+    # ---------- 攤平成 line ----------
+    lines, flat, line_start = [], [], [0]
+    reg_cache = {}
+    def reg_idx(regs):
+        key = tuple(regs)
+        if key not in reg_cache: reg_cache[key] = region_index(P, regs)
+        return reg_cache[key]
+    for i, (cfg_all, total_budget) in enumerate(scenarios):
+        for m, cfg in cfg_all.items():
+            national = bool(cfg.get("is_national", False))
+            if m == CF_MEDIA: disp, calc = [], [CF_HYPER]
+            else:
+                disp = REGIONS_ORDER if national else list(cfg["regions"])
+                calc = ["全省"] if national else disp
+            m_id, cf, ci, di = P.media_ids[m], m == CF_MEDIA, reg_idx(calc), reg_idx(disp)
+            for sec, sec_pct in cfg["sec_shares"].items():
+                lines.append((m, sec, disp, national))
+                flat.append((i, m_id, sec, total_budget, cfg["share"], sec_pct, national, cf, ci, di))
+        line_start.append(len(lines))
+
+    L = len(lines)
+    scn, mid, sec_v, budget_total, share, pct, nat, is_cf, calc_idx, disp_idx = zip(*flat) if flat else ([],) * 10
+    scn = np.asarray(scn, dtype=np.int64)
+    s_budget = line_budget(np.asarray(budget_total, dtype=np.float64), np.asarray(share, dtype=np.float64), np.asarray(pct, dtype=np.float64))
+    out = evaluate_lines(
+        P, np.asarray(mid, dtype=np.int64), np.asarray(sec_v, dtype=np.int64), s_budget,
+        np.asarray(nat, dtype=bool), np.asarray(is_cf, dtype=bool),
+        np.asarray(calc_idx, dtype=np.int64).reshape(L, MAX_REGIONS), np.asarray(disp_idx, dtype=np.int64).reshape(L, MAX_REGIONS),
+    )
+    valid = out["valid"]
+    N = len(scenarios)
+    total_list = np.zeros(N, dtype=np.int64)
+    total_spots = np.zeros(N, dtype=np.int64)
+    np.add.at(total_list, scn[valid], out["line_list"][valid])
+    np.add.at(total_spots, scn[valid], out["line_spots"][valid])
+
+    arrays = dict(out, line_start=np.asarray(line_start), scn=scn, total_list=total_list, total_spots=total_spots)
+    return ScenarioResults(P, scenarios, days_count, lines, arrays)
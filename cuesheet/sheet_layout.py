@@ -0,0 +1,128 @@
+from copy import copy
+from openpyxl.utils import get_column_letter, range_boundaries
+from openpyxl.worksheet.cell_range import MultiCellRange
+
+# =========================================================
+# 區塊列配置 (一次性重排)
+# 每個媒體區塊 = 樣式來源列 (anchor 下一列) 到下一個 anchor / Total 之前。
+# 先算出所有區塊最後各要幾列，得到「樣板列號 → 最終列號」的對照，
+# 再一次搬好儲存格、合併範圍、列高，新增的列直接共用來源列的 style ID
+# (不逐格 copy Font / Border / Fill)。列印範圍、設定格式化條件、資料驗證與圖片的位置也照同一份對照換列號，
+# 否則區塊變長時列印範圍會切掉後面的列、格式化條件只套到原本那幾列。
+# 不再逐區塊 delete_rows / insert_rows：openpyxl 的那兩個動作只搬儲存格，
+# 不搬合併範圍與列高，多個區塊一起增減列時版面會錯位。
+# 這裡直接改 openpyxl 的內部結構 (ws._cells、cell._style、merged_cells)，requirements.txt 因此固定 openpyxl 版本；
+# 升級前先跑 python -m benchmarks.fidelity 確認版面。
+# =========================================================
+class SectionLayout:
+    def __init__(self, sections):
+        # sections: [(樣式來源列, 區塊最後一列, 需要的資料列數)]，皆為樣板原始列號
+        self.sections = []
+        for src, end, needed in sorted(sections):
+            keep = max(needed, 1)
+            self.sections.append((src, max(src, end), keep, keep - 1 - max(0, end - src)))
+
+    def row(self, r):
+        # 樣板列 r 的最終列號；被刪掉的列回傳 None
+        shift = 0
+        for src, end, _, delta in self.sections:
+            if r <= src: break
+            if r <= end: return None
+            shift += delta
+        return r + shift
+
+    def _map_range(self, lo, hi):
+        # 合併範圍的新列號；被刪掉的頭尾列往內縮，跨過來源列的範圍會包含新增的列
+        orig_hi = hi
+        while lo <= hi and self.row(lo) is None: lo += 1
+        while hi >= lo and self.row(hi) is None: hi -= 1
+        if lo > hi: return None
+        last = self.row(hi)
+        for src, _, keep, _ in self.sections:
+            if hi == src < orig_hi: last += keep - 1
+        return self.row(lo), last
+
+    def apply(self, ws):
+        if all(delta == 0 and keep == 1 for _, _, keep, delta in self.sections): return
+
+        # 合併範圍：先算新位置 (列數不變且沒有刪列的只平移，其餘在儲存格搬完後重新 merge)
+        expand = {src: keep for src, _, keep, _ in self.sections if keep > 1}
+        shifted, remerge, row_merges = [], [], []
+        for mr in list(ws.merged_cells.ranges):
+            ws.merged_cells.remove(mr)
+            if mr.min_row == mr.max_row and mr.min_row in expand: row_merges.append((mr.min_row, mr.min_col, mr.max_col))
+            new = self._map_range(mr.min_row, mr.max_row)
+            if new is None: continue
+            kept = all(self.row(r) is not None for r in range(mr.min_row, mr.max_row + 1))
+            if kept and new[1] - new[0] == mr.max_row - mr.min_row: shifted.append((mr, new[0] - mr.min_row))
+            else: remerge.append((new[0], mr.min_col, new[1], mr.max_col))
+
+        # 儲存格一次搬到最終列號
+        cells = {}
+        for (r, c), cell in ws._cells.items():
+            nr = self.row(r)
+            if nr is None: continue
+            cell.row = nr
+            cells[nr, c] = cell
+        ws._cells = cells
+
+        dims = list(ws.row_dimensions.items())
+        ws.row_dimensions.clear()
+        for r, dim in dims:
+            nr = self.row(r)
+            if nr is None: continue
+            dim.index = nr
+            ws.row_dimensions[nr] = dim
+
+        # 新增的列：共用來源列的 style ID 與列高
+        for src, _, keep, _ in self.sections:
+            if keep == 1: continue
+            first = self.row(src)
+            styled = [(c, cell._style) for (r, c), cell in cells.items() if r == first and cell.has_style]
+            height = ws.row_dimensions[first].height
+            for nr in range(first + 1, first + keep):
+                ws.row_dimensions[nr].height = height
+                for c, style in styled: ws.cell(nr, c)._style = copy(style)
+
+        for mr, offset in shifted:
+            mr.shift(row_shift=offset)
+            ws.merged_cells.add(mr)
+        for r1, c1, r2, c2 in remerge:
+            ws.merge_cells(start_row=r1, start_column=c1, end_row=r2, end_column=c2)
+        # 來源列上的橫向合併，新增的列也比照
+        for src, c1, c2 in row_merges:
+            first = self.row(src)
+            for nr in range(first + 1, first + expand[src]):
+                ws.merge_cells(start_row=nr, start_column=c1, end_row=nr, end_column=c2)
+        self._move_ranges(ws)
+
+    def _ranges(self, refs):
+        # 範圍字串 ("B1:AH20 G9:AK11"，可帶 $ 與工作表名) 逐一換列號；整段被刪掉的拿掉
+        out = []
+        for ref in refs:
+            c1, r1, c2, r2 = range_boundaries(ref.split("!")[-1].replace("$", ""))
+            new = self._map_range(r1, r2)
+            if new: out.append(f"{get_column_letter(c1)}{new[0]}:{get_column_letter(c2)}{new[1]}")
+        return out
+
+    def _move_ranges(self, ws):
+        from openpyxl.formatting.formatting import ConditionalFormattingList
+        if ws.print_area: ws.print_area = self._ranges(ws.print_area.split(",")) or None
+        old, ws.conditional_formatting = ws.conditional_formatting, ConditionalFormattingList()
+        for cf in old:
+            rng = " ".join(self._ranges(str(cf.sqref).split()))
+            if not rng: continue
+            for rule in cf.rules: ws.conditional_formatting.add(rng, rule)
+        for dv in list(ws.data_validations.dataValidation):
+            rng = " ".join(self._ranges(str(dv.sqref).split()))
+            if rng: dv.sqref = MultiCellRange(rng)
+            else: ws.data_validations.dataValidation.remove(dv)
+        # 圖片錨點 (0 起算)：被刪掉的列就留在原位
+        for img in ws._images:
+            marker = getattr(img.anchor, "_from", None)
+            if marker is None: continue
+            nr = self.row(marker.row + 1)
+            if nr is None: continue
+            to = getattr(img.anchor, "to", None)
+            if to is not None: to.row += nr - 1 - marker.row
+            marker.row = nr - 1
@@ -0,0 +1,41 @@
+from .paging import MAX_DAYS
+
+# =========================================================
+# 東吳 / 聲活 格式定義 (不依賴 openpyxl)
+# 樣板渲染 (excel_render) 與串流輸出 (excel_stream) 共用同一份欄位 / 儲存格位置。
+# 金額欄 (MONEY_COLS：單價 / 總價，含全省聯播跨列的合併總價) 與 Total 金額、製作 / VAT / Grand Total 一樣是整個走期的，
+# 長走期分成多張工作表 (PDF 多頁) 時只寫在最後一張；前面各張只有排程與檔次，金額欄留白 (版面、合併照舊)。
+# 不按頁攤提：攤提後的各頁金額相加會因取整與合約總價對不上，各張也不必各自再算 Total / VAT。
+# HTML 預覽與原生 PDF 照同一規則。
+# =========================================================
+MONEY_COLS = ("rate", "pkg")
+
+SHEET_META = {
+    "Dongwu": {
+        "sheet_name": "Sheet1", 
+        "date_start_cell": "I7", "schedule_start_col": "I", "max_days": MAX_DAYS["Dongwu"], "total_col": "AN",
+        "anchors": {"全家廣播": "通路廣播廣告", "新鮮視": "新鮮視廣告", "家樂福": "家樂福"},
+        "cols": {"station": "B", "location": "C", "program": "D", "daypart": "E", "seconds": "F", "rate": "G", "pkg": "H"},
+        "header_cells": {"client": "C3", "product": "C4", "period": "C5", "medium": "C6", "month": "I6"},
+        "header_override": {"G7": "rate\n(Net)", "H7": "Package-cost\n(Net)"},
+        "station_merge": True, "total_label": "Total",
+        "footer_labels": {"make": "製作", "vat": "5% VAT", "grand": "Grand Total"},
+        "force_center_cols": ["E", "F", "G", "H"], 
+    },
+    "Shenghuo": {
+        "sheet_name": "Sheet1",
+        "date_start_cell": "G7", "schedule_start_col": "G", "max_days": MAX_DAYS["Shenghuo"], "total_col": "AD",
+        "anchors": {"全家廣播": "廣播通路廣告", "新鮮視": "新鮮視廣告", "家樂福": "家樂福"},
+        "cols": {"station": "B", "location": "C", "program": "D", "daypart": "E", "seconds": "F", "pkg": "AF"},
+        "header_cells": {"client": "C5", "product": "C6", "month": "G6"},
+        "station_merge": False, "total_label": "Total",
+        "footer_labels": {"make": "製作", "vat": "5% VAT", "grand": "Grand Total"},
+        "force_center_cols": [],
+    }
+}
+
+def station_title(m, format_type):
+    prefix = "全家便利商店\n" if m != "家樂福" else ""
+    name = "通路廣播廣告" if m == "全家廣播" else "新鮮視廣告" if m == "新鮮視" else "家樂福"
+    if format_type == "Shenghuo" and m == "全家廣播": name = "廣播通路廣告"
+    return prefix + name
@@ -0,0 +1,230 @@
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import queue
+import pathlib
+import xmlrpc.client
+from .metrics import span
+
+# =========================================================
+# LibreOffice 常駐轉檔池
+# 每個 worker 是一個常駐的 unoserver (XML-RPC) + soffice，
+# 各自使用獨立的 user profile，避免多人同時轉檔互相搶 profile。
+# 若環境中沒有 uno / unoserver，退回「每個 worker 獨立 profile 的單次 soffice」。
+# =========================================================
+def find_soffice_path():
+    soffice = shutil.which("soffice") or shutil.which("libreoffice")
+    if soffice: return soffice
+    if os.name == "nt":
+        candidates = [
+            r"C:\Program Files\LibreOffice\program\soffice.exe",
+            r"C:\Program Files (x86)\LibreOffice\program\soffice.exe",
+        ]
+        for p in candidates:
+            if os.path.exists(p): return p
+    return None
+
+def find_uno_python():
+    # unoserver 必須跑在能 import uno 的 Python (通常是系統 python3 + python3-uno)
+    candidates = [os.environ.get("CUE_UNO_PYTHON"), "/usr/bin/python3", shutil.which("python3")]
+    for py in candidates:
+        if not py or not os.path.exists(py): continue
+        try:
+            r = subprocess.run([py, "-c", "import uno, unoserver"], capture_output=True, timeout=15)
+            if r.returncode == 0: return py
+        except Exception: pass
+    return None
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _port_open(port, timeout=0.5):
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=timeout): return True
+    except OSError: return False
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout):
+        super().__init__()
+        self._timeout = timeout
+
+    def make_connection(self, host):
+        conn = super().make_connection(host)
+        conn.timeout = self._timeout
+        return conn
+
+class _Worker:
+    def __init__(self, idx, soffice, uno_python, start_timeout):
+        self.idx = idx
+        self.soffice = soffice
+        self.uno_python = uno_python
+        self.start_timeout = start_timeout
+        self.lock = threading.Lock()
+        self.proc = None
+        self.port = None
+        self.ready = False
+        self.restarts = 0
+        self.jobs = 0
+        self.profile_dir = tempfile.mkdtemp(prefix=f"cue_lo_{idx}_")
+
+    @property
+    def resident(self): return bool(self.uno_python)
+
+    def start(self):
+        # 只負責啟動行程，不等待就緒；第一次轉檔前才 _wait_ready()
+        self.ready = False
+        if not self.resident: return
+        self.port = _free_port()
+        cmd = [
+            self.uno_python, "-m", "unoserver.server",
+            "--interface", "127.0.0.1", "--port", str(self.port), "--uno-port", str(_free_port()),
+            "--executable", self.soffice,
+            "--user-installation", pathlib.Path(self.profile_dir).as_uri(),
+        ]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+    def stop(self):
+        self.ready = False
+        if self.proc is None: return
+        try:
+            if self.proc.poll() is None:
+                if os.name == "nt": self.proc.kill()
+                else: os.killpg(self.proc.pid, signal.SIGKILL)
+            self.proc.wait(timeout=5)
+        except Exception: pass
+        self.proc = None
+
+    def restart(self):
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def healthy(self):
+        if not self.resident: return True
+        if self.proc is None or self.proc.poll() is not None: return False
+        return (not self.ready) or _port_open(self.port)
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + self.start_timeout
+        while time.monotonic() < deadline:
+            if self.proc is None or self.proc.poll() is not None: raise RuntimeError("unoserver 啟動失敗")
+            if _port_open(self.port):
+                self.ready = True
+                return
+            time.sleep(0.2)
+        raise TimeoutError("unoserver 啟動逾時")
+
+    def convert(self, xlsx_bytes, timeout):
+        self.jobs += 1
+        if not self.resident: return self._convert_oneshot(xlsx_bytes, timeout)
+        if not self.ready: self._wait_ready()
+        proxy = xmlrpc.client.ServerProxy(f"http://127.0.0.1:{self.port}", transport=_TimeoutTransport(timeout), allow_none=True)
+        result = proxy.convert(None, xmlrpc.client.Binary(xlsx_bytes), None, "pdf")
+        return result.data if result is not None else None
+
+    def _convert_oneshot(self, xlsx_bytes, timeout):
+        with tempfile.TemporaryDirectory() as tmp:
+            xlsx_path = os.path.join(tmp, "cue.xlsx")
+            with open(xlsx_path, "wb") as f: f.write(xlsx_bytes)
+            profile = f"-env:UserInstallation={pathlib.Path(self.profile_dir).as_uri()}"
+            subprocess.run([self.soffice, profile, "--headless", "--nologo", "--convert-to", "pdf", "--outdir", tmp, xlsx_path], capture_output=True, timeout=timeout)
+
+            pdf_path = os.path.join(tmp, "cue.pdf")
+            if not os.path.exists(pdf_path):
+                for fn in os.listdir(tmp):
+                    if fn.endswith(".pdf"): pdf_path = os.path.join(tmp, fn); break
+            if os.path.exists(pdf_path):
+                with open(pdf_path, "rb") as f: return f.read()
+            return None
+
+class SofficePool:
+    def __init__(self, size=2, job_timeout=60, start_timeout=30, health_interval=30, soffice=None, uno_python=None):
+        self.size = max(1, int(size))
+        self.job_timeout = job_timeout
+        self.health_interval = health_interval
+        self.soffice = soffice or find_soffice_path()
+        self._idle = queue.Queue()
+        self._workers = []
+        self._closed = threading.Event()
+        self.mode = "none"
+        if not self.soffice: return
+
+        if uno_python is None: uno_python = find_uno_python()
+        self.mode = "resident" if uno_python else "oneshot"
+        for i in range(self.size):
+            w = _Worker(i, self.soffice, uno_python, start_timeout)
+            w.start()
+            self._workers.append(w)
+            self._idle.put(w)
+
+        if self.mode == "resident" and health_interval:
+            threading.Thread(target=self._monitor, name="soffice-pool-monitor", daemon=True).start()
+
+    def convert(self, xlsx_bytes, timeout=None):
+        with span("pdf.soffice") as sp:
+            pdf, method, err = self._convert(xlsx_bytes, timeout)
+            if not pdf: sp["status"] = "fail"
+            return pdf, method, err
+
+    def _convert(self, xlsx_bytes, timeout=None):
+        if not self.soffice: return None, "Fail", "無可用的 LibreOffice 引擎"
+        if self._closed.is_set(): return None, "Fail", "轉檔池已關閉"
+        timeout = timeout or self.job_timeout
+        try: w = self._idle.get(timeout=timeout)
+        except queue.Empty: return None, "Fail", f"轉檔排隊逾時 ({timeout}s)"
+
+        try:
+            with w.lock:
+                if not w.healthy(): w.restart()
+                try:
+                    pdf = w.convert(xlsx_bytes, timeout)
+                except (socket.timeout, TimeoutError, subprocess.TimeoutExpired):
+                    w.restart()
+                    return None, "Fail", f"LibreOffice 轉檔逾時 ({timeout}s)"
+                except (OSError, RuntimeError) as e:
+                    w.restart()
+                    return None, "Fail", str(e)
+                except Exception as e:
+                    return None, "Fail", str(e)
+            if pdf: return pdf, "LibreOffice", ""
+            return None, "Fail", "LibreOffice 轉檔無輸出"
+        finally:
+            self._idle.put(w)
+
+    def health_check(self):
+        # 只檢查閒置中的 worker；忙碌中的 worker 由 convert() 的逾時處理
+        restarted = 0
+        for w in self._workers:
+            if not w.lock.acquire(blocking=False): continue
+            try:
+                if not w.healthy():
+                    w.restart()
+                    restarted += 1
+            finally:
+                w.lock.release()
+        return restarted
+
+    def _monitor(self):
+        while not self._closed.wait(self.health_interval):
+            try: self.health_check()
+            except Exception: pass
+
+    def stats(self):
+        return {
+            "mode": self.mode, "size": len(self._workers), "idle": self._idle.qsize(),
+            "jobs": sum(w.jobs for w in self._workers),
+            "restarts": sum(w.restarts for w in self._workers),
+        }
+
+    def close(self):
+        self._closed.set()
+        for w in self._workers:
+            w.stop()
+            shutil.rmtree(w.profile_dir, ignore_errors=True)
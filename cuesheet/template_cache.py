@@ -0,0 +1,110 @@
+import io
+import pickle
+import copyreg
+import hashlib
+import threading
+from collections import OrderedDict
+
+# =========================================================
+# 樣板預編譯快取
+# 同一份樣板 (SHA-256) 只解析一次：記下 anchors / Total / 頁尾 / Remarks 所在列，
+# 並把解析好的 workbook 存成 pickle。每次渲染 pickle.loads 出一份新的 workbook
+# (比 load_workbook 重新解 XML 快很多)，也不必再逐列掃 B 欄找關鍵字。
+# =========================================================
+# openpyxl 的 BoundDictionary / DimensionHolder (row_dimensions / column_dimensions) 繼承 defaultdict，
+# 預設的 pickle 還原時會把 default_factory 塞進 reference，這裡補上正確的還原方式
+# (openpyxl 到第一次編譯樣板才載入，TemplateCache 本身可以很早建立)
+# pickle 整本 Workbook 依賴 openpyxl 的內部結構，requirements.txt 因此固定 openpyxl 版本 (升級前先跑 benchmarks.fidelity)
+def _new_bound_dictionary(cls, factory):
+    d = cls.__new__(cls)
+    d.default_factory = factory
+    return d
+
+def _reduce_bound_dictionary(d):
+    return _new_bound_dictionary, (type(d), d.default_factory), d.__dict__, None, iter(d.items())
+
+def _load_openpyxl():
+    import openpyxl
+    from openpyxl.utils.bound_dictionary import BoundDictionary
+    from openpyxl.worksheet.dimensions import DimensionHolder
+    for cls in (BoundDictionary, DimensionHolder): copyreg.pickle(cls, _reduce_bound_dictionary)
+    return openpyxl
+
+FOOTER_COL = "B"
+REMARKS_LABEL = "Remarks："
+
+def template_digest(template_bytes):
+    return hashlib.sha256(template_bytes).hexdigest()
+
+def _first_rows(ws, col_letter, keywords):
+    # 放寬搜尋 (包含關鍵字即可)；一次掃過整欄，記下每個關鍵字第一次出現的列
+    from openpyxl.utils import column_index_from_string
+    col_idx = column_index_from_string(col_letter)
+    found = {}
+    for r in range(1, ws.max_row + 1):
+        v = ws.cell(r, col_idx).value
+        if not isinstance(v, str): continue
+        for key, kw in keywords.items():
+            if key not in found and kw in v: found[key] = r
+        if len(found) == len(keywords): break
+    return found
+
+class TemplatePlan:
+    def __init__(self, digest, format_type, blob, anchors, total_row, footer_rows, remarks_row):
+        self.digest = digest
+        self.format_type = format_type
+        self._blob = blob
+        self.anchors = anchors          # {媒體: 原始列}
+        self.total_row = total_row
+        self.footer_rows = footer_rows  # {"make" / "vat" / "grand": 原始列}
+        self.remarks_row = remarks_row
+
+    @classmethod
+    def compile(cls, format_type, template_bytes, meta):
+        openpyxl = _load_openpyxl()
+        wb = openpyxl.load_workbook(io.BytesIO(template_bytes))
+        ws = wb[wb.sheetnames[0]]
+        station = meta["cols"]["station"]
+        found = _first_rows(ws, station, {"__total__": meta["total_label"], **meta["anchors"]})
+        if "__total__" not in found:
+            return None, f"樣板中找不到 '{meta['total_label']}' 關鍵字列 (請檢查B欄)"
+        total_row = found.pop("__total__")
+        footer = _first_rows(ws, FOOTER_COL, {**meta["footer_labels"], "__remarks__": REMARKS_LABEL})
+        remarks_row = footer.pop("__remarks__", None)
+        blob = pickle.dumps(wb, protocol=pickle.HIGHEST_PROTOCOL)
+        return cls(template_digest(template_bytes), format_type, blob, found, total_row, footer, remarks_row), None
+
+    def workbook(self):
+        # 每次渲染都拿一份全新的 workbook，快取裡的原件不會被改到
+        return pickle.loads(self._blob)
+
+    @property
+    def nbytes(self): return len(self._blob)
+
+class TemplateCache:
+    def __init__(self, max_items=16):
+        self.max_items = max_items
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, format_type, template_bytes, meta):
+        key = (template_digest(template_bytes), format_type)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return plan, None
+            self.misses += 1
+        plan, err = TemplatePlan.compile(format_type, template_bytes, meta)
+        if err: return None, err
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > self.max_items: self._plans.popitem(last=False)
+        return plan, None
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "items": len(self._plans), "bytes": sum(p.nbytes for p in self._plans.values())}